@@ -0,0 +1,28 @@
+frappe.ui.form.on("Agas Campaign", {
+    refresh(frm) {
+        if (frm.is_new()) return;
+
+        const run = (method, args = {}) => {
+            frappe.call({
+                method: `agas.campaigns.${method}`,
+                args: { campaign: frm.doc.name, ...args },
+                freeze: true,
+                callback: () => frm.reload_doc(),
+            });
+        };
+
+        if (frm.doc.status === "Draft") {
+            frm.add_custom_button("Start Sending", () => {
+                frappe.confirm(`Send this ${frm.doc.channel} to every registrant of ${frm.doc.event}?`,
+                    () => run("start_campaign"));
+            }).addClass("btn-primary");
+        }
+        if (frm.doc.status === "Sending") {
+            frm.add_custom_button("Pause", () => run("pause_campaign"));
+            frm.add_custom_button("Refresh Progress", () => frm.reload_doc());
+        }
+        if (["Paused", "Completed"].includes(frm.doc.status)) {
+            frm.add_custom_button("Resume", () => run("resume_campaign"));
+        }
+    },
+});
@@ -0,0 +1,7 @@
+import frappe
+from frappe.model.document import Document
+
+class AgasCampaign(Document):
+	def validate(self):
+		if self.status != "Draft" and self.has_value_changed("message"):
+			frappe.throw("The message cannot be changed once the campaign has started", frappe.ValidationError)
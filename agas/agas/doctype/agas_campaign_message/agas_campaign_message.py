@@ -0,0 +1,8 @@
+import frappe
+from frappe.model.document import Document
+
+class AgasCampaignMessage(Document):
+	pass
+
+def on_doctype_update():
+	frappe.db.add_index("Agas Campaign Message", ["campaign", "status"])
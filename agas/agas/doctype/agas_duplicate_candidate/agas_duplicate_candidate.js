@@ -0,0 +1,28 @@
+frappe.ui.form.on("Agas Duplicate Candidate", {
+    refresh(frm) {
+        if (frm.is_new() || frm.doc.status !== "Open") return;
+
+        const run = (method, args = {}) => {
+            frappe.call({
+                method: `agas.dedupe.${method}`,
+                args: { candidate: frm.doc.name, ...args },
+                freeze: true,
+                callback: () => frm.reload_doc(),
+            });
+        };
+        const merge = (keep, kept_name, merged_name) => {
+            frappe.confirm(`Merge ${merged_name} into ${kept_name}? The merged family member is deleted.`,
+                () => run("merge_duplicate", { keep }));
+        };
+
+        if (frm.doc.person_b_doctype === "Family Member") {
+            frm.add_custom_button(`Keep ${frm.doc.person_a_name}`,
+                () => merge("a", frm.doc.person_a_name, frm.doc.person_b_name), "Merge");
+        }
+        if (frm.doc.person_a_doctype === "Family Member") {
+            frm.add_custom_button(`Keep ${frm.doc.person_b_name}`,
+                () => merge("b", frm.doc.person_b_name, frm.doc.person_a_name), "Merge");
+        }
+        frm.add_custom_button("Not a Duplicate", () => run("dismiss_duplicate"));
+    },
+});
@@ -0,0 +1,9 @@
+import frappe
+from frappe.model.document import Document
+
+class AgasDuplicateCandidate(Document):
+	pass
+
+def on_doctype_update():
+	# A pair is queued once; later passes skip it whatever its status
+	frappe.db.add_unique("Agas Duplicate Candidate", ["pair_key"], constraint_name="unique_pair_key")
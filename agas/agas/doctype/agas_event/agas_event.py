@@ -1,5 +1,12 @@
 import frappe
 from frappe.model.document import Document
+from frappe.utils.html_utils import sanitize_html
+
+from agas.event_page import make_image_variants
 
 class AgasEvent(Document):
-	pass
+	def validate(self):
+		# Sanitized once here; the event page renders content_html as is
+		self.content_html = sanitize_html(self.content or "", linkify=True)
+		if self.has_value_changed("image"):
+			self.image_variants = frappe.as_json(make_image_variants(self.image)) if self.image else None
@@ -0,0 +1,9 @@
+import frappe
+from frappe.model.document import Document
+
+class AgasEventSearchTerm(Document):
+	pass
+
+def on_doctype_update():
+	# Searches are IN lookups or prefix scans on term, joined back to the event
+	frappe.db.add_index("Agas Event Search Term", ["term", "event"])
@@ -0,0 +1,10 @@
+import frappe
+from frappe.model.document import Document
+
+class AgasRegistrationRollup(Document):
+	pass
+
+def on_doctype_update():
+	# One row per key; agas.analytics upserts into it
+	frappe.db.add_unique("Agas Registration Rollup", ["day", "event", "status", "dimension", "value"],
+		constraint_name="unique_rollup_key")
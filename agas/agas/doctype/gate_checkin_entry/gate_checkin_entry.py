@@ -0,0 +1,8 @@
+import frappe
+from frappe.model.document import Document
+
+class GateCheckinEntry(Document):
+	pass
+
+def on_doctype_update():
+	frappe.db.add_index("Gate Checkin Entry", ["event", "checked_in"])
@@ -0,0 +1,9 @@
+import frappe
+from frappe.model.document import Document
+
+class GateSearchToken(Document):
+	pass
+
+def on_doctype_update():
+	# Searches are always scoped to one event and are prefix scans or IN lookups on token
+	frappe.db.add_index("Gate Search Token", ["event", "token"])
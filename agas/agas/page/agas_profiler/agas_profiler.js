@@ -0,0 +1,176 @@
+frappe.pages["agas-profiler"].on_page_load = function (wrapper) {
+    const page = frappe.ui.make_app_page({
+        parent: wrapper,
+        title: "Request Profiles",
+        single_column: true,
+    });
+
+    const state = { captures: [], selected: [] };
+
+    const routeField = page.add_field({
+        fieldname: "route",
+        label: "Route",
+        fieldtype: "Data",
+        change: () => loadCaptures(),
+    });
+    page.set_primary_action("Diff Selected", () => diffSelected());
+    page.set_secondary_action("Refresh", () => loadCaptures());
+
+    const $body = $(`
+        <div class="agas-profiler">
+            <div class="capture-list"></div>
+            <div class="capture-detail" style="margin-top: 2rem;"></div>
+        </div>
+    `).appendTo(page.body);
+
+    function loadCaptures() {
+        frappe.call({
+            method: "agas.profiler.get_captures",
+            args: { route: routeField.get_value() || null },
+            callback: (r) => {
+                state.captures = r.message || [];
+                state.selected = [];
+                renderList();
+            },
+        });
+    }
+
+    function renderList() {
+        if (!state.captures.length) {
+            $body.find(".capture-list").html(`<p class="text-muted">No captures recorded yet.</p>`);
+            return;
+        }
+        $body.find(".capture-list").html(`
+            <table class="table table-bordered table-hover">
+                <thead>
+                    <tr>
+                        <th style="width: 2rem;"></th>
+                        <th>Route</th>
+                        <th>User</th>
+                        <th>Duration (ms)</th>
+                        <th>Trigger</th>
+                        <th>Samples</th>
+                        <th>Captured</th>
+                    </tr>
+                </thead>
+                <tbody>
+                    ${state.captures.map((c) => `
+                        <tr data-name="${c.name}" style="cursor: pointer;">
+                            <td><input type="checkbox" class="capture-select" data-name="${c.name}"></td>
+                            <td>${frappe.utils.escape_html(c.http_method || "")} ${frappe.utils.escape_html(c.route)}</td>
+                            <td>${frappe.utils.escape_html(c.user || "")}</td>
+                            <td>${format_number(c.duration_ms, null, 1)}</td>
+                            <td>${c.trigger}</td>
+                            <td>${c.sample_count}</td>
+                            <td>${frappe.datetime.comment_when(c.creation)}</td>
+                        </tr>
+                    `).join("")}
+                </tbody>
+            </table>
+        `);
+
+        $body.find(".capture-select").on("click", (e) => {
+            e.stopPropagation();
+            const name = e.currentTarget.dataset.name;
+            state.selected = e.currentTarget.checked
+                ? [...state.selected, name].slice(-2)
+                : state.selected.filter((n) => n !== name);
+            $body.find(".capture-select").each((_, el) => {
+                el.checked = state.selected.includes(el.dataset.name);
+            });
+        });
+        $body.find("tbody tr").on("click", (e) => showCapture(e.currentTarget.dataset.name));
+    }
+
+    function showCapture(name) {
+        frappe.call({
+            method: "agas.profiler.get_capture",
+            args: { name },
+            callback: (r) => renderFlamegraph(r.message),
+        });
+    }
+
+    // Icicle view: root frames on top, each child's width proportional to its samples
+    function renderFlamegraph(capture) {
+        const root = { name: "all", value: 0, children: {} };
+        Object.entries(capture.stacks).forEach(([stack, count]) => {
+            root.value += count;
+            let node = root;
+            stack.split(";").forEach((frame) => {
+                node.children[frame] = node.children[frame] || { name: frame, value: 0, children: {} };
+                node = node.children[frame];
+                node.value += count;
+            });
+        });
+
+        const rows = [];
+        const walk = (node, depth, offset) => {
+            rows[depth] = rows[depth] || [];
+            rows[depth].push({ node, offset });
+            let childOffset = offset;
+            Object.values(node.children)
+                .sort((a, b) => b.value - a.value)
+                .forEach((child) => {
+                    walk(child, depth + 1, childOffset);
+                    childOffset += child.value;
+                });
+        };
+        walk(root, 0, 0);
+
+        const total = root.value || 1;
+        const html = rows.map((row) => `
+            <div style="position: relative; height: 20px;">
+                ${row
+                    .filter(({ node }) => node.value / total >= 0.005)
+                    .map(({ node, offset }) => `
+                        <div title="${frappe.utils.escape_html(node.name)} (${node.value} samples, ${((node.value * 100) / total).toFixed(1)}%)"
+                            style="position: absolute; left: ${(offset * 100) / total}%; width: ${(node.value * 100) / total}%;
+                                height: 19px; overflow: hidden; white-space: nowrap; font-size: 11px; padding: 1px 3px;
+                                background: hsl(${20 + (node.name.length * 7) % 30}, 80%, ${60 + (node.name.length % 20)}%);
+                                border-right: 1px solid #fff;">
+                            ${frappe.utils.escape_html(node.name)}
+                        </div>
+                    `).join("")}
+            </div>
+        `).join("");
+
+        $body.find(".capture-detail").html(`
+            <h4>${frappe.utils.escape_html(capture.route)} &middot; ${format_number(capture.duration_ms, null, 1)} ms &middot; ${capture.sample_count} samples</h4>
+            <div style="border: 1px solid var(--border-color); padding: 4px;">${html}</div>
+        `);
+    }
+
+    function diffSelected() {
+        if (state.selected.length !== 2) {
+            frappe.msgprint("Select exactly two captures to compare.");
+            return;
+        }
+        frappe.call({
+            method: "agas.profiler.diff_captures",
+            args: { base: state.selected[0], compare: state.selected[1] },
+            callback: (r) => {
+                const rows = r.message || [];
+                $body.find(".capture-detail").html(`
+                    <h4>Frame share: ${state.selected[0]} &rarr; ${state.selected[1]}</h4>
+                    <table class="table table-bordered">
+                        <thead><tr><th>Frame</th><th>Base %</th><th>Compare %</th><th>Delta</th></tr></thead>
+                        <tbody>
+                            ${rows.map((row) => `
+                                <tr>
+                                    <td style="font-family: monospace;">${frappe.utils.escape_html(row.frame)}</td>
+                                    <td>${row.base_pct}</td>
+                                    <td>${row.compare_pct}</td>
+                                    <td style="color: ${row.delta_pct > 0 ? "var(--red-500)" : "var(--green-500)"};">
+                                        ${row.delta_pct > 0 ? "+" : ""}${row.delta_pct}
+                                    </td>
+                                </tr>
+                            `).join("")}
+                        </tbody>
+                    </table>
+                `);
+            },
+        });
+    }
+
+    loadCaptures();
+};
@@ -0,0 +1,316 @@
+import json
+from collections import defaultdict
+
+import frappe
+from frappe.utils import cint, getdate, now_datetime
+
+from agas.archive import ARCHIVE_TABLES, archive_exists
+from agas.event_counters import ACTIVE_STATUSES
+
+# Rollup rows are keyed by (day, event, status, dimension, value). "all" has an
+# empty value; city and state count registrations, gender and age band count
+# people (the registrant plus visiting family members).
+REGISTRATION_DIMENSIONS = ("all", "city", "state")
+PEOPLE_DIMENSIONS = ("gender", "age_band")
+ROLLUP_FIELDS = ["name", "day", "event", "status", "dimension", "value", "registrations", "attendees",
+	"creation", "modified"]
+
+# Inclusive upper bounds in years
+AGE_BANDS = ((12, "0-12"), (17, "13-17"), (30, "18-30"), (45, "31-45"), (60, "46-60"))
+OLDEST_BAND = "61+"
+UNKNOWN = "Unknown"
+TOP_PLACES = 20  # cities and states returned by the dashboard API
+# rebuild() fills a staging copy and swaps it in. Like the archive tables these
+# have no `tab` prefix, so `bench trim-database` leaves them alone.
+STAGING_TABLE = "agas_registration_rollup_staging"
+RETIRED_TABLE = "agas_registration_rollup_retired"
+INSERT_CHUNK = 1000
+
+@frappe.whitelist()
+def get_registration_analytics(from_date=None, to_date=None, event=None, statuses=None):
+	"""
+	Dashboard figures read only from Agas Registration Rollup: registrations
+	and attendees per day, per event and per status, and attendees by gender,
+	age band, city and state. `statuses` defaults to registrations that take
+	up seats.
+	"""
+	frappe.only_for("System Manager")
+	if isinstance(statuses, str):
+		statuses = json.loads(statuses)
+
+	conditions = ["status in %(statuses)s"]
+	if from_date:
+		conditions.append("day >= %(from_date)s")
+	if to_date:
+		conditions.append("day <= %(to_date)s")
+	if event:
+		conditions.append("event = %(event)s")
+	where = " and ".join(conditions)
+	values = {"statuses": tuple(statuses or ACTIVE_STATUSES), "from_date": from_date, "to_date": to_date,
+		"event": event}
+
+	totals = frappe.db.sql(f"""
+		select day, event, status, sum(registrations) as registrations, sum(attendees) as attendees
+		from `tabAgas Registration Rollup`
+		where dimension = 'all' and {where}
+		group by day, event, status
+	""", values, as_dict=True)
+
+	breakdowns = frappe.db.sql(f"""
+		select dimension, value, sum(registrations) as registrations, sum(attendees) as attendees
+		from `tabAgas Registration Rollup`
+		where dimension != 'all' and {where}
+		group by dimension, value
+	""", values, as_dict=True)
+
+	def summed(rows, key):
+		sums = defaultdict(lambda: [0, 0])
+		for row in rows:
+			sums[row[key]][0] += cint(row.registrations)
+			sums[row[key]][1] += cint(row.attendees)
+		return [{key: name, "registrations": counts[0], "attendees": counts[1]}
+			for name, counts in sums.items() if counts[0] > 0 or counts[1] > 0]
+
+	result = {
+		"per_day": sorted(summed(totals, "day"), key=lambda row: row["day"]),
+		"per_event": sorted(summed(totals, "event"), key=lambda row: row["registrations"], reverse=True),
+		"by_status": summed(totals, "status"),
+	}
+	for dimension in (*PEOPLE_DIMENSIONS, "city", "state"):
+		rows = sorted(summed([row for row in breakdowns if row.dimension == dimension], "value"),
+			key=lambda row: (row["registrations"], row["attendees"]), reverse=True)
+		result[f"by_{dimension}"] = rows[:TOP_PLACES] if dimension in ("city", "state") else rows
+	return result
+
+def age_band(dob, age, on_date):
+	"""
+	Same banding as age_band_sql: years at `on_date` from the date of birth,
+	else the stored age (0 meaning unknown).
+	"""
+	if dob:
+		dob, on_date = getdate(dob), getdate(on_date)
+		years = on_date.year - dob.year - ((on_date.month, on_date.day) < (dob.month, dob.day))
+	else:
+		years = cint(age) or None
+	if years is None:
+		return UNKNOWN
+	for upper, label in AGE_BANDS:
+		if years <= upper:
+			return label
+	return OLDEST_BAND
+
+def age_band_sql(dob, age):
+	years = f"coalesce(timestampdiff(year, {dob}, date(reg.creation)), nullif({age}, 0))"
+	cases = " ".join(f"when {years} <= {upper} then '{label}'" for upper, label in AGE_BANDS)
+	return f"case when {years} is null then '{UNKNOWN}' {cases} else '{OLDEST_BAND}' end"
+
+def text_or_unknown(value):
+	return (value or "").strip() or UNKNOWN
+
+def text_sql(column):
+	return f"coalesce(nullif(trim({column}), ''), '{UNKNOWN}')"
+
+def source_tables(archived=False):
+	if archived:
+		return ARCHIVE_TABLES["tabEvent Registration"], ARCHIVE_TABLES["tabEvent Registration Member"]
+	return "tabEvent Registration", "tabEvent Registration Member"
+
+def grouped_registrations(conditions="1 = 1", values=None, archived=False):
+	"""
+	Registrations and attendees grouped by day, event, status, city and state.
+	`conditions` may refer to `reg` and `ev`, as in event_counters.shift_status.
+	"""
+	registration_table, member_table = source_tables(archived)
+	return frappe.db.sql(f"""
+		select date(reg.creation) as day, reg.event, reg.status,
+			{text_sql("mp.city")} as city, {text_sql("mp.agas_state")} as state,
+			count(*) as registrations, sum(1 + coalesce(members.visiting, 0)) as attendees
+		from `{registration_table}` reg
+		inner join `tabAgas Event` ev on ev.name = reg.event
+		left join `tabMember Profile` mp on mp.user = reg.user
+		left join (
+			select parent, count(*) as visiting
+			from `{member_table}`
+			where parenttype = 'Event Registration' and is_visiting = 1
+			group by parent
+		) members on members.parent = reg.name
+		where {conditions}
+		group by day, reg.event, reg.status, city, state
+	""", values, as_dict=True)
+
+def grouped_people(conditions="1 = 1", values=None, archived=False):
+	"""
+	Registrants and visiting family members grouped by day, event, status,
+	gender and age band.
+	"""
+	registration_table, member_table = source_tables(archived)
+	return frappe.db.sql(f"""
+		select day, event, status, gender, age_band, count(*) as attendees
+		from (
+			select date(reg.creation) as day, reg.event, reg.status,
+				{text_sql("mp.gender")} as gender, {age_band_sql("mp.date_of_birth", "mp.age")} as age_band
+			from `{registration_table}` reg
+			inner join `tabAgas Event` ev on ev.name = reg.event
+			left join `tabMember Profile` mp on mp.user = reg.user
+			where {conditions}
+			union all
+			select date(reg.creation), reg.event, reg.status,
+				{text_sql("fm.gender")}, {age_band_sql("fm.dob", "fm.age")}
+			from `{member_table}` erm
+			inner join `{registration_table}` reg on reg.name = erm.parent and erm.parenttype = 'Event Registration'
+			inner join `tabAgas Event` ev on ev.name = reg.event
+			left join `tabFamily Member` fm on fm.name = erm.family_member
+			where erm.is_visiting = 1 and {conditions}
+		) people
+		group by day, event, status, gender, age_band
+	""", values, as_dict=True)
+
+def rollup_rows(registration_groups, people_groups, status=None):
+	"""
+	Folds grouped rows into {(day, event, status, dimension, value): [registrations, attendees]}.
+	`status` overrides the groups' own status (used when shifting statuses).
+	"""
+	totals = defaultdict(lambda: [0, 0])
+	for row in registration_groups:
+		for dimension, value in zip(REGISTRATION_DIMENSIONS, ("", row.city, row.state)):
+			counts = totals[(str(row.day), row.event, status or row.status, dimension, value)]
+			counts[0] += cint(row.registrations)
+			counts[1] += cint(row.attendees)
+	for row in people_groups:
+		for dimension, value in zip(PEOPLE_DIMENSIONS, (row.gender, row.age_band)):
+			totals[(str(row.day), row.event, status or row.status, dimension, value)][1] += cint(row.attendees)
+	return totals
+
+def registration_rollup(reg):
+	"""
+	The rollup rows a single registration (a doc or its before-save copy)
+	counts towards, built the same way as the grouped queries.
+	"""
+	if not reg or not reg.get("event") or not reg.get("creation"):
+		return {}
+
+	profile = frappe.db.get_value("Member Profile", {"user": reg.get("user")},
+		["gender", "date_of_birth", "age", "city", "agas_state"], as_dict=True) or frappe._dict()
+	visiting = [row for row in reg.get("visitor_members") or [] if cint(row.get("is_visiting"))]
+	family = {member.name: member for member in frappe.get_all("Family Member",
+		filters={"name": ["in", [row.get("family_member") for row in visiting if row.get("family_member")] or [""]]},
+		fields=["name", "gender", "dob", "age"]
+	)}
+
+	day = getdate(reg.get("creation"))
+	group = frappe._dict(day=day, event=reg.get("event"), status=reg.get("status"))
+	registrations = [frappe._dict(group, city=text_or_unknown(profile.city), state=text_or_unknown(profile.agas_state),
+		registrations=1, attendees=1 + len(visiting))]
+	people = [frappe._dict(group, gender=text_or_unknown(profile.gender),
+		age_band=age_band(profile.date_of_birth, profile.age, day), attendees=1)]
+	for row in visiting:
+		member = family.get(row.get("family_member")) or frappe._dict()
+		people.append(frappe._dict(group, gender=text_or_unknown(member.gender),
+			age_band=age_band(member.dob, member.age, day), attendees=1))
+	return rollup_rows(registrations, people)
+
+def registration_state(name):
+	"""
+	What registration_rollup reads, straight from the tables, for writes that
+	bypass doc events (call it before and after the write).
+	"""
+	reg = frappe.db.get_value("Event Registration", name, ["name", "event", "status", "user", "creation"],
+		as_dict=True)
+	if reg:
+		reg.visitor_members = frappe.get_all("Event Registration Member",
+			filters={"parent": name, "parenttype": "Event Registration"},
+			fields=["family_member", "is_visiting"])
+	return reg
+
+def apply_change(before, after):
+	"""
+	Moves a registration's contribution from its previous state to its new
+	one. Either side may be None (insert / delete).
+	"""
+	apply_difference(registration_rollup(before), registration_rollup(after))
+
+def apply_difference(before, after):
+	"""
+	Adds `after - before` to the rollup rows with one upsert, creating the
+	missing ones.
+	"""
+	delta = defaultdict(lambda: [0, 0])
+	for rows, sign in ((before, -1), (after, 1)):
+		for key, counts in rows.items():
+			delta[key][0] += sign * counts[0]
+			delta[key][1] += sign * counts[1]
+
+	rows = [(key, counts) for key, counts in delta.items() if counts[0] or counts[1]]
+	if not rows:
+		return
+
+	now = now_datetime()
+	values = []
+	for key, (registrations, attendees) in rows:
+		values.extend([frappe.generate_hash(length=12), *key, registrations, attendees, now, now])
+	placeholders = ", ".join([f"({', '.join(['%s'] * len(ROLLUP_FIELDS))})"] * len(rows))
+	frappe.db.sql(f"""
+		insert into `tabAgas Registration Rollup` ({", ".join(f"`{field}`" for field in ROLLUP_FIELDS)})
+		values {placeholders}
+		on duplicate key update
+			registrations = registrations + values(registrations),
+			attendees = attendees + values(attendees),
+			modified = values(modified)
+	""", values)
+
+def shift_status(conditions, values, new_status):
+	"""
+	Rollup side of a set-based status UPDATE; call it next to
+	event_counters.shift_status with the same WHERE clause.
+	"""
+	registration_groups = grouped_registrations(conditions, values)
+	people_groups = grouped_people(conditions, values)
+	apply_difference(rollup_rows(registration_groups, people_groups),
+		rollup_rows(registration_groups, people_groups, status=new_status))
+
+def rebuild():
+	"""
+	Recomputes the whole rollup table from the source tables (and the archive
+	tables) with grouped queries. Runs nightly so edits to a member's city,
+	gender or date of birth (which do not touch their registrations) are
+	picked up.
+
+	The new rows go into a staging table that one RENAME swaps in, so readers
+	never see a half-built table and concurrent upserts never collide with
+	the bulk insert. Upserts that land on the old table while the rebuild
+	runs are corrected by the next one.
+
+	bench --site <site> execute agas.analytics.rebuild
+	"""
+	registration_groups, people_groups = grouped_registrations(), grouped_people()
+	if archive_exists():
+		registration_groups += grouped_registrations(archived=True)
+		people_groups += grouped_people(archived=True)
+	totals = rollup_rows(registration_groups, people_groups)
+	now = now_datetime()
+	rows = [[frappe.generate_hash(length=12), *key, registrations, attendees, now, now]
+		for key, (registrations, attendees) in totals.items()]
+
+	frappe.db.sql_ddl(f"drop table if exists `{STAGING_TABLE}`")
+	frappe.db.sql_ddl(f"create table `{STAGING_TABLE}` like `tabAgas Registration Rollup`")
+	columns = ", ".join(f"`{field}`" for field in ROLLUP_FIELDS)
+	row_placeholder = f"({', '.join(['%s'] * len(ROLLUP_FIELDS))})"
+	for start in range(0, len(rows), INSERT_CHUNK):
+		chunk = rows[start:start + INSERT_CHUNK]
+		frappe.db.sql(f"insert into `{STAGING_TABLE}` ({columns}) values {', '.join([row_placeholder] * len(chunk))}",
+			[value for row in chunk for value in row])
+	frappe.db.commit()
+
+	frappe.db.sql_ddl(f"drop table if exists `{RETIRED_TABLE}`")
+	frappe.db.sql_ddl(f"""rename table `tabAgas Registration Rollup` to `{RETIRED_TABLE}`,
+		`{STAGING_TABLE}` to `tabAgas Registration Rollup`""")
+	frappe.db.sql_ddl(f"drop table `{RETIRED_TABLE}`")
+	return len(totals)
+
+# Document events
+
+def on_registration_update(doc, method=None):
+	apply_change(doc.get_doc_before_save(), doc)
+
+def on_registration_trash(doc, method=None):
+	apply_change(doc, None)
@@ -4,11 +4,21 @@ import string
 from frappe.utils import validate_email_address, now_datetime, getdate
 from datetime import timedelta
 
+from agas.checkin import CHECKIN_STATUSES, reindex_registration
+from agas.idempotency import idempotent
+from agas.replica import mark_written, read_from_replica
+from agas import analytics, batch, event_counters, http_cache, meal_plan, pincodes, uploads, user_sync, waiting_room
+
 # Rate limiting settings
 OTP_EXPIRY = 300  # 5 minutes
 MAX_OTP_REQUESTS = 3  # Max requests per hour per identifier
 RATE_LIMIT_WINDOW = 3600  # 1 hour
 
+# Pincode answers only change with a new dataset. Versioned URLs (?v=) are
+# kept for a year, unversioned ones for a day.
+PINCODE_CACHE_SECONDS = 365 * 86400
+PINCODE_UNVERSIONED_CACHE_SECONDS = 86400
+
 @frappe.whitelist(allow_guest=True)
 def send_otp(email_or_mobile):
 	"""
@@ -111,42 +121,35 @@ def verify_otp_and_login(email_or_mobile, otp, set_password=None):
 	user_exists = frappe.db.exists("User", user_id)
 	
 	if not user_exists:
-		# Create User (Signup)
+		# Create User (Signup): roles and password go in with the insert, so signup is one save
 		user = frappe.get_doc({
 			"doctype": "User",
 			"email": user_id if "@" in user_id else f"{user_id}@example.com", # Fallback for mobile
 			"first_name": "Visitor",
 			"enabled": 1,
-			"user_type": "Website User"
+			"user_type": "Website User",
+			# Baseline role, if it exists
+			"roles": [{"role": role} for role in ["Website User", "Guest"] if frappe.db.exists("Role", role)][:1],
 		})
 		user.flags.no_welcome_mail = True
-		user.insert(ignore_permissions=True)
-		
-		# Assign baseline roles if they exist
-		for role in ["Website User", "Guest"]:
-			if frappe.db.exists("Role", role):
-				user.add_roles(role)
-				break
-		
-		# Set password if provided
 		if set_password:
 			user.new_password = set_password
-			user.save(ignore_permissions=True)
-		
-		frappe.db.commit()
-	else:
+		user.insert(ignore_permissions=True)
+		user_id = user.name
+	elif set_password:
 		# Existing user - update password if provided
-		if set_password:
-			user = frappe.get_doc("User", user_id)
-			user.new_password = set_password
-			user.save(ignore_permissions=True)
-			frappe.db.commit()
+		user = frappe.get_doc("User", user_id)
+		user.new_password = set_password
+		user.save(ignore_permissions=True)
 
 	# Login
 	frappe.local.login_manager = frappe.auth.LoginManager()
 	frappe.local.login_manager.user = user_id
 	frappe.local.login_manager.post_login()
-	
+	# The new user, password and session are committed together
+	frappe.db.commit()
+	mark_written()
+
 	return {
 		"message": "Logged in successfully",
 		"home_page": "/member_profile",
@@ -256,16 +259,44 @@ def submit_contact_form(name, email, message):
 	
 	return {"message": "Thank you! Your message has been sent."}
 
+@frappe.whitelist(allow_guest=True, methods=["GET"])
+def get_pincode_details(pincode, v=None):
+	"""
+	District, state and country for an Indian pincode, from the local Agas
+	Pincode table. Returns None for unknown pincodes; those answers are not
+	cached, since the pincode may be added by the next dataset load.
+	"""
+	pincode = (pincode or "").strip()
+	if len(pincode) != 6 or not pincode.isdigit():
+		frappe.throw("Invalid Pincode", frappe.ValidationError)
+
+	details = pincodes.lookup(pincode)
+	if not details:
+		return None
+	if v and v == pincodes.dataset_version():
+		http_cache.cache_response(PINCODE_CACHE_SECONDS, immutable=True)
+	else:
+		http_cache.cache_response(PINCODE_UNVERSIONED_CACHE_SECONDS)
+	return details
+
 @frappe.whitelist()
-def get_member_profile():
+@read_from_replica
+def get_member_profile(fields=None):
 	"""
-	Returns the Member Profile for the current user.
+	Returns the Member Profile for the current user, limited to `fields`
+	(a list or comma separated names) when given. Answers 304 when the
+	client's If-None-Match matches the profile's version.
 	"""
 	user = frappe.session.user
 	if user == "Guest":
 		return None
-	
-	profile = frappe.db.get_value("Member Profile", {"user": user}, "*", as_dict=True)
+
+	fields = _projected_fields("Member Profile", fields)
+	version = frappe.db.get_value("Member Profile", {"user": user}, ["name", "modified"])
+	if http_cache.not_modified(user, fields, version):
+		return None
+
+	profile = frappe.db.get_value("Member Profile", {"user": user}, fields, as_dict=True)
 	if not profile:
 		# Create a dummy or empty structure to help frontend
 		profile = {
@@ -276,9 +307,12 @@ def get_member_profile():
 			"email_id": user,
 			"user": user
 		}
+		if fields != "*":
+			profile = {key: value for key, value in profile.items() if key in fields}
 	return profile
 
 @frappe.whitelist()
+@idempotent
 def save_member_profile(data):
 	"""
 	Saves or updates the Member Profile for the current user.
@@ -289,6 +323,7 @@ def save_member_profile(data):
 
 	if isinstance(data, str):
 		data = frappe.parse_json(data)
+	uploads.resolve_uploads(data)
 
 	# Validate unique mobile number
 	mobile_no = data.get("mobile_no")
@@ -324,38 +359,15 @@ def save_member_profile(data):
 		doc = frappe.get_doc(data)
 		doc.insert(ignore_permissions=True)
 	
-	# Sync with User record
-	try:
-		user_doc = frappe.get_doc("User", user)
-		user_updated = False
-		
-		# Map Member Profile fields to User fields
-		mapping = {
-			"first_name": "first_name",
-			"last_name": "last_name",
-			"gender": "gender",
-			"mobile_no": "mobile_no",
-			"date_of_birth": "birth_date",
-			"photo": "user_image"
-		}
-		
-		for member_key, user_key in mapping.items():
-			if member_key in data:
-				val = data.get(member_key)
-				if user_doc.get(user_key) != val:
-					user_doc.set(user_key, val)
-					user_updated = True
-		
-		if user_updated:
-			user_doc.save(ignore_permissions=True)
-			
-	except Exception as e:
-		frappe.logger().error(f"Error syncing User record for {user}: {str(e)}")
+	# Mirror name, gender, mobile, birth date and photo onto the User in the background
+	if any(key in data for key in user_sync.USER_FIELDS):
+		user_sync.queue_user_sync(user)
 
-	frappe.db.commit()
+	batch.commit()
 	return {"message": "Profile saved successfully", "name": doc.name}
 
 @frappe.whitelist()
+@idempotent
 def register_for_event(data):
 	"""
 	Creates or updates an Event Registration record.
@@ -367,63 +379,41 @@ def register_for_event(data):
 	if isinstance(data, str):
 		data = frappe.parse_json(data)
 
-	# Validate email format
-	email = data.get("email")
-	if email and not validate_email_address(email):
-		frappe.throw("Invalid email address format", frappe.ValidationError)
+	# Checked before any database work, so a rush cannot reach the DB without an admission
+	waiting_room.require_admission(data.get("event"))
 
 	event_title = data.get("event")
 	if not event_title:
 		frappe.throw("Event is required")
 
-	# Validate visitor members - check if visiting members have visit dates
-	if "visitor_members" in data and isinstance(data["visitor_members"], list):
-		for member in data["visitor_members"]:
-			if member.get("is_visiting") == 1:
-				visit_from = member.get("visit_from_date")
-				visit_to = member.get("visit_to_date")
-				if not visit_from or not visit_to:
-					member_name = f"{member.get('first_name', '')} {member.get('last_name', '')}".strip()
-					frappe.throw(
-						f"Visit from/to dates are required for {member_name or 'visiting member'}",
-						frappe.ValidationError,
-					)
-				if getdate(visit_from) > getdate(visit_to):
-					member_name = f"{member.get('first_name', '')} {member.get('last_name', '')}".strip()
-					frappe.throw(
-						f"Visit from date must be before visit to date for {member_name or 'visiting member'}",
-						frappe.ValidationError,
-					)
-
-	# Validate primary visit dates if provided
-	if data.get("check_in_date") and data.get("check_out_date"):
-		if getdate(data["check_in_date"]) > getdate(data["check_out_date"]):
-			frappe.throw("Check-in date must be before check-out date", frappe.ValidationError)
-
-	# Validate food requirements
-	if data.get("food_required") == "Yes":
-		food_schedule = data.get("food_schedule", [])
-		has_meals = False
-		for day in food_schedule:
-			if day.get("breakfast") or day.get("lunch") or day.get("dinner"):
-				has_meals = True
-				break
-		if not has_meals:
-			frappe.throw("Please select at least one meal if food is required.", frappe.ValidationError)
-
-	# Check for existing registration for this user and event
-	existing_name = frappe.db.get_value("Event Registration", 
-		{"user": user, "event": event_title}, "name")
+	visitor_members = data.get("visitor_members") if isinstance(data.get("visitor_members"), list) else []
+	has_meals = any(meal_plan.day_mask(day) for day in data.get("food_schedule") or [])
+	_validate_registration(data, visitor_members, has_meals)
+
+	# Check for existing registration for this user and event. Clients send the
+	# `modified` they last saw, so another tab's or device's save is not overwritten;
+	# older pages and replays queued before they had one send none and are not checked.
+	expected_modified = data.pop("modified", None)
+	existing = frappe.db.get_value("Event Registration",
+		{"user": user, "event": event_title}, ["name", "modified"], as_dict=True, for_update=True)
+	if existing and expected_modified and str(existing.modified) != str(expected_modified):
+		frappe.throw("This registration was changed from another tab or device. Please reload and try again.",
+			frappe.TimestampMismatchError)
+	existing_name = existing.name if existing else None
 
 	finalize = data.get("finalize", False)
 	data["doctype"] = "Event Registration"
 	data["user"] = user
+
+	# Meals are stored as a per-member bitmap rather than one child row per day
+	if "food_schedule" in data:
+		data["meal_plan"] = meal_plan.dumps(meal_plan.encode(data.pop("food_schedule")))
 	
 	if existing_name:
 		doc = frappe.get_doc("Event Registration", existing_name)
 		# Update fields except some system ones
 		for key, value in data.items():
-			if key not in ["name", "doctype", "user", "visitor_members", "food_schedule", "finalize"]:
+			if key not in ["name", "doctype", "user", "visitor_members", "finalize"]:
 				doc.set(key, value)
 		
 		# If previously Draft and now finalizing, move to Registered
@@ -439,34 +429,183 @@ def register_for_event(data):
 				member["doctype"] = "Event Registration Member"
 				doc.append("visitor_members", member)
 
-		if "food_schedule" in data:
-			doc.set("food_schedule", [])
-			for day in data["food_schedule"]:
-				day["doctype"] = "Event Food Day"
-				doc.append("food_schedule", day)
-		
 		doc.save(ignore_permissions=True)
 	else:
 		data["status"] = "Registered" if finalize else "Draft"
 		if "visitor_members" in data:
 			for member in data["visitor_members"]:
 				member["doctype"] = "Event Registration Member"
-		
-		if "food_schedule" in data:
-			for day in data["food_schedule"]:
-				day["doctype"] = "Event Food Day"
-		
+
 		doc = frappe.get_doc(data)
 		doc.insert(ignore_permissions=True)
 	
-	frappe.db.commit()
-	msg = "Registration successful" if finalize else "Progress saved as Draft"
-	return {"message": msg, "name": doc.name, "status": doc.status}
+	batch.commit()
+	msg = "Registration successful" if finalize else _saved_message(doc.status)
+	return {"message": msg, "name": doc.name, "status": doc.status, "modified": str(doc.modified)}
+
+# Parent fields a draft autosave is allowed to touch
+PATCHABLE_REGISTRATION_FIELDS = (
+	"first_name", "middle_name", "last_name", "email", "mobile_no",
+	"date_of_visit", "check_in_date", "check_out_date", "stay_required",
+	"no_of_visitors", "no_of_rooms", "food_required", "food_preference",
+)
+
+# Child tables and the fields that identify a row within them. The food
+# schedule is patched into the meal_plan bitmap instead (see agas.meal_plan).
+PATCHABLE_REGISTRATION_TABLES = {
+	"visitor_members": ("Event Registration Member", ("family_member",)),
+}
 
 @frappe.whitelist()
-def get_family_members():
+@idempotent
+def patch_registration(name, modified, changes):
 	"""
-	Returns a list of family members for the current member profile.
+	Applies a partial update (changed fields and child rows only) to an
+	existing Event Registration. The client sends the `modified` timestamp it
+	last saw; if the record changed since then the write is rejected.
+
+	changes = {
+		"fields": {"check_in_date": "2026-01-10", ...},
+		"visitor_members": {"set": [{row}, ...], "remove": [{"family_member": ...}, ...]},
+		"food_schedule": {"set": [{row}, ...], "remove": [{"member_ref": ..., "date": ...}, ...]}
+	}
+	"""
+	user = frappe.session.user
+	if user == "Guest":
+		frappe.throw("Please login to register for events", frappe.PermissionError)
+
+	if isinstance(changes, str):
+		changes = frappe.parse_json(changes)
+
+	# Lock the row so that two concurrent autosaves cannot both pass the version check
+	current = frappe.db.get_value("Event Registration", name,
+		["user", "event", "status", "modified", "email", "check_in_date", "check_out_date", "meal_plan",
+			"no_of_visitors", "no_of_rooms", "stay_required", "food_required"], as_dict=True, for_update=True)
+	if not current:
+		frappe.throw("Registration not found", frappe.DoesNotExistError)
+	if current.user != user:
+		frappe.throw("Not authorized", frappe.PermissionError)
+	# Autosaves during a rush go through the same waiting room as full saves
+	waiting_room.require_admission(current.event)
+	if current.status in ("Cancelled", "Completed"):
+		frappe.throw(f"A {current.status.lower()} registration cannot be edited", frappe.ValidationError)
+	if str(current.modified) != str(modified):
+		frappe.throw("This registration was changed from another tab or device. Please reload and try again.",
+			frappe.TimestampMismatchError)
+
+	fields = {k: v for k, v in (changes.get("fields") or {}).items() if k in PATCHABLE_REGISTRATION_FIELDS}
+	if changes.get("food_schedule"):
+		fields["meal_plan"] = meal_plan.dumps(meal_plan.apply_changes(current.meal_plan, changes["food_schedule"]))
+
+	# Validate the registration as it will be after the patch, like the full save does
+	has_meals = any(int(member["bits"] or "0", 16)
+		for member in (meal_plan.load(fields.get("meal_plan", current.meal_plan)) or {}).get("members", {}).values())
+	_validate_registration(
+		{**current, **fields},
+		[{"is_visiting": 1, **member} for member in (changes.get("visitor_members") or {}).get("set") or []],
+		has_meals,
+	)
+
+	state_before = analytics.registration_state(name)
+	for parentfield, (child_doctype, key_fields) in PATCHABLE_REGISTRATION_TABLES.items():
+		table_changes = changes.get(parentfield)
+		if table_changes:
+			_patch_child_rows(name, parentfield, child_doctype, key_fields, table_changes)
+
+	new_modified = now_datetime()
+	fields["modified"] = new_modified
+	fields["modified_by"] = user
+	frappe.db.set_value("Event Registration", name, fields, update_modified=False)
+
+	# Direct writes skip doc events, so keep the gate index, event counters and rollups in step ourselves
+	if current.status in CHECKIN_STATUSES:
+		reindex_registration(name)
+	event_counters.apply_change(current, {**current, **fields})
+	analytics.apply_change(state_before, analytics.registration_state(name))
+
+	batch.commit()
+	return {"message": _saved_message(current.status), "name": name, "status": current.status,
+		"modified": str(new_modified)}
+
+def _saved_message(status):
+	return "Progress saved as Draft" if status == "Draft" else "Changes saved"
+
+def _validate_registration(values, visitor_members, has_meals):
+	"""
+	Checks shared by full saves and patches. `values` holds the registration's
+	fields as they will be after the write, `visitor_members` the member rows
+	being written and `has_meals` whether any meal is chosen.
+	"""
+	email = values.get("email")
+	if email and not validate_email_address(email):
+		frappe.throw("Invalid email address format", frappe.ValidationError)
+
+	for member in visitor_members:
+		if member.get("is_visiting") != 1:
+			continue
+		member_name = f"{member.get('first_name') or ''} {member.get('last_name') or ''}".strip()
+		visit_from = member.get("visit_from_date")
+		visit_to = member.get("visit_to_date")
+		if not visit_from or not visit_to:
+			frappe.throw(f"Visit from/to dates are required for {member_name or 'visiting member'}",
+				frappe.ValidationError)
+		if getdate(visit_from) > getdate(visit_to):
+			frappe.throw(f"Visit from date must be before visit to date for {member_name or 'visiting member'}",
+				frappe.ValidationError)
+
+	if values.get("check_in_date") and values.get("check_out_date"):
+		if getdate(values["check_in_date"]) > getdate(values["check_out_date"]):
+			frappe.throw("Check-in date must be before check-out date", frappe.ValidationError)
+
+	if values.get("food_required") == "Yes" and not has_meals:
+		frappe.throw("Please select at least one meal if food is required.", frappe.ValidationError)
+
+def _patch_child_rows(parent, parentfield, child_doctype, key_fields, table_changes):
+	"""
+	Upserts and removes child rows of an Event Registration in place, matching
+	rows on `key_fields` instead of rewriting the whole table.
+	"""
+	meta_fields = {df.fieldname for df in frappe.get_meta(child_doctype).fields}
+
+	def row_key(row):
+		return tuple(str(row.get(k) or "") for k in key_fields)
+
+	existing = frappe.get_all(child_doctype,
+		filters={"parent": parent, "parenttype": "Event Registration", "parentfield": parentfield},
+		fields=["name", "idx", *key_fields]
+	)
+	existing_by_key = {row_key(row): row.name for row in existing}
+	next_idx = max((row.idx or 0 for row in existing), default=0) + 1
+
+	to_remove = [existing_by_key[row_key(row)] for row in table_changes.get("remove") or []
+		if row_key(row) in existing_by_key]
+	if to_remove:
+		frappe.db.delete(child_doctype, {"name": ["in", to_remove]})
+
+	for row in table_changes.get("set") or []:
+		values = {k: v for k, v in row.items() if k in meta_fields}
+		row_name = existing_by_key.get(row_key(row))
+		if row_name:
+			if values:
+				frappe.db.set_value(child_doctype, row_name, values)
+		else:
+			child = frappe.new_doc(child_doctype)
+			child.update(values)
+			child.parent = parent
+			child.parenttype = "Event Registration"
+			child.parentfield = parentfield
+			child.idx = next_idx
+			child.db_insert()
+			existing_by_key[row_key(row)] = child.name
+			next_idx += 1
+
+@frappe.whitelist()
+@read_from_replica
+def get_family_members(fields=None):
+	"""
+	Returns a list of family members for the current member profile, limited
+	to `fields` when given. Answers 304 when the client's If-None-Match
+	matches the list's version.
 	"""
 	user = frappe.session.user
 	if user == "Guest":
@@ -475,14 +614,40 @@ def get_family_members():
 	profile_name = frappe.db.get_value("Member Profile", {"user": user}, "name")
 	if not profile_name:
 		return []
+
+	fields = _projected_fields("Family Member", fields)
+	# Every member's name and modified, hashed into the ETag by not_modified: an edit, add or
+	# delete always changes it. (An md5 of group_concat would be cut off at group_concat_max_len.)
+	version = frappe.db.sql("""
+		select name, modified from `tabFamily Member` where primary_member = %s order by name
+	""", (profile_name,))
+	if http_cache.not_modified(profile_name, fields, version):
+		return None
 	
 	return frappe.get_all("Family Member", 
 		filters={"primary_member": profile_name},
-		fields=["*"],
+		fields=fields,
 		order_by="creation asc"
 	)
 
+def _projected_fields(doctype, fields):
+	"""
+	Validates a client-requested field list against the DocType's columns.
+	"""
+	if not fields:
+		return "*"
+	if isinstance(fields, str):
+		fields = frappe.parse_json(fields) if fields.startswith("[") else fields.split(",")
+
+	fields = [field.strip() for field in fields if field and field.strip()]
+	valid = set(frappe.get_meta(doctype).get_valid_columns())
+	unknown = [field for field in fields if field not in valid]
+	if unknown:
+		frappe.throw(f"Unknown fields for {doctype}: {', '.join(unknown)}", frappe.ValidationError)
+	return fields or "*"
+
 @frappe.whitelist()
+@idempotent
 def save_family_member(data):
 	"""
 	Creates or updates a Family Member record.
@@ -493,6 +658,7 @@ def save_family_member(data):
 
 	if isinstance(data, str):
 		data = frappe.parse_json(data)
+	uploads.resolve_uploads(data)
 
 	profile_name = frappe.db.get_value("Member Profile", {"user": user}, "name")
 	if not profile_name:
@@ -544,10 +710,11 @@ def save_family_member(data):
 		doc = frappe.get_doc(data)
 		doc.insert(ignore_permissions=True)
 	
-	frappe.db.commit()
+	batch.commit()
 	return {"message": "Family member saved successfully", "name": doc.name}
 
 @frappe.whitelist()
+@idempotent
 def delete_family_member(name):
 	"""
 	Deletes a Family Member record.
@@ -563,10 +730,11 @@ def delete_family_member(name):
 		frappe.throw("Not authorized", frappe.PermissionError)
 	
 	doc.delete()
-	frappe.db.commit()
+	batch.commit()
 	return {"message": "Deleted successfully"}
 
 @frappe.whitelist()
+@idempotent
 def cancel_registration(registration_name, reason=None):
 	"""
 	Cancels an Event Registration.
@@ -585,5 +753,5 @@ def cancel_registration(registration_name, reason=None):
 	doc.status = "Cancelled"
 	doc.cancellation_reason = reason
 	doc.save(ignore_permissions=True)
-	frappe.db.commit()
+	batch.commit()
 	return "Registration cancelled successfully"
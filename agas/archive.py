@@ -0,0 +1,122 @@
+import frappe
+from frappe.utils import add_months, cint, nowdate
+
+# Registrations of events that ended this many months ago move to the archive
+# tables (site config `agas_archive_after_months`).
+DEFAULT_ARCHIVE_AFTER_MONTHS = 24
+BATCH_SIZE = 500  # registrations moved per transaction
+
+# Hot table -> archive table. Archive tables are plain tables without a
+# DocType; they do not use the `tab` prefix so `bench trim-database` leaves
+# them alone.
+ARCHIVE_TABLES = {
+	"tabEvent Registration": "agas_archive_event_registration",
+	"tabEvent Registration Member": "agas_archive_event_registration_member",
+	"tabEvent Food Day": "agas_archive_event_food_day",
+}
+CHILD_TABLES = ("tabEvent Registration Member", "tabEvent Food Day")
+
+def archive_old_registrations(months=None, batch_size=BATCH_SIZE):
+	"""
+	Moves registrations (with their member and food rows) of events that
+	ended more than `months` ago into the archive tables, one batch per
+	transaction, so a run can be interrupted and resumed. Their gate check-in
+	entries are dropped. Runs weekly.
+
+	bench --site <site> execute agas.archive.archive_old_registrations --kwargs "{'months': 24}"
+	"""
+	months = cint(months) or cint(frappe.conf.get("agas_archive_after_months")) or DEFAULT_ARCHIVE_AFTER_MONTHS
+	cutoff = add_months(nowdate(), -months)
+	ensure_archive_tables()
+
+	moved = 0
+	while True:
+		names = frappe.db.sql_list("""
+			select reg.name
+			from `tabEvent Registration` reg
+			inner join `tabAgas Event` ev on ev.name = reg.event
+			where ev.event_end_date < %s
+			order by reg.name
+			limit %s
+		""", (cutoff, cint(batch_size)))
+		if not names:
+			break
+		move_batch(names)
+		frappe.db.commit()
+		moved += len(names)
+
+	frappe.logger("agas.archive").info(f"Archived {moved} registrations of events ended before {cutoff}")
+	return moved
+
+def move_batch(names):
+	"""
+	Copies a batch into the archive and deletes it from the hot tables.
+	`replace` keeps a retried batch from failing on rows it already copied.
+	"""
+	values = {"names": tuple(names)}
+	for table in (*CHILD_TABLES, "tabEvent Registration"):
+		condition = "name in %(names)s" if table == "tabEvent Registration" else \
+			"parent in %(names)s and parenttype = 'Event Registration'"
+		columns = ", ".join(f"`{column}`" for column in table_columns(table))
+		frappe.db.sql(f"""
+			replace into `{ARCHIVE_TABLES[table]}` ({columns})
+			select {columns} from `{table}` where {condition}
+		""", values)
+		frappe.db.sql(f"delete from `{table}` where {condition}", values)
+
+	entries = frappe.get_all("Gate Checkin Entry", filters={"registration": ["in", names]}, pluck="name")
+	if entries:
+		frappe.db.delete("Gate Search Token", {"entry": ["in", entries]})
+		frappe.db.delete("Gate Checkin Entry", {"name": ["in", entries]})
+
+def ensure_archive_tables():
+	"""
+	Creates each archive table as a copy of its hot table's structure and adds
+	any column the hot table gained since.
+	"""
+	for table, archive in ARCHIVE_TABLES.items():
+		frappe.db.sql_ddl(f"create table if not exists `{archive}` like `{table}`")
+		archived = set(table_columns(archive))
+		for column in frappe.db.sql(f"show full columns from `{table}`", as_dict=True):
+			if column.Field in archived:
+				continue
+			default = "" if column.Default is None else f" default {frappe.db.escape(column.Default)}"
+			null = " not null" if column.Null == "NO" else ""
+			frappe.db.sql_ddl(f"alter table `{archive}` add column `{column.Field}` {column.Type}{null}{default}")
+
+	# Member history reads archived registrations by user
+	registrations = ARCHIVE_TABLES["tabEvent Registration"]
+	if not frappe.db.sql(f"show index from `{registrations}` where Key_name = 'user_index'"):
+		frappe.db.sql_ddl(f"alter table `{registrations}` add index `user_index` (`user`)")
+
+def table_columns(table):
+	return [row[0] for row in frappe.db.sql(f"show columns from `{table}`")]
+
+def archive_exists():
+	return bool(frappe.db.sql("show tables like %s", ARCHIVE_TABLES["tabEvent Registration"]))
+
+def registration_source(columns):
+	"""
+	SQL for a derived table `reg` over hot and archived registrations, for
+	rebuilds that must not lose archived history.
+	"""
+	columns = ", ".join(f"`{column}`" for column in columns)
+	hot = f"select {columns} from `tabEvent Registration`"
+	if not archive_exists():
+		return f"({hot}) reg"
+	return f"({hot} union all select {columns} from `{ARCHIVE_TABLES['tabEvent Registration']}`) reg"
+
+def get_registrations(user, fields, include_archived=False):
+	"""
+	A user's registrations from the hot table, plus archived ones (flagged
+	`archived`) only when asked for.
+	"""
+	registrations = frappe.get_all("Event Registration", filters={"user": user}, fields=fields)
+	if include_archived and archive_exists():
+		columns = ", ".join(f"`{field}`" for field in fields)
+		registrations += frappe.db.sql(f"""
+			select {columns}, 1 as archived
+			from `{ARCHIVE_TABLES["tabEvent Registration"]}`
+			where user = %s
+		""", (user,), as_dict=True)
+	return registrations
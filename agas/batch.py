@@ -0,0 +1,78 @@
+import frappe
+
+from agas.idempotency import idempotent
+from agas.replica import mark_written
+
+MAX_CALLS = 20
+# agas.api methods a batch may run; each still checks the session itself
+BATCH_METHODS = (
+	"get_member_profile",
+	"save_member_profile",
+	"get_family_members",
+	"save_family_member",
+	"delete_family_member",
+	"register_for_event",
+	"patch_registration",
+	"cancel_registration",
+)
+
+@frappe.whitelist(methods=["POST"])
+@idempotent
+def run_batch(calls):
+	"""
+	Runs several `agas.api` calls in one request and one transaction, in
+	order. `calls` is a list of {"method": "save_family_member", "args": {...}}.
+	Each call gets a savepoint: a failing call is rolled back alone and the
+	calls after it still run. Returns one entry per call, shaped like a
+	regular API response (`message`, or `exc_type` and `_server_messages`).
+	"""
+	if isinstance(calls, str):
+		calls = frappe.parse_json(calls)
+	if not isinstance(calls, list) or not calls:
+		frappe.throw("calls must be a non-empty list", frappe.ValidationError)
+	if len(calls) > MAX_CALLS:
+		frappe.throw(f"A batch can hold at most {MAX_CALLS} calls", frappe.ValidationError)
+
+	results = []
+	frappe.flags.agas_batch = True
+	try:
+		for index, call in enumerate(calls):
+			results.append(run_call(call, f"agas_batch_{index}"))
+	finally:
+		frappe.flags.agas_batch = False
+
+	frappe.db.commit()
+	return results
+
+def run_call(call, savepoint):
+	method = (call or {}).get("method")
+	if method not in BATCH_METHODS:
+		return error_response("PermissionError", f"{method} cannot be called in a batch")
+
+	frappe.local.message_log = []
+	frappe.db.savepoint(savepoint)
+	try:
+		result = frappe.call(f"agas.api.{method}", **(call.get("args") or {}))
+	except Exception as e:
+		frappe.db.rollback(save_point=savepoint)
+		messages = [m.get("message") if isinstance(m, dict) else m for m in frappe.local.message_log]
+		frappe.local.message_log = []
+		return error_response(type(e).__name__, *(messages or [str(e) or "Request failed"]))
+
+	frappe.db.release_savepoint(savepoint)
+	return {"message": result}
+
+def error_response(exc_type, *messages):
+	return {
+		"exc_type": exc_type,
+		"_server_messages": frappe.as_json([frappe.as_json({"message": message}) for message in messages]),
+	}
+
+def commit():
+	"""
+	Commits, unless inside a batch, which commits once after its last call.
+	Either way the request now reads from the primary.
+	"""
+	mark_written()
+	if not frappe.flags.agas_batch:
+		frappe.db.commit()
@@ -0,0 +1,345 @@
+import json
+import os
+import pickle
+import re
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import frappe
+import requests
+from frappe.utils import add_days, get_url, nowdate
+
+from agas.instrumentation import percentile
+
+# Load test settings
+BENCH_PASSWORD = "Bench@Agas#2026"
+BENCH_EVENT = "Agas Benchmark Event"
+BENCH_FILE = "/files/agas-benchmark.png"
+DEFAULT_TOLERANCE = 0.2  # 20% slower than baseline counts as a regression
+REQUEST_TIMEOUT = 60
+
+ALL_SCENARIOS = (
+	"otp_login",
+	"save_member_profile",
+	"save_family_member",
+	"register_for_event",
+	"events_page",
+	"member_profile_page",
+	"event_registration_page",
+)
+
+_SERVER_TIMING_QUERIES = re.compile(r'db;[^,]*desc="(\d+) queries"')
+_CSRF_TOKEN = re.compile(r'const csrfToken = "([^"]+)"')
+
+def run(base_url=None, concurrency=10, iterations=20, scenarios=None, baseline=None,
+		save_baseline=False, tolerance=DEFAULT_TOLERANCE):
+	"""
+	Drives the agas endpoints and pages at the given concurrency against a
+	running site and prints throughput, p50/p99 latency and queries per request.
+
+	bench --site <site> execute agas.benchmarks.load_test.run \\
+		--kwargs "{'concurrency': 25, 'iterations': 40, 'save_baseline': 1}"
+
+	Queries per request are read from the Server-Timing header, so set
+	`agas_instrumentation` in the site config to get them. Results are compared
+	against the baseline file (sites/<site>/agas_benchmark_baseline.json by
+	default) and any metric worse than `tolerance` is reported as a regression.
+	"""
+	base_url = (base_url or get_url()).rstrip("/")
+	concurrency = int(concurrency)
+	iterations = int(iterations)
+	scenarios = _parse_scenarios(scenarios)
+	baseline = baseline or frappe.get_site_path("agas_benchmark_baseline.json")
+
+	fixtures = setup_fixtures(concurrency)
+	results = {}
+	for scenario in scenarios:
+		print(f"Running {scenario} ({concurrency} users x {iterations} iterations)...")
+		results[scenario] = run_scenario(scenario, base_url, fixtures, concurrency, iterations)
+
+	print_report(results)
+
+	regressions = []
+	if os.path.exists(baseline):
+		with open(baseline) as f:
+			regressions = compare_with_baseline(results, json.load(f), float(tolerance))
+		for line in regressions:
+			print(f"REGRESSION {line}")
+		if not regressions:
+			print(f"No regressions against {baseline}")
+
+	if save_baseline:
+		with open(baseline, "w") as f:
+			json.dump(results, f, indent=2, sort_keys=True)
+		print(f"Baseline saved to {baseline}")
+
+	return {"results": results, "regressions": regressions}
+
+def setup_fixtures(count):
+	"""
+	Creates (or reuses) one benchmark user with a Member Profile per virtual
+	user, plus a published upcoming event to register for.
+	"""
+	if not frappe.db.exists("Agas Event", BENCH_EVENT):
+		frappe.get_doc({
+			"doctype": "Agas Event",
+			"title": BENCH_EVENT,
+			"event_start_date": add_days(nowdate(), 30),
+			"event_end_date": add_days(nowdate(), 32),
+			"published": 1,
+			"description": "Fixture used by agas.benchmarks.load_test",
+		}).insert(ignore_permissions=True)
+
+	cache = frappe.cache()
+	fixtures = []
+	for i in range(count):
+		email = f"agas-bench-{i}@example.com"
+		otp_identifier = f"agas-bench-otp-{i}@example.com"
+		if not frappe.db.exists("User", email):
+			user = frappe.get_doc({
+				"doctype": "User",
+				"email": email,
+				"first_name": "Bench",
+				"last_name": str(i),
+				"enabled": 1,
+				"user_type": "Website User",
+				"new_password": BENCH_PASSWORD,
+			})
+			user.flags.no_welcome_mail = True
+			user.insert(ignore_permissions=True)
+
+		if not frappe.db.exists("Member Profile", {"user": email}):
+			frappe.get_doc({
+				"doctype": "Member Profile",
+				"user": email,
+				"first_name": "Bench",
+				"middle_name": str(i),
+				"last_name": "User",
+				"email_id": email,
+				"mobile_no": f"90000{i:05d}",
+				"id_proof_type": "Aadhar",
+				"id_proof": BENCH_FILE,
+				"photo": BENCH_FILE,
+			}).insert(ignore_permissions=True)
+
+		fixtures.append(frappe._dict(
+			index=i,
+			email=email,
+			otp_identifier=otp_identifier,
+			# Redis keys are namespaced per site; resolve them here because worker
+			# threads have no site context
+			otp_key=cache.make_key(f"otp_verify_{otp_identifier}"),
+			otp_rate_key=cache.make_key(f"otp_request_limit_{otp_identifier}"),
+			# register_for_event only overwrites the version the client last saw
+			registration_modified=frappe.db.get_value("Event Registration",
+				{"user": email, "event": BENCH_EVENT}, "modified"),
+		))
+
+	frappe.db.commit()
+	return fixtures
+
+def run_scenario(scenario, base_url, fixtures, concurrency, iterations):
+	samples = []
+	samples_lock = threading.Lock()
+	cache = frappe.cache()
+
+	def worker(fixture):
+		client = BenchClient(base_url, fixture, cache)
+		if scenario != "otp_login":
+			client.login()
+		for _ in range(iterations):
+			sample = getattr(client, scenario)()
+			with samples_lock:
+				samples.append(sample)
+
+	started = time.perf_counter()
+	with ThreadPoolExecutor(max_workers=concurrency) as pool:
+		for future in [pool.submit(worker, fixture) for fixture in fixtures[:concurrency]]:
+			future.result()
+	wall_time = time.perf_counter() - started
+
+	return summarize(samples, wall_time)
+
+def summarize(samples, wall_time):
+	latencies = sorted(s["ms"] for s in samples)
+	queries = [s["queries"] for s in samples if s["queries"] is not None]
+	errors = sum(1 for s in samples if not s["ok"])
+	return {
+		"requests": len(samples),
+		"errors": errors,
+		"throughput_rps": round(len(samples) / wall_time, 2) if wall_time else 0,
+		"p50_ms": round(percentile(latencies, 50), 2),
+		"p99_ms": round(percentile(latencies, 99), 2),
+		"mean_ms": round(statistics.fmean(latencies), 2) if latencies else 0,
+		"queries_per_request": round(statistics.fmean(queries), 2) if queries else None,
+	}
+
+def compare_with_baseline(results, baseline, tolerance):
+	"""
+	Returns one line per metric that is worse than the baseline by more than
+	`tolerance`. Queries per request are compared exactly: any increase is a
+	regression.
+	"""
+	regressions = []
+	for scenario, current in results.items():
+		previous = baseline.get(scenario)
+		if not previous:
+			continue
+
+		for metric in ("p50_ms", "p99_ms"):
+			if previous[metric] and current[metric] > previous[metric] * (1 + tolerance):
+				regressions.append(f"{scenario}.{metric}: {previous[metric]} -> {current[metric]}")
+
+		if previous["throughput_rps"] and current["throughput_rps"] < previous["throughput_rps"] * (1 - tolerance):
+			regressions.append(
+				f"{scenario}.throughput_rps: {previous['throughput_rps']} -> {current['throughput_rps']}")
+
+		before, after = previous.get("queries_per_request"), current.get("queries_per_request")
+		if before is not None and after is not None and after > before:
+			regressions.append(f"{scenario}.queries_per_request: {before} -> {after}")
+
+		if current["errors"] > previous.get("errors", 0):
+			regressions.append(f"{scenario}.errors: {previous.get('errors', 0)} -> {current['errors']}")
+
+	return regressions
+
+def print_report(results):
+	header = f"{'scenario':<26}{'reqs':>7}{'errors':>8}{'req/s':>9}{'p50 ms':>10}{'p99 ms':>10}{'queries':>9}"
+	print(header)
+	print("-" * len(header))
+	for scenario, r in results.items():
+		queries = "-" if r["queries_per_request"] is None else r["queries_per_request"]
+		print(f"{scenario:<26}{r['requests']:>7}{r['errors']:>8}{r['throughput_rps']:>9}"
+			f"{r['p50_ms']:>10}{r['p99_ms']:>10}{queries!s:>9}")
+
+def _parse_scenarios(scenarios):
+	if not scenarios:
+		return list(ALL_SCENARIOS)
+	if isinstance(scenarios, str):
+		scenarios = [s.strip() for s in scenarios.split(",") if s.strip()]
+	unknown = set(scenarios) - set(ALL_SCENARIOS)
+	if unknown:
+		frappe.throw(f"Unknown scenarios: {', '.join(sorted(unknown))}", frappe.ValidationError)
+	return scenarios
+
+class BenchClient:
+	"""
+	One virtual user: a cookie session plus the fixture it acts as. Every
+	scenario method performs one request (or one OTP round trip) and returns a
+	sample dict.
+	"""
+
+	def __init__(self, base_url, fixture, cache):
+		self.base_url = base_url
+		self.fixture = fixture
+		self.cache = cache
+		self.session = requests.Session()
+		self.csrf_token = None
+		self.family_member = None
+
+	def login(self):
+		self.session.post(f"{self.base_url}/api/method/agas.api.login_with_password",
+			json={"identifier": self.fixture.email, "password": BENCH_PASSWORD},
+			timeout=REQUEST_TIMEOUT).raise_for_status()
+		page = self.session.get(f"{self.base_url}/member_profile", timeout=REQUEST_TIMEOUT)
+		match = _CSRF_TOKEN.search(page.text)
+		self.csrf_token = match.group(1) if match else None
+
+	def otp_login(self):
+		session = requests.Session()
+		# The OTP endpoint allows 3 requests an hour per identifier
+		self.cache.delete(self.fixture.otp_rate_key)
+
+		started = time.perf_counter()
+		sent = session.post(f"{self.base_url}/api/method/agas.api.send_otp",
+			json={"email_or_mobile": self.fixture.otp_identifier}, timeout=REQUEST_TIMEOUT)
+		raw_otp = self.cache.get(self.fixture.otp_key)
+		otp = pickle.loads(raw_otp) if raw_otp else ""
+		verified = session.post(f"{self.base_url}/api/method/agas.api.verify_otp_and_login",
+			json={"email_or_mobile": self.fixture.otp_identifier, "otp": otp}, timeout=REQUEST_TIMEOUT)
+		elapsed = (time.perf_counter() - started) * 1000
+
+		queries = [_queries(sent), _queries(verified)]
+		return {
+			"ms": elapsed,
+			"ok": sent.ok and verified.ok,
+			"queries": None if None in queries else sum(queries),
+		}
+
+	def save_member_profile(self):
+		return self._post("agas.api.save_member_profile", {"data": {
+			"first_name": "Bench",
+			"middle_name": str(self.fixture.index),
+			"last_name": "User",
+			"city": "Agas",
+			"pincode": "388130",
+		}})
+
+	def save_family_member(self):
+		data = {
+			"first_name": "Bench Child",
+			"last_name": str(self.fixture.index),
+			"relation_with_head_member": "Son",
+			"adultchild": "Child",
+			"id_proof_type": "Aadhar",
+			"id_proof": BENCH_FILE,
+			"photo": BENCH_FILE,
+		}
+		if self.family_member:
+			data["name"] = self.family_member
+
+		sample, response = self._post("agas.api.save_family_member", {"data": data}, with_response=True)
+		if response.ok and not self.family_member:
+			self.family_member = response.json()["message"]["name"]
+		return sample
+
+	def register_for_event(self):
+		modified = self.fixture.registration_modified
+		sample, response = self._post("agas.api.register_for_event", {"data": {
+			"event": BENCH_EVENT,
+			"first_name": "Bench",
+			"last_name": "User",
+			"email": self.fixture.email,
+			"stay_required": "No",
+			"food_required": "No",
+			"no_of_visitors": 1,
+			"modified": str(modified) if modified else None,
+		}}, with_response=True)
+		if response.ok:
+			self.fixture.registration_modified = response.json()["message"]["modified"]
+		return sample
+
+	def events_page(self):
+		return self._get("/events")
+
+	def member_profile_page(self):
+		return self._get("/member_profile")
+
+	def event_registration_page(self):
+		return self._get("/event_registration", params={"event": BENCH_EVENT})
+
+	def _post(self, method, payload, with_response=False):
+		headers = {"X-Frappe-CSRF-Token": self.csrf_token} if self.csrf_token else {}
+		started = time.perf_counter()
+		response = self.session.post(f"{self.base_url}/api/method/{method}", json=payload,
+			headers=headers, timeout=REQUEST_TIMEOUT)
+		sample = _sample(response, started)
+		return (sample, response) if with_response else sample
+
+	def _get(self, path, params=None):
+		started = time.perf_counter()
+		response = self.session.get(f"{self.base_url}{path}", params=params, timeout=REQUEST_TIMEOUT)
+		return _sample(response, started)
+
+def _sample(response, started):
+	return {
+		"ms": (time.perf_counter() - started) * 1000,
+		"ok": response.ok,
+		"queries": _queries(response),
+	}
+
+def _queries(response):
+	match = _SERVER_TIMING_QUERIES.search(response.headers.get("Server-Timing", ""))
+	return int(match.group(1)) if match else None
@@ -0,0 +1,153 @@
+import json
+import random
+import statistics
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+import frappe
+from frappe.utils import getdate
+
+from agas import meal_plan
+from agas.benchmarks.load_test import BENCH_EVENT, setup_fixtures
+from agas.instrumentation import percentile
+
+def run(members=10, days=14, iterations=30, registrations=1000, seed=7):
+	"""
+	Compares the Event Food Day row model with the meal_plan bitmap for one
+	family stay: storage, payload size, save latency and aggregation time.
+
+	bench --site <site> execute agas.benchmarks.meal_plan.run --kwargs "{'members': 10, 'days': 14}"
+
+	Saves run inside a transaction that is rolled back, so the site is left as
+	it was (apart from the load test fixtures it reuses).
+	"""
+	rng = random.Random(int(seed))
+	members, days, iterations = int(members), int(days), int(iterations)
+	fixture = setup_fixtures(1)[0]
+	start = getdate(frappe.db.get_value("Agas Event", BENCH_EVENT, "event_start_date"))
+	rows = make_rows(rng, members, days, start)
+	plan = meal_plan.encode(rows)
+
+	results = {
+		"rows": len(rows),
+		"storage": storage(rows, plan),
+		"save_ms": save_latency(fixture, rows, iterations),
+		"aggregate_ms": aggregate_time(rng, int(registrations), members, days, start),
+	}
+	print_report(members, days, results)
+	return results
+
+def make_rows(rng, members, days, start):
+	return [{
+		"member_ref": "PRIMARY" if m == 0 else f"FM-{m:05d}",
+		"member_name": f"Member {m}",
+		"date": str(start + timedelta(days=d)),
+		"breakfast": int(rng.random() < 0.8),
+		"lunch": 1,
+		"dinner": int(rng.random() < 0.9),
+	} for m in range(members) for d in range(days)]
+
+def storage(rows, plan):
+	"""
+	Bytes on the wire (JSON) and an estimate of bytes in the database: the
+	table's average row length times the row count for the row model, the
+	column value for the bitmap.
+	"""
+	avg_row_length = frappe.db.sql("""
+		select avg_row_length from information_schema.tables
+		where table_schema = database() and table_name = 'tabEvent Food Day'
+	""")
+	row_bytes = (avg_row_length[0][0] if avg_row_length and avg_row_length[0][0] else None)
+	return {
+		"rows_payload_bytes": len(json.dumps(rows, separators=(",", ":"))),
+		"bitmap_payload_bytes": len(meal_plan.dumps(plan)),
+		"rows_db_bytes": row_bytes * len(rows) if row_bytes else None,
+		"bitmap_db_bytes": len(meal_plan.dumps(plan)),
+	}
+
+def save_latency(fixture, rows, iterations):
+	"""
+	Times a full Event Registration save with the food schedule as child rows
+	and as a bitmap, plus the single column write used by patch_registration.
+	"""
+	frappe.set_user(fixture.email)
+	timings = {"rows": [], "bitmap": [], "bitmap_patch": []}
+	try:
+		doc = frappe.get_doc({
+			"doctype": "Event Registration",
+			"event": BENCH_EVENT,
+			"user": fixture.email,
+			"first_name": "Bench",
+			"last_name": "Meals",
+			"email": fixture.email,
+			"food_required": "Yes",
+			"status": "Draft",
+		}).insert(ignore_permissions=True)
+
+		for _ in range(iterations):
+			started = time.perf_counter()
+			doc.set("food_schedule", [{"doctype": "Event Food Day", **row} for row in rows])
+			doc.meal_plan = None
+			doc.save(ignore_permissions=True)
+			timings["rows"].append((time.perf_counter() - started) * 1000)
+
+			started = time.perf_counter()
+			doc.set("food_schedule", [])
+			doc.meal_plan = meal_plan.dumps(meal_plan.encode(rows))
+			doc.save(ignore_permissions=True)
+			timings["bitmap"].append((time.perf_counter() - started) * 1000)
+
+			started = time.perf_counter()
+			frappe.db.set_value("Event Registration", doc.name, "meal_plan",
+				meal_plan.dumps(meal_plan.apply_changes(doc.meal_plan, {"set": rows[:1]})))
+			timings["bitmap_patch"].append((time.perf_counter() - started) * 1000)
+	finally:
+		frappe.db.rollback()
+		frappe.set_user("Administrator")
+
+	return {model: _summary(values) for model, values in timings.items()}
+
+def aggregate_time(rng, registrations, members, days, start):
+	"""
+	Per day meal counts over many registrations: summing expanded rows versus
+	walking the set bits of each bitmap.
+	"""
+	all_rows = [make_rows(rng, rng.randint(1, members), days, start) for _ in range(registrations)]
+	plans = [meal_plan.encode(rows) for rows in all_rows]
+
+	started = time.perf_counter()
+	counts = defaultdict(lambda: defaultdict(int))
+	for rows in all_rows:
+		for row in rows:
+			for meal, _ in meal_plan.MEALS:
+				counts[row["date"]][meal] += row[meal]
+	rows_ms = (time.perf_counter() - started) * 1000
+
+	started = time.perf_counter()
+	bitmap_counts = meal_plan.daily_meal_counts(plans)
+	bitmap_ms = (time.perf_counter() - started) * 1000
+
+	if {date: dict(meals) for date, meals in counts.items()} != bitmap_counts:
+		frappe.throw("Bitmap aggregation does not match the row model", frappe.ValidationError)
+
+	return {"registrations": registrations, "rows": round(rows_ms, 2), "bitmap": round(bitmap_ms, 2)}
+
+def print_report(members, days, results):
+	storage = results["storage"]
+	print(f"Food schedule for {members} members x {days} days ({results['rows']} rows)")
+	print(f"  payload:  rows {storage['rows_payload_bytes']} B, bitmap {storage['bitmap_payload_bytes']} B")
+	print(f"  database: rows {storage['rows_db_bytes'] or '-'} B, bitmap {storage['bitmap_db_bytes']} B")
+	for model, summary in results["save_ms"].items():
+		print(f"  save ({model}): p50 {summary['p50']} ms, p99 {summary['p99']} ms, mean {summary['mean']} ms")
+	aggregate = results["aggregate_ms"]
+	print(f"  aggregate {aggregate['registrations']} registrations: rows {aggregate['rows']} ms, "
+		f"bitmap {aggregate['bitmap']} ms")
+
+def _summary(values):
+	values = sorted(values)
+	return {
+		"p50": round(percentile(values, 50), 2),
+		"p99": round(percentile(values, 99), 2),
+		"mean": round(statistics.fmean(values), 2) if values else 0,
+	}
@@ -0,0 +1,110 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import frappe
+from frappe.utils import get_url
+
+from agas.benchmarks.load_test import BENCH_EVENT, REQUEST_TIMEOUT, BenchClient, setup_fixtures, summarize
+from agas.instrumentation import percentile
+
+SAMPLE_INTERVAL = 0.2  # seconds between Threads_running samples
+
+def run(base_url=None, users=200, rate=120):
+	"""
+	Simulates a registration opening: `users` virtual users arrive at once and
+	each registers for the benchmark event. The rush runs twice, without a
+	waiting room and with `rate` admissions per minute, while MariaDB's
+	Threads_running and the registrations in flight are sampled.
+
+	bench --site <site> execute agas.benchmarks.waiting_room.run --kwargs "{'users': 200, 'rate': 120}"
+
+	With the waiting room on, the rush takes about users / rate minutes.
+	"""
+	base_url = (base_url or get_url()).rstrip("/")
+	users, rate = int(users), int(rate)
+	fixtures = setup_fixtures(users)
+
+	results = {}
+	try:
+		for label, event_rate in (("no waiting room", 0), (f"waiting room {rate}/min", rate)):
+			set_rate(event_rate)
+			print(f"Running rush of {users} users, {label}...")
+			results[label] = rush(base_url, fixtures)
+	finally:
+		set_rate(0)
+
+	print_report(results)
+	return results
+
+def set_rate(rate):
+	frappe.db.set_value("Agas Event", BENCH_EVENT, "waiting_room_rate", rate)
+	frappe.db.commit()
+	frappe.clear_document_cache("Agas Event", BENCH_EVENT)
+
+def rush(base_url, fixtures):
+	cache = frappe.cache()
+	lock = threading.Lock()
+	state = {"in_flight": 0, "peak_in_flight": 0}
+	samples = []
+	waits = []
+
+	def user(fixture):
+		client = BenchClient(base_url, fixture, cache)
+		client.login()
+
+		started = time.perf_counter()
+		while True:
+			response = client.session.get(f"{base_url}/api/method/agas.waiting_room.check_in_line",
+				params={"event": BENCH_EVENT}, timeout=REQUEST_TIMEOUT)
+			line = (response.json().get("message") or {}) if response.ok else {}
+			if not response.ok or line.get("admitted"):
+				break
+			time.sleep(line.get("poll_interval", 5))
+		waited = time.perf_counter() - started
+
+		with lock:
+			state["in_flight"] += 1
+			state["peak_in_flight"] = max(state["peak_in_flight"], state["in_flight"])
+		try:
+			sample = client.register_for_event()
+		finally:
+			with lock:
+				state["in_flight"] -= 1
+		with lock:
+			samples.append(sample)
+			waits.append(waited)
+
+	threads_running = []
+	started = time.perf_counter()
+	with ThreadPoolExecutor(max_workers=len(fixtures)) as pool:
+		futures = [pool.submit(user, fixture) for fixture in fixtures]
+		while not all(future.done() for future in futures):
+			status = frappe.db.sql("show global status like 'Threads_running'")
+			threads_running.append(int(status[0][1]) if status else 0)
+			time.sleep(SAMPLE_INTERVAL)
+		for future in futures:
+			future.result()
+	wall_time = time.perf_counter() - started
+
+	threads_running.sort()
+	waits.sort()
+	return {
+		**summarize(samples, wall_time),
+		"peak_in_flight": state["peak_in_flight"],
+		"threads_running_p50": percentile(threads_running, 50),
+		"threads_running_max": threads_running[-1] if threads_running else 0,
+		"wait_p50_s": round(percentile(waits, 50), 1),
+		"wait_max_s": round(waits[-1], 1) if waits else 0,
+		"wall_s": round(wall_time, 1),
+	}
+
+def print_report(results):
+	header = (f"{'run':<26}{'errors':>8}{'p50 ms':>10}{'p99 ms':>10}{'in flight':>11}"
+		f"{'db p50':>8}{'db max':>8}{'wait p50 s':>12}{'wall s':>9}")
+	print(header)
+	print("-" * len(header))
+	for label, r in results.items():
+		print(f"{label:<26}{r['errors']:>8}{r['p50_ms']:>10}{r['p99_ms']:>10}{r['peak_in_flight']:>11}"
+			f"{r['threads_running_p50']:>8}{r['threads_running_max']:>8}{r['wait_p50_s']:>12}{r['wall_s']:>9}")
+	print("in flight: most register_for_event calls running at once; db: MariaDB Threads_running")
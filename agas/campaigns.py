@@ -0,0 +1,341 @@
+import time
+
+import frappe
+from frappe.utils import add_to_date, cint, now_datetime
+
+# Campaign delivery settings (site config keys)
+DEFAULT_RATE_PER_MINUTE = 600  # agas_campaign_rate_per_minute: across all workers of a campaign
+DEFAULT_WORKERS = 4  # agas_campaign_workers: batch jobs running in parallel per campaign
+BATCH_SIZE = 200  # messages a worker claims per job
+MAX_ATTEMPTS = 3  # failed messages are retried on resume until they reach this
+BATCH_TIMEOUT = 3600
+# A claim older than this cannot belong to a running job (the job would have timed out)
+CLAIM_LEASE = BATCH_TIMEOUT
+# Each of the agas_campaign_workers slots is held in Redis by the job chain running in it.
+# The lease outlives a job's timeout a little, so a re-enqueued job waiting in the queue keeps it.
+SLOT_KEY = "agas_campaign_worker|{campaign}|{worker}"
+SLOT_LEASE = BATCH_TIMEOUT + 600
+
+@frappe.whitelist()
+def start_campaign(campaign):
+	"""
+	Resolves the recipients of a Draft campaign, queues one message per unique
+	address and starts the batch workers.
+	"""
+	frappe.only_for("System Manager")
+	doc = frappe.get_doc("Agas Campaign", campaign)
+	if doc.status != "Draft":
+		frappe.throw("Only draft campaigns can be started. Use resume for a paused campaign.", frappe.ValidationError)
+
+	# Render up front so a template error is reported before anything is queued
+	render_templates(doc, {row.language for row in doc.templates} | {frappe.db.get_default("lang") or "en"})
+
+	recipients = resolve_recipients(doc.event, doc.channel, _statuses(doc))
+	now = now_datetime()
+	frappe.db.bulk_insert("Agas Campaign Message",
+		["name", "creation", "modified", "owner", "modified_by", "campaign", "registration",
+			"recipient", "recipient_name", "language", "status", "attempts"],
+		[[frappe.generate_hash(length=12), now, now, frappe.session.user, frappe.session.user, doc.name,
+			r.registration, r.recipient, r.recipient_name, r.language, "Queued", 0] for r in recipients])
+
+	doc.db_set({"status": "Sending", "started_at": now, "completed_at": None})
+	update_progress(doc.name)
+	frappe.db.commit()
+
+	dispatch(doc.name)
+	return get_progress(doc.name)
+
+@frappe.whitelist()
+def pause_campaign(campaign):
+	"""
+	Stops the workers after the message they are sending. Unsent messages stay
+	queued for resume_campaign.
+	"""
+	frappe.only_for("System Manager")
+	frappe.db.set_value("Agas Campaign", campaign, "status", "Paused")
+	frappe.db.commit()
+	return get_progress(campaign)
+
+@frappe.whitelist()
+def resume_campaign(campaign, retry_failed=1):
+	"""
+	Restarts delivery of a paused or interrupted campaign. Messages left in
+	Sending by a worker that died are queued again, and so are failed messages
+	that have not used up their attempts (unless `retry_failed` is 0).
+	"""
+	frappe.only_for("System Manager")
+	status = frappe.db.get_value("Agas Campaign", campaign, "status", for_update=True)
+	if status == "Draft":
+		frappe.throw("The campaign has not been started yet", frappe.ValidationError)
+
+	# Nothing is sending while a campaign is paused or completed, so any claim still held
+	# belongs to a worker that is gone. While it is sending, only claims past their lease do.
+	conditions = ["status = 'Sending'"]
+	if status == "Sending":
+		conditions[0] += " and (claimed_at is null or claimed_at < %(lease_expired)s)"
+	if cint(retry_failed):
+		conditions.append("status = 'Failed' and attempts < %(max_attempts)s")
+	requeue = " or ".join(f"({condition})" for condition in conditions)
+	frappe.db.sql(f"""
+		update `tabAgas Campaign Message`
+		set status = 'Queued', batch = null, claimed_at = null
+		where campaign = %(campaign)s and ({requeue})
+	""", {
+		"campaign": campaign,
+		"lease_expired": add_to_date(now_datetime(), seconds=-CLAIM_LEASE),
+		"max_attempts": MAX_ATTEMPTS,
+	})
+
+	frappe.db.set_value("Agas Campaign", campaign, {"status": "Sending", "completed_at": None})
+	update_progress(campaign)
+	frappe.db.commit()
+
+	dispatch(campaign)
+	return get_progress(campaign)
+
+@frappe.whitelist()
+def get_progress(campaign):
+	frappe.only_for("System Manager")
+	return frappe.db.get_value("Agas Campaign", campaign,
+		["name", "status", "total_recipients", "sent_count", "failed_count", "pending_count",
+			"started_at", "completed_at"], as_dict=True)
+
+def resolve_recipients(event, channel, statuses):
+	"""
+	Returns one recipient per unique email address (Email) or mobile number
+	(SMS) among the event's registrations and their visiting family members,
+	loaded with a single query. The registrant's language is used for their
+	family members too.
+	"""
+	rows = frappe.db.sql("""
+		select
+			reg.name as registration, reg.email, reg.mobile_no,
+			reg.first_name, reg.last_name, usr.language,
+			member.first_name as member_first_name, member.last_name as member_last_name,
+			coalesce(nullif(family.contact_no, ''), member.mobile_no) as member_mobile_no
+		from `tabEvent Registration` reg
+		left join `tabUser` usr on usr.name = reg.user
+		left join `tabEvent Registration Member` member
+			on member.parent = reg.name and member.parenttype = 'Event Registration' and member.is_visiting = 1
+		left join `tabFamily Member` family on family.name = member.family_member
+		where reg.event = %s and reg.status in %s
+		order by reg.name, member.idx
+	""", (event, statuses), as_dict=True)
+
+	default_language = frappe.db.get_default("lang") or "en"
+	recipients = {}
+
+	def add(registration, address, first_name, last_name, language):
+		key = normalize_address(address, channel)
+		if key and key not in recipients:
+			recipients[key] = frappe._dict(
+				registration=registration,
+				recipient=key,
+				recipient_name=" ".join(filter(None, [first_name, last_name])),
+				language=language or default_language,
+			)
+
+	for row in rows:
+		if channel == "Email":
+			# Family members have no email of their own
+			add(row.registration, row.email, row.first_name, row.last_name, row.language)
+		else:
+			add(row.registration, row.mobile_no, row.first_name, row.last_name, row.language)
+			add(row.registration, row.member_mobile_no, row.member_first_name, row.member_last_name, row.language)
+
+	return list(recipients.values())
+
+def normalize_address(address, channel):
+	address = (address or "").strip()
+	if channel == "Email":
+		return address.lower() if "@" in address else None
+
+	digits = "".join(ch for ch in address if ch.isdigit())
+	# Treat 98xxxxxxxx, 098xxxxxxxx and 9198xxxxxxxx as the same Indian number
+	if len(digits) > 10 and digits[-10] in "6789" and digits[:-10] in ("0", "91", "091"):
+		digits = digits[-10:]
+	return digits if len(digits) >= 10 else None
+
+def render_templates(doc, languages):
+	"""
+	Renders the campaign once per language: {language: (subject, message)}.
+	Languages without a translation get the default template.
+	"""
+	event = frappe.db.get_value("Agas Event", doc.event,
+		["name", "title", "subtitle", "event_start_date", "event_end_date", "venue"], as_dict=True)
+	translations = {row.language: row for row in doc.templates}
+
+	rendered = {}
+	for language in languages:
+		template = translations.get(language) or doc
+		context = {"event": event, "campaign": doc, "language": language}
+		rendered[language] = (
+			frappe.render_template(template.subject or doc.subject or event.title, context),
+			frappe.render_template(template.message, context),
+		)
+	return rendered
+
+def dispatch(campaign):
+	"""
+	Starts a worker in each slot that has none. Workers still running (e.g.
+	when a campaign is resumed right after a pause) keep their slots, so the
+	number of parallel workers, and with it the send rate, stays within
+	agas_campaign_workers.
+	"""
+	for worker in range(_workers()):
+		slot = frappe.generate_hash(length=12)
+		if _claim_slot(campaign, worker, slot):
+			_enqueue_worker(campaign, worker, slot)
+
+def send_batch(campaign, worker=0, slot=None):
+	"""
+	Background job: claims up to BATCH_SIZE queued messages, sends them at the
+	configured rate and enqueues itself again while messages remain. Each
+	message's status is written as soon as it is sent so a crash re-sends at
+	most one message on resume. A pause releases the rest of the batch.
+	"""
+	if slot is None:
+		# Jobs queued before worker slots existed take one the way dispatch does
+		slot = frappe.generate_hash(length=12)
+		if not _claim_slot(campaign, worker, slot):
+			return
+	if not _holds_slot(campaign, worker, slot):
+		return
+
+	try:
+		result = _send_batch(campaign, worker)
+	except Exception:
+		_release_slot(campaign, worker, slot)
+		raise
+
+	if result == "continue" and _holds_slot(campaign, worker, slot):
+		_enqueue_worker(campaign, worker, slot)
+		return
+
+	_release_slot(campaign, worker, slot)
+	# A resume that came in while this worker was stopping found its slot taken; take the slot up again
+	if result == "stopped" and frappe.db.get_value("Agas Campaign", campaign, "status") == "Sending":
+		slot = frappe.generate_hash(length=12)
+		if _claim_slot(campaign, worker, slot):
+			_enqueue_worker(campaign, worker, slot)
+
+def _send_batch(campaign, worker):
+	"""
+	Sends one batch. Returns "continue" while the campaign is sending, "done"
+	when nothing was left to claim and "stopped" when it was paused.
+	"""
+	doc = frappe.get_doc("Agas Campaign", campaign)
+	if doc.status != "Sending":
+		return "stopped"
+
+	batch = f"{campaign}-{worker}-{frappe.generate_hash(length=8)}"
+	# A single UPDATE claims the rows, so parallel workers never pick the same message
+	frappe.db.sql("""
+		update `tabAgas Campaign Message`
+		set status = 'Sending', batch = %s, claimed_at = %s
+		where campaign = %s and status = 'Queued'
+		order by name
+		limit %s
+	""", (batch, now_datetime(), campaign, BATCH_SIZE))
+	frappe.db.commit()
+
+	messages = frappe.get_all("Agas Campaign Message",
+		filters={"batch": batch, "status": "Sending"},
+		fields=["name", "recipient", "language", "attempts"]
+	)
+	if not messages:
+		finish_if_done(campaign)
+		return "done"
+
+	rendered = render_templates(doc, {m.language for m in messages})
+	rate = cint(frappe.conf.get("agas_campaign_rate_per_minute") or DEFAULT_RATE_PER_MINUTE)
+	delay = 60 * _workers() / rate if rate > 0 else 0
+
+	for message in messages:
+		if frappe.db.get_value("Agas Campaign", campaign, "status") != "Sending":
+			frappe.db.sql("""
+				update `tabAgas Campaign Message` set status = 'Queued', batch = null, claimed_at = null
+				where batch = %s and status = 'Sending'
+			""", batch)
+			break
+
+		started = time.monotonic()
+		subject, content = rendered[message.language]
+		try:
+			send_message(doc.channel, message.recipient, subject, content)
+			values = {"status": "Sent", "sent_at": now_datetime(), "error": None}
+		except Exception as e:
+			values = {"status": "Failed", "error": str(e)[:1000]}
+		values["attempts"] = message.attempts + 1
+		frappe.db.set_value("Agas Campaign Message", message.name, values, update_modified=False)
+		frappe.db.commit()
+
+		time.sleep(max(0, delay - (time.monotonic() - started)))
+
+	update_progress(campaign)
+	frappe.db.commit()
+
+	return "continue" if frappe.db.get_value("Agas Campaign", campaign, "status") == "Sending" else "stopped"
+
+def _workers():
+	return cint(frappe.conf.get("agas_campaign_workers") or DEFAULT_WORKERS)
+
+def _enqueue_worker(campaign, worker, slot):
+	frappe.enqueue("agas.campaigns.send_batch", queue="long", timeout=BATCH_TIMEOUT,
+		campaign=campaign, worker=worker, slot=slot)
+
+def _slot_key(campaign, worker):
+	return frappe.cache().make_key(SLOT_KEY.format(campaign=campaign, worker=worker))
+
+def _claim_slot(campaign, worker, slot):
+	return bool(frappe.cache().set(_slot_key(campaign, worker), slot, nx=True, ex=SLOT_LEASE))
+
+def _holds_slot(campaign, worker, slot):
+	"""
+	Whether the slot still belongs to this job chain; if so its lease is renewed.
+	"""
+	cache = frappe.cache()
+	key = _slot_key(campaign, worker)
+	held = cache.get(key)
+	if (held.decode() if isinstance(held, bytes) else held) != slot:
+		return False
+	cache.expire(key, SLOT_LEASE)
+	return True
+
+def _release_slot(campaign, worker, slot):
+	if _holds_slot(campaign, worker, slot):
+		frappe.cache().delete(_slot_key(campaign, worker))
+
+def send_message(channel, recipient, subject, content):
+	if channel == "Email":
+		frappe.sendmail(recipients=[recipient], subject=subject, message=content, now=True)
+	else:
+		from frappe.core.doctype.sms_settings.sms_settings import send_sms
+
+		send_sms([recipient], content, success_msg=False)
+
+def finish_if_done(campaign):
+	"""
+	Marks the campaign Completed once no message is queued or being sent.
+	"""
+	counts = update_progress(campaign)
+	if not counts.get("Queued") and not counts.get("Sending"):
+		frappe.db.set_value("Agas Campaign", campaign, {"status": "Completed", "completed_at": now_datetime()})
+	frappe.db.commit()
+
+def update_progress(campaign):
+	counts = dict(frappe.db.sql("""
+		select status, count(*) from `tabAgas Campaign Message`
+		where campaign = %s group by status
+	""", campaign))
+	frappe.db.set_value("Agas Campaign", campaign, {
+		"total_recipients": sum(counts.values()),
+		"sent_count": counts.get("Sent", 0),
+		"failed_count": counts.get("Failed", 0),
+		"pending_count": counts.get("Queued", 0) + counts.get("Sending", 0),
+	}, update_modified=False)
+	return counts
+
+def _statuses(doc):
+	statuses = [s.strip() for s in (doc.registration_statuses or "").split(",") if s.strip()]
+	return statuses or ["Registered", "Confirmed"]
@@ -0,0 +1,253 @@
+import unicodedata
+
+import frappe
+from frappe.utils import cint, now_datetime
+
+# Registrations that show up at the gate
+CHECKIN_STATUSES = ("Confirmed",)
+MIN_MOBILE_DIGITS = 4
+
+# Token kinds stored in Gate Search Token.token
+WORD, TRIGRAM, MOBILE, MOBILE_SUFFIX, REGISTRATION = "w:", "t:", "m:", "s:", "r:"
+
+@frappe.whitelist()
+def search_checkin(event, query, limit=20):
+	"""
+	Finds visitors of an event's confirmed registrations by partial name,
+	mobile number or registration id. Returns the best matches first.
+
+	Per query word an exact word scores 3, a word prefix 2 and trigram
+	overlap up to 1.5; mobile and registration id hits score 5 and so
+	outrank any name match. The scores are added up in the database, which
+	returns only the best entries, so the many weak matches of a common
+	surname cannot crowd out exact hits.
+	"""
+	frappe.has_permission("Gate Checkin Entry", "read", throw=True)
+
+	words = tokenize(query)
+	digits = "".join(ch for ch in (query or "") if ch.isdigit())
+	if not words and len(digits) < MIN_MOBILE_DIGITS:
+		return []
+
+	values = {"event": event, "limit": cint(limit) or 20}
+	parts = []
+	for index, word in enumerate(words):
+		grams = trigrams(word)
+		values[f"word{index}"] = WORD + word
+		values[f"prefix{index}"] = like_prefix(WORD + word)
+		values[f"grams{index}"] = tuple(TRIGRAM + gram for gram in grams)
+		# Trigram overlap stays below 2, so it only counts when the word matched nothing better
+		parts.append(f"""
+			select entry, greatest(
+				max(case when token = %(word{index})s then 3 when token like %(prefix{index})s then 2 else 0 end),
+				1.5 * sum(token in %(grams{index})s) / {len(grams)}
+			) as score
+			from `tabGate Search Token`
+			where event = %(event)s and (token like %(prefix{index})s or token in %(grams{index})s)
+			group by entry
+		""")
+	if len(digits) >= MIN_MOBILE_DIGITS:
+		values["mobile"] = like_prefix(MOBILE + digits)
+		values["mobile_suffix"] = like_prefix(MOBILE_SUFFIX + digits[::-1])
+		parts.append("""
+			select distinct entry, 5 as score from `tabGate Search Token`
+			where event = %(event)s and (token like %(mobile)s or token like %(mobile_suffix)s)
+		""")
+	if query and query.strip():
+		values["registration"] = like_prefix(REGISTRATION + query.strip().lower())
+		parts.append("""
+			select distinct entry, 5 as score from `tabGate Search Token`
+			where event = %(event)s and token like %(registration)s
+		""")
+
+	scores = dict(frappe.db.sql(f"""
+		select entry, sum(score) as total from ({" union all ".join(parts)}) parts
+		group by entry
+		having total > 0
+		order by total desc, entry
+		limit %(limit)s
+	""", values))
+	if not scores:
+		return []
+
+	top = list(scores)
+	entries = {row.name: row for row in frappe.get_all("Gate Checkin Entry",
+		filters={"name": ["in", top]},
+		fields=["name", "registration", "person_type", "person_ref", "full_name", "mobile_no",
+			"checked_in", "checked_in_at"]
+	)}
+	results = []
+	for name in top:
+		if name in entries:
+			entries[name]["score"] = round(float(scores[name]), 2)
+			results.append(entries[name])
+	return results
+
+def like_prefix(text):
+	"""
+	A LIKE pattern matching values that start with `text`, taken literally.
+	"""
+	return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+@frappe.whitelist()
+def check_in(entries, undo=0):
+	"""
+	Marks one or more Gate Checkin Entries as arrived (or clears the mark when
+	`undo` is set). Entries already checked in keep their original time.
+	"""
+	frappe.has_permission("Gate Checkin Entry", "write", throw=True)
+	if isinstance(entries, str):
+		entries = frappe.parse_json(entries) if entries.startswith("[") else [entries]
+
+	now = now_datetime()
+	results = []
+	for name in entries:
+		row = frappe.db.get_value("Gate Checkin Entry", name,
+			["name", "full_name", "checked_in", "checked_in_at"], as_dict=True, for_update=True)
+		if not row:
+			frappe.throw(f"Check-in entry {name} not found", frappe.DoesNotExistError)
+
+		if cint(undo):
+			frappe.db.set_value("Gate Checkin Entry", name,
+				{"checked_in": 0, "checked_in_at": None, "checked_in_by": None})
+			row.checked_in, row.checked_in_at = 0, None
+		elif not row.checked_in:
+			frappe.db.set_value("Gate Checkin Entry", name,
+				{"checked_in": 1, "checked_in_at": now, "checked_in_by": frappe.session.user})
+			row.checked_in, row.checked_in_at = 1, now
+		results.append(row)
+
+	frappe.db.commit()
+	return results
+
+def reindex_registration(registration):
+	"""
+	Rebuilds the gate entries and search tokens of one registration. Arrival
+	marks already recorded for a person are carried over.
+	"""
+	existing = frappe.get_all("Gate Checkin Entry",
+		filters={"registration": registration},
+		fields=["name", "person_ref", "checked_in", "checked_in_at", "checked_in_by"]
+	)
+	_delete_entries([row.name for row in existing])
+
+	reg = frappe.db.get_value("Event Registration", registration,
+		["name", "event", "status", "first_name", "middle_name", "last_name", "mobile_no"], as_dict=True)
+	if not reg or reg.status not in CHECKIN_STATUSES:
+		return
+
+	people = [frappe._dict(
+		person_type="Primary",
+		person_ref="PRIMARY",
+		full_name=_full_name(reg),
+		mobile_no=reg.mobile_no,
+	)]
+	members = frappe.get_all("Event Registration Member",
+		filters={"parent": registration, "parenttype": "Event Registration", "is_visiting": 1},
+		fields=["family_member", "first_name", "middle_name", "last_name", "mobile_no"],
+		order_by="idx asc"
+	)
+	# Prefer the current Family Member record over the copy taken at registration time
+	live = {row.name: row for row in frappe.get_all("Family Member",
+		filters={"name": ["in", [m.family_member for m in members if m.family_member] or [""]]},
+		fields=["name", "first_name", "middle_name", "last_name", "contact_no"]
+	)}
+	for member in members:
+		current = live.get(member.family_member)
+		people.append(frappe._dict(
+			person_type="Family",
+			person_ref=member.family_member,
+			full_name=_full_name(current or member),
+			mobile_no=(current.contact_no if current else None) or member.mobile_no,
+		))
+
+	previous = {row.person_ref: row for row in existing}
+	now = now_datetime()
+	entry_rows, token_rows = [], []
+	for person in people:
+		arrived = previous.get(person.person_ref) or frappe._dict()
+		entry = frappe.generate_hash(length=12)
+		entry_rows.append([entry, now, now, "Administrator", "Administrator", reg.event, reg.name,
+			person.person_type, person.person_ref, person.full_name, person.mobile_no,
+			cint(arrived.checked_in), arrived.checked_in_at, arrived.checked_in_by])
+		for token in person_tokens(person, reg.name):
+			token_rows.append([frappe.generate_hash(length=12), now, now, reg.event, entry, token])
+
+	frappe.db.bulk_insert("Gate Checkin Entry",
+		["name", "creation", "modified", "owner", "modified_by", "event", "registration",
+			"person_type", "person_ref", "full_name", "mobile_no", "checked_in", "checked_in_at", "checked_in_by"],
+		entry_rows)
+	frappe.db.bulk_insert("Gate Search Token",
+		["name", "creation", "modified", "event", "entry", "token"],
+		token_rows)
+
+def rebuild_index(event=None):
+	"""
+	Backfills the gate index, e.g. after bulk imports that bypass doc events.
+
+	bench --site <site> execute agas.checkin.rebuild_index --kwargs "{'event': '...'}"
+	"""
+	filters = {"status": ["in", CHECKIN_STATUSES]}
+	indexed_filters = {}
+	if event:
+		filters["event"] = event
+		indexed_filters["event"] = event
+
+	# Registrations that are confirmed now, plus those indexed earlier that may no longer be
+	registrations = set(frappe.get_all("Event Registration", filters=filters, pluck="name"))
+	registrations.update(frappe.get_all("Gate Checkin Entry", filters=indexed_filters,
+		pluck="registration", distinct=True))
+
+	for registration in registrations:
+		reindex_registration(registration)
+	frappe.db.commit()
+
+def person_tokens(person, registration):
+	tokens = set()
+	for word in tokenize(person.full_name):
+		tokens.add(WORD + word)
+		tokens.update(TRIGRAM + gram for gram in trigrams(word))
+
+	digits = "".join(ch for ch in (person.mobile_no or "") if ch.isdigit())
+	if digits:
+		tokens.add(MOBILE + digits)
+		tokens.add(MOBILE_SUFFIX + digits[::-1])
+
+	tokens.add(REGISTRATION + registration.lower())
+	return tokens
+
+def tokenize(text):
+	"""
+	Lowercases and splits text into words, keeping letters, combining marks
+	(Gujarati matras) and digits.
+	"""
+	cleaned = "".join(
+		ch if unicodedata.category(ch)[0] in "LMN" else " "
+		for ch in (text or "").casefold()
+	)
+	return [word for word in cleaned.split() if word]
+
+def trigrams(word):
+	padded = f" {word} "
+	return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _full_name(row):
+	return " ".join(filter(None, [row.first_name, row.middle_name, row.last_name]))
+
+def _delete_entries(names):
+	if names:
+		frappe.db.delete("Gate Search Token", {"entry": ["in", names]})
+		frappe.db.delete("Gate Checkin Entry", {"name": ["in", names]})
+
+# Document events
+
+def on_registration_update(doc, method=None):
+	reindex_registration(doc.name)
+
+def on_registration_trash(doc, method=None):
+	_delete_entries(frappe.get_all("Gate Checkin Entry", filters={"registration": doc.name}, pluck="name"))
+
+def on_family_member_update(doc, method=None):
+	for registration in frappe.get_all("Gate Checkin Entry",
+			filters={"person_ref": doc.name}, pluck="registration", distinct=True):
+		reindex_registration(registration)
@@ -1,44 +1,321 @@
+import random
+import time
+from datetime import date, datetime, timedelta
+
 import frappe
-from frappe.utils import add_days, nowdate
-
-def run():
-	events = [
-		{
-			"title": "Maha Shivratri Spiritual Night",
-			"subtitle": "A night of divine connection",
-			"event_date": add_days(nowdate(), 5),
-			"event_time": "18:00:00",
-			"venue": "Main Temple Hall",
-			"published": 1,
-			"description": "Join us for a powerful night of chanting, meditation, and rituals dedicated to Lord Shiva."
-		},
-		{
-			"title": "Weekend Meditation Retreat",
-			"subtitle": "Reset your mind and soul",
-			"event_date": add_days(nowdate(), 15),
-			"event_time": "06:00:00",
-			"venue": "North Gardens",
-			"published": 1,
-			"description": "A 2-day immersive experience in silence and mindfulness techniques."
-		},
-		{
-			"title": "Annual Satsang Meet",
-			"subtitle": "Community Wisdom Sharing",
-			"event_date": add_days(nowdate(), -10),
-			"event_time": "10:00:00",
-			"venue": "Satsang Bhavan",
-			"published": 1,
-			"description": "A look back at our growth and sharing wisdom for the upcoming year."
-		}
-	]
-
-	for entry in events:
-		if not frappe.db.exists("Agas Event", entry["title"]):
-			doc = frappe.get_doc({
-				"doctype": "Agas Event",
-				**entry
-			})
-			doc.insert()
-	
+
+from agas import analytics, checkin, event_search, meal_plan
+from agas.event_counters import reconcile
+
+# Every generated row is owned by this marker so that `clear()` can remove it again
+SYNTHETIC_OWNER = "synthetic@agas.local"
+SAMPLE_FILE = "/files/agas-sample.png"
+BATCH_SIZE = 5000  # member profiles generated (and committed) per batch
+
+PRESETS = {
+	# bench --site <site> execute agas.create_samples.run
+	"small": {"members": 500, "events": 25, "family_per_member": 3.0, "registrations_per_member": 2.0},
+	# bench --site <site> execute agas.create_samples.run --kwargs "{'preset': 'production'}"
+	"production": {"members": 100_000, "events": 3000, "family_per_member": 3.0, "registrations_per_member": 2.0},
+}
+
+MALE_NAMES = ("Amit", "Bhavesh", "Chirag", "Darshan", "Hardik", "Harsh", "Jignesh", "Ketan", "Mehul",
+	"Nilesh", "Paresh", "Rajesh", "Rakesh", "Sanjay", "Tushar", "Vipul", "Yash", "Dhruv", "Parth", "Kunal")
+FEMALE_NAMES = ("Asha", "Bhavna", "Darshana", "Falguni", "Hetal", "Jalpa", "Kinjal", "Komal", "Mansi",
+	"Nisha", "Pooja", "Riddhi", "Sejal", "Shital", "Trupti", "Urvi", "Vaishali", "Khushi", "Priya", "Hina")
+SURNAMES = ("Patel", "Shah", "Mehta", "Desai", "Joshi", "Trivedi", "Parikh", "Modi", "Bhatt", "Pandya",
+	"Doshi", "Vyas", "Thakkar", "Solanki", "Chauhan", "Gandhi", "Sheth", "Amin", "Dave", "Kothari")
+PLACES = (
+	("Anand", "Gujarat", "388001"), ("Agas", "Gujarat", "388130"), ("Ahmedabad", "Gujarat", "380001"),
+	("Vadodara", "Gujarat", "390001"), ("Surat", "Gujarat", "395003"), ("Rajkot", "Gujarat", "360001"),
+	("Nadiad", "Gujarat", "387001"), ("Bhavnagar", "Gujarat", "364001"), ("Mumbai", "Maharashtra", "400001"),
+	("Pune", "Maharashtra", "411001"), ("Indore", "Madhya Pradesh", "452001"), ("Udaipur", "Rajasthan", "313001"),
+)
+EVENT_KINDS = ("Paryushan Shibir", "Meditation Retreat", "Satsang Meet", "Swadhyay Shibir", "Bhakti Sandhya",
+	"Youth Camp", "Mahavir Jayanti Utsav", "Diwali Satsang", "Guru Purnima Mahotsav", "Dhyan Shibir")
+VENUES = ("Main Temple Hall", "Satsang Bhavan", "North Gardens", "Swadhyay Hall", "Dhyan Kendra")
+RELATIONS = ("Father", "Mother", "Son", "Daughter", "Spouse", "Relative")
+
+def run(preset="small", seed=42, **overrides):
+	"""
+	Generates a deterministic synthetic dataset with bulk inserts: Users,
+	Member Profiles, Family Members, Agas Events and Event Registrations with
+	their Event Registration Member rows and meal plans.
+
+	Use `preset="production"` for ~100k profiles / 300k family members, or pass
+	`members`, `events`, `family_per_member` and `registrations_per_member`
+	directly. Run `clear()` to remove everything generated.
+	"""
+	if preset not in PRESETS:
+		frappe.throw(f"Unknown preset {preset}. Use one of: {', '.join(PRESETS)}", frappe.ValidationError)
+	config = frappe._dict({**PRESETS[preset], **overrides})
+
+	started = time.monotonic()
+	generator = SampleGenerator(int(seed), config)
+	counts = generator.generate()
 	frappe.db.commit()
-	print("Sample events created!")
+	# Bulk inserts skip doc events, so fill the event counters, rollups and search indexes in one pass
+	rebuild_derived()
+
+	summary = ", ".join(f"{count} {doctype}" for doctype, count in counts.items())
+	print(f"Sample data created in {time.monotonic() - started:.1f}s: {summary}")
+	return counts
+
+def clear():
+	"""
+	Deletes all rows created by `run()`.
+	"""
+	for doctype in ("Event Food Day", "Event Registration Member", "Event Registration",
+			"Family Member", "Member Profile", "Agas Event", "User"):
+		frappe.db.delete(doctype, {"owner": SYNTHETIC_OWNER})
+	frappe.db.commit()
+	rebuild_derived()
+	print("Sample data removed")
+
+def rebuild_derived():
+	"""
+	Brings the tables kept up to date by doc events in line with the data:
+	event counters, analytics rollups, the gate search index and the event
+	search index.
+	"""
+	reconcile(log=False)
+	analytics.rebuild()
+	checkin.rebuild_index()
+	event_search.rebuild_index()
+
+class SampleGenerator:
+	def __init__(self, seed, config):
+		self.rng = random.Random(seed)
+		self.seed = seed
+		self.config = config
+		self.today = date.today()
+		self.now = datetime.now()
+		self.counts = dict.fromkeys(("User", "Member Profile", "Family Member", "Agas Event",
+			"Event Registration", "Event Registration Member"), 0)
+		self.used_names = set()
+
+	def generate(self):
+		self.events = self.make_events(int(self.config.events))
+		self.insert("Agas Event", self.events)
+
+		members = int(self.config.members)
+		for start in range(0, members, BATCH_SIZE):
+			self.generate_batch(start, min(start + BATCH_SIZE, members))
+			frappe.db.commit()
+			print(f"  {min(start + BATCH_SIZE, members)}/{members} members")
+
+		return self.counts
+
+	def generate_batch(self, start, stop):
+		users, profiles, family, registrations, visitors = [], [], [], [], []
+
+		for i in range(start, stop):
+			user, profile = self.make_member(i)
+			users.append(user)
+			profiles.append(profile)
+
+			members_family = self.make_family(profile, i)
+			family.extend(members_family)
+
+			for event in self.pick_events():
+				reg, reg_visitors = self.make_registration(profile, members_family, event)
+				registrations.append(reg)
+				visitors.extend(reg_visitors)
+
+		self.insert("User", users)
+		self.insert("Member Profile", profiles)
+		self.insert("Family Member", family)
+		self.insert("Event Registration", registrations)
+		self.insert("Event Registration Member", visitors)
+
+	def make_events(self, count):
+		events = []
+		span = 5 * 365  # four years of history and one year ahead
+		for n in range(count):
+			start = self.today - timedelta(days=4 * 365) + timedelta(days=self.rng.randrange(span))
+			kind = self.rng.choice(EVENT_KINDS)
+			title = f"{kind} {start.year} #{n + 1}"
+			events.append(self.row(title, {
+				"title": title,
+				"subtitle": f"{self.rng.choice(('Annual', 'Monthly', 'Special'))} {kind.lower()}",
+				"event_start_date": start,
+				"event_end_date": start + timedelta(days=self.rng.choice((0, 1, 2, 3, 6, 9, 13))),
+				"venue": self.rng.choice(VENUES),
+				"published": 1,
+				"description": f"{kind} at Agas Ashram with satsang, swadhyay and bhakti.",
+			}))
+		return events
+
+	def make_member(self, i):
+		gender = self.rng.choice(("Male", "Female"))
+		first = self.rng.choice(MALE_NAMES if gender == "Male" else FEMALE_NAMES)
+		middle = self.rng.choice(MALE_NAMES)
+		last = self.rng.choice(SURNAMES)
+		email = f"{first}.{last}.{self.seed}.{i}@example.com".lower()
+		dob = self.today - timedelta(days=self.rng.randrange(18 * 365, 80 * 365))
+		city, state, pincode = self.rng.choice(PLACES)
+
+		user = self.row(email, {
+			"email": email,
+			"first_name": first,
+			"last_name": last,
+			"enabled": 1,
+			"user_type": "Website User",
+		})
+		profile = self.row(self.unique_name(f"{first}_{middle}_{last}"), {
+			"first_name": first,
+			"middle_name": middle,
+			"last_name": last,
+			"gender": gender,
+			"date_of_birth": dob,
+			"age": (self.today - dob).days // 365,
+			# 7919 is coprime with 10^9, so every member gets a distinct number
+			"mobile_no": f"9{(self.seed * 1_000_003 + i * 7919) % 10**9:09d}",
+			"email_id": email,
+			"id_proof_type": self.rng.choice(("Aadhar", "Aadhar", "Aadhar", "Passport", "Driving License")),
+			"id_proof": SAMPLE_FILE,
+			"photo": SAMPLE_FILE,
+			"outside_india": 0,
+			"address_line_1": f"{self.rng.randint(1, 300)}, {self.rng.choice(('Shanti', 'Prabhu', 'Sahaj'))} Society",
+			"city": city,
+			"agas_state": state,
+			"pincode": pincode,
+			"country": "India",
+			"user": email,
+		})
+		return user, profile
+
+	def make_family(self, profile, i):
+		family = []
+		count = min(int(self.rng.expovariate(1 / self.config.family_per_member)), 10)
+		for n in range(count):
+			relation = self.rng.choice(RELATIONS)
+			gender = "Female" if relation in ("Mother", "Daughter") else self.rng.choice(("Male", "Female"))
+			first = self.rng.choice(MALE_NAMES if gender == "Male" else FEMALE_NAMES)
+			if relation in ("Son", "Daughter"):
+				dob = self.today - timedelta(days=self.rng.randrange(365, 30 * 365))
+			else:
+				dob = self.today - timedelta(days=self.rng.randrange(20 * 365, 85 * 365))
+			age = (self.today - dob).days // 365
+			adultchild = "Child" if age < 18 else ("Senior Citizen" if age >= 60 else "Adult")
+			family.append(self.row(self.unique_name(f"FAM-{profile['name']}-{first}-{n + 1:04d}"), {
+				"primary_member": profile["name"],
+				"first_name": first,
+				"middle_name": profile["middle_name"] if relation in ("Son", "Daughter") else "",
+				"last_name": profile["last_name"],
+				"relation_with_head_member": relation,
+				"gender": gender,
+				"dob": dob,
+				"age": age,
+				"contact_no": f"8{(self.seed * 1_000_003 + i * 11 + n) % 10**9:09d}" if adultchild == "Adult" else None,
+				"adultchild": adultchild,
+				"id_proof_type": "Aadhar",
+				"id_proof": SAMPLE_FILE,
+				"photo": SAMPLE_FILE,
+				"are_you_a_resident_of_ashram": "No",
+			}))
+		return family
+
+	def pick_events(self):
+		count = min(int(self.rng.expovariate(1 / self.config.registrations_per_member)), len(self.events))
+		return self.rng.sample(self.events, count)
+
+	def make_registration(self, profile, family, event):
+		start, end = event["event_start_date"], event["event_end_date"]
+		is_past = end < self.today
+		if is_past:
+			status = self.rng.choices(("Completed", "Cancelled", "Registered"), (80, 12, 8))[0]
+		else:
+			status = self.rng.choices(("Draft", "Registered", "Confirmed", "Cancelled"), (20, 45, 30, 5))[0]
+
+		stay = self.rng.random() < 0.6
+		food = self.rng.random() < 0.5
+		visiting = self.rng.sample(family, min(len(family), self.rng.randint(0, len(family))))
+		reg_name = self.unique_name(f"EV-REG-{event['name']}-{profile['first_name']}-001")
+
+		reg = self.row(reg_name, {
+			"first_name": profile["first_name"],
+			"middle_name": profile["middle_name"],
+			"last_name": profile["last_name"],
+			"email": profile["email_id"],
+			"mobile_no": profile["mobile_no"],
+			"user": profile["user"],
+			"event": event["name"],
+			"date_of_visit": start,
+			"check_in_date": start,
+			"check_out_date": end,
+			"stay_required": "Yes" if stay else "No",
+			"no_of_visitors": 1 + len(visiting),
+			"no_of_rooms": max(1, (1 + len(visiting)) // 3) if stay else 0,
+			"food_required": "Yes" if food else "No",
+			"status": status,
+			"cancellation_reason": "Change of plans" if status == "Cancelled" else None,
+		})
+
+		visitors = []
+		for idx, member in enumerate(visiting, 1):
+			visitors.append(self.child_row(reg_name, "visitor_members", idx, {
+				"family_member": member["name"],
+				"first_name": member["first_name"],
+				"middle_name": member["middle_name"],
+				"last_name": member["last_name"],
+				"relation": member["relation_with_head_member"],
+				"mobile_no": member["contact_no"],
+				"is_visiting": 1,
+				"visit_from_date": start,
+				"visit_to_date": end,
+			}))
+
+		food_rows = []
+		if food:
+			people = [("PRIMARY", f"{profile['first_name']} {profile['last_name']}")]
+			people += [(m["name"], f"{m['first_name']} {m['last_name']}") for m in visiting]
+			days = (end - start).days + 1
+			for member_ref, member_name in people:
+				for d in range(days):
+					food_rows.append({
+						"member_ref": member_ref,
+						"member_name": member_name,
+						"date": start + timedelta(days=d),
+						"breakfast": int(self.rng.random() < 0.8),
+						"lunch": 1,
+						"dinner": int(self.rng.random() < 0.9),
+					})
+		# Set on every row: bulk inserts take their columns from the first one
+		reg["meal_plan"] = meal_plan.dumps(meal_plan.encode(food_rows))
+
+		return reg, visitors
+
+	def row(self, name, values):
+		created = self.now - timedelta(seconds=self.rng.randrange(4 * 365 * 86400))
+		return {
+			"name": name,
+			"owner": SYNTHETIC_OWNER,
+			"modified_by": SYNTHETIC_OWNER,
+			"creation": created,
+			"modified": created,
+			"docstatus": 0,
+			"idx": 0,
+			**values,
+		}
+
+	def child_row(self, parent, parentfield, idx, values):
+		row = self.row(f"{self.rng.getrandbits(56):014x}", values)
+		row.update({"parent": parent, "parenttype": "Event Registration", "parentfield": parentfield, "idx": idx})
+		return row
+
+	def unique_name(self, name):
+		# Mirrors Frappe's autoname suffixing when an expression collides
+		candidate, n = name, 1
+		while candidate in self.used_names:
+			n += 1
+			candidate = f"{name}-{n}"
+		self.used_names.add(candidate)
+		return candidate
+
+	def insert(self, doctype, rows):
+		if not rows:
+			return
+		fields = list(rows[0].keys())
+		frappe.db.bulk_insert(doctype, fields, [[row.get(f) for f in fields] for row in rows])
+		self.counts[doctype] += len(rows)
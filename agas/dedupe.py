@@ -0,0 +1,260 @@
+import time
+import unicodedata
+from collections import defaultdict, namedtuple
+from difflib import SequenceMatcher
+from itertools import combinations
+
+import frappe
+from frappe.utils import now_datetime
+
+from agas import analytics
+from agas.campaigns import normalize_address
+from agas.checkin import reindex_registration, tokenize
+
+MAX_BLOCK_SIZE = 100  # larger blocks (very common names, shared office numbers) are skipped
+REVIEW_THRESHOLD = 0.75  # pairs scoring at least this are queued for review
+
+# Score weights. A gender mismatch rules a pair out, a different date of birth counts against it.
+NAME_WEIGHT = 0.6
+DOB_WEIGHT = 0.25
+MOBILE_WEIGHT = 0.15
+PHONETIC_NAME_SIMILARITY = 0.9  # names with the same phonetic key score at least this
+
+# Latin spellings of Indian names folded together, applied in order
+PHONETIC_RULES = (
+	("aa", "a"), ("ee", "i"), ("ii", "i"), ("oo", "u"), ("uu", "u"), ("ou", "u"),
+	("sh", "s"), ("ph", "f"), ("bh", "b"), ("dh", "d"), ("gh", "g"), ("jh", "j"), ("kh", "k"),
+	("th", "t"), ("ch", "c"), ("w", "v"), ("z", "j"), ("y", "i"), ("q", "k"),
+)
+
+# Fields copied onto the kept record when it has none: Family Member field -> kept field
+MERGE_FIELDS = {
+	"Family Member": {"dob": "dob", "age": "age", "gender": "gender", "contact_no": "contact_no",
+		"adultchild": "adultchild", "id_proof_type": "id_proof_type", "id_proof": "id_proof", "photo": "photo"},
+	"Member Profile": {"dob": "date_of_birth", "age": "age", "gender": "gender", "contact_no": "mobile_no",
+		"id_proof_type": "id_proof_type", "id_proof": "id_proof", "photo": "photo"},
+}
+
+Person = namedtuple("Person", "doctype name label full_name phonetic dob mobile gender household")
+
+def find_duplicates():
+	"""
+	Full pass over Member Profiles and Family Members. People are grouped by
+	blocking keys (mobile, date of birth + initial, phonetic name) and only
+	pairs sharing a block are scored, so the work grows with block sizes
+	rather than n². New pairs above REVIEW_THRESHOLD are added to the Agas
+	Duplicate Candidate review queue; pairs already queued or decided are left
+	alone. Runs weekly.
+
+	bench --site <site> execute agas.dedupe.find_duplicates
+	"""
+	started = time.monotonic()
+	people = load_people()
+
+	blocks = defaultdict(list)
+	for index, person in enumerate(people):
+		for key in blocking_keys(person):
+			blocks[key].append(index)
+
+	seen = set()
+	candidates = []
+	skipped_blocks = 0
+	for members in blocks.values():
+		if len(members) > MAX_BLOCK_SIZE:
+			skipped_blocks += 1
+			continue
+		for pair in combinations(members, 2):
+			if pair in seen:
+				continue
+			seen.add(pair)
+			value, reasons = score(people[pair[0]], people[pair[1]])
+			if value >= REVIEW_THRESHOLD:
+				candidates.append((people[pair[0]], people[pair[1]], value, reasons))
+
+	queued = queue_candidates(candidates)
+	summary = {
+		"people": len(people),
+		"blocks": len(blocks),
+		"skipped_blocks": skipped_blocks,
+		"compared_pairs": len(seen),
+		"candidates": len(candidates),
+		"queued": queued,
+		"seconds": round(time.monotonic() - started, 1),
+	}
+	frappe.logger("agas.dedupe").info(summary)
+	return summary
+
+def load_people():
+	"""
+	Every Member Profile and Family Member as a compact Person tuple. Member
+	Profiles come first so they end up as person A of a pair.
+	"""
+	people = []
+	for name, first, last, dob, mobile, gender in frappe.db.sql("""
+		select name, first_name, last_name, date_of_birth, mobile_no, gender from `tabMember Profile`
+	"""):
+		people.append(make_person("Member Profile", name, first, last, dob, mobile, gender, name))
+	for name, first, last, dob, mobile, gender, household in frappe.db.sql("""
+		select name, first_name, last_name, dob, contact_no, gender, primary_member from `tabFamily Member`
+	"""):
+		people.append(make_person("Family Member", name, first, last, dob, mobile, gender, household))
+	return people
+
+def make_person(doctype, name, first, last, dob, mobile, gender, household):
+	# Middle names are usually the father's name and are often left out, so they are not compared
+	words = tokenize(unicodedata.normalize("NFC", f"{first or ''} {last or ''}"))
+	return Person(
+		doctype=doctype,
+		name=name,
+		label=" ".join(part for part in (first, last) if part),
+		full_name=" ".join(words),
+		phonetic=" ".join(phonetic(word) for word in words),
+		dob=str(dob) if dob else None,
+		mobile=normalize_address(mobile, "SMS"),
+		gender=gender or None,
+		household=household,
+	)
+
+def phonetic(word):
+	"""
+	Folds spelling variants of a name ("Shreeya", "Sriya"; "Bhavesh", "Bavesh")
+	to one key. Gujarati script is reduced to its letters without vowel signs.
+	"""
+	word = unicodedata.normalize("NFKD", word.casefold())
+	if word.isascii():
+		for spelling, folded in PHONETIC_RULES:
+			word = word.replace(spelling, folded)
+		word = word.replace("h", "")
+		# "Rama" and "Ram"
+		if len(word) > 3 and word.endswith("a"):
+			word = word[:-1]
+	else:
+		word = "".join(ch for ch in word if unicodedata.category(ch)[0] == "L")
+
+	collapsed = []
+	for ch in word:
+		if not collapsed or collapsed[-1] != ch:
+			collapsed.append(ch)
+	return "".join(collapsed)
+
+def blocking_keys(person):
+	keys = []
+	if person.mobile:
+		keys.append(f"mobile|{person.mobile}")
+	if person.phonetic:
+		keys.append(f"name|{person.phonetic}")
+		if person.dob:
+			keys.append(f"dob|{person.dob}|{person.phonetic[:1]}")
+	return keys
+
+def score(a, b):
+	"""
+	Returns (score between 0 and 1, reasons) for a candidate pair.
+	"""
+	if a.gender and b.gender and a.gender != b.gender:
+		return 0, []
+
+	reasons = []
+	name_similarity = SequenceMatcher(None, a.full_name, b.full_name).ratio()
+	if a.phonetic and a.phonetic == b.phonetic:
+		name_similarity = max(name_similarity, PHONETIC_NAME_SIMILARITY)
+		reasons.append("same phonetic name")
+	reasons.append(f"name similarity {name_similarity:.2f}")
+	value = NAME_WEIGHT * name_similarity
+
+	if a.dob and b.dob:
+		if a.dob == b.dob:
+			value += DOB_WEIGHT
+			reasons.append("same date of birth")
+		else:
+			value -= DOB_WEIGHT
+			reasons.append("different date of birth")
+	if a.mobile and a.mobile == b.mobile:
+		value += MOBILE_WEIGHT
+		reasons.append("same mobile")
+	return round(max(value, 0), 4), reasons
+
+def queue_candidates(candidates):
+	existing = set(frappe.get_all("Agas Duplicate Candidate", pluck="pair_key"))
+	now = now_datetime()
+	rows = []
+	for a, b, value, reasons in candidates:
+		key = pair_key(a, b)
+		if key in existing:
+			continue
+		existing.add(key)
+		rows.append([frappe.generate_hash(length=12), now, now, "Administrator", "Administrator", key,
+			a.doctype, a.name, a.label, b.doctype, b.name, b.label, value, ", ".join(reasons), "Open"])
+
+	frappe.db.bulk_insert("Agas Duplicate Candidate",
+		["name", "creation", "modified", "owner", "modified_by", "pair_key",
+			"person_a_doctype", "person_a", "person_a_name", "person_b_doctype", "person_b", "person_b_name",
+			"score", "reasons", "status"], rows)
+	frappe.db.commit()
+	return len(rows)
+
+def pair_key(a, b):
+	return f"{a.doctype}:{a.name}|{b.doctype}:{b.name}"
+
+@frappe.whitelist()
+def merge_duplicate(candidate, keep="a"):
+	"""
+	Merges the other person of a queued pair into the one in `keep` ("a" or
+	"b"): blank fields on the kept record are filled in, registrations that
+	listed the merged Family Member are pointed at the kept one (or keep the
+	merged name as their key when a profile is kept), and the merged Family
+	Member is deleted. Member Profiles are tied to user
+	accounts, so a profile can only be the kept side.
+	"""
+	frappe.only_for("System Manager")
+	doc = frappe.get_doc("Agas Duplicate Candidate", candidate)
+	if doc.status != "Open":
+		frappe.throw(f"This pair is already marked {doc.status}", frappe.ValidationError)
+
+	a = (doc.person_a_doctype, doc.person_a)
+	b = (doc.person_b_doctype, doc.person_b)
+	kept, merged = (a, b) if keep == "a" else (b, a)
+	if merged[0] != "Family Member":
+		frappe.throw("A Member Profile cannot be merged away. Keep the profile and merge the family member into it.",
+			frappe.ValidationError)
+
+	merge_family_member(merged[1], *kept)
+	doc.db_set({"status": "Merged", "kept": kept[1]})
+
+	# Other open pairs with the merged record are moot; the next pass finds them again against the kept one
+	for person_doctype, person in (("person_a_doctype", "person_a"), ("person_b_doctype", "person_b")):
+		frappe.db.delete("Agas Duplicate Candidate",
+			{"status": "Open", person_doctype: "Family Member", person: merged[1]})
+	return {"kept": kept[1], "merged": merged[1]}
+
+@frappe.whitelist()
+def dismiss_duplicate(candidate):
+	frappe.only_for("System Manager")
+	frappe.db.set_value("Agas Duplicate Candidate", candidate, "status", "Not Duplicate")
+
+def merge_family_member(family_member, kept_doctype, kept_name):
+	source = frappe.db.get_value("Family Member", family_member, list(MERGE_FIELDS[kept_doctype]), as_dict=True)
+	target = frappe.get_doc(kept_doctype, kept_name)
+	for source_field, target_field in MERGE_FIELDS[kept_doctype].items():
+		if source.get(source_field) and not target.get(target_field):
+			target.set(target_field, source.get(source_field))
+	target.save(ignore_permissions=True)
+
+	registrations = frappe.get_all("Event Registration Member",
+		filters={"family_member": family_member, "parenttype": "Event Registration"},
+		pluck="parent", distinct=True)
+	states_before = {name: analytics.registration_state(name) for name in registrations}
+	# Registration rows keep their names. A profile is not a Family Member, so rows merged into one
+	# keep the merged name as their key: patches match member rows on it and gate check-ins on it.
+	if kept_doctype == "Family Member":
+		frappe.db.sql("""
+			update `tabEvent Registration Member` set family_member = %s
+			where family_member = %s
+		""", (kept_name, family_member))
+	frappe.delete_doc("Family Member", family_member, ignore_permissions=True, force=True)
+
+	# The gate index is keyed on family members and the UPDATE above skips doc events;
+	# the kept person's gender and age may also move the rollups
+	for registration in registrations:
+		reindex_registration(registration)
+		analytics.apply_change(states_before[registration], analytics.registration_state(registration))
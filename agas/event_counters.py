@@ -0,0 +1,170 @@
+from collections import Counter
+
+import frappe
+from frappe.utils import cint
+
+from agas.archive import registration_source
+
+# Counter columns on Agas Event
+COUNTERS = ("registration_count", "registered_visitors", "rooms_requested", "confirmed_count", "cancelled_count")
+
+# Registrations that take up seats (drafts and cancellations do not)
+ACTIVE_STATUSES = ("Registered", "Confirmed", "Completed")
+
+EVENT_LISTING_CACHE_KEY = "agas_event_listing"
+EVENT_LISTING_TTL = 60  # counters in the listing may lag by up to this many seconds
+LISTING_FIELDS = ["title", "subtitle", "event_start_date", "event_end_date", "venue", "image", "description",
+	"capacity", *COUNTERS]
+
+def contribution(status, no_of_visitors=0, no_of_rooms=0, stay_required=None):
+	"""
+	What one registration adds to its event's counters.
+	"""
+	counts = Counter()
+	if status in ACTIVE_STATUSES:
+		counts["registration_count"] = 1
+		counts["registered_visitors"] = cint(no_of_visitors)
+		if stay_required == "Yes":
+			counts["rooms_requested"] = cint(no_of_rooms)
+	if status == "Confirmed":
+		counts["confirmed_count"] = 1
+	elif status == "Cancelled":
+		counts["cancelled_count"] = 1
+	return counts
+
+def group_contribution(status, stay_required, registrations, visitors, rooms):
+	"""
+	What a group of registrations sharing a status and stay choice adds, given
+	their count and summed visitors and rooms.
+	"""
+	counts = contribution(status, visitors, rooms, stay_required)
+	for counter in ("registration_count", "confirmed_count", "cancelled_count"):
+		counts[counter] *= cint(registrations)
+	return counts
+
+def row_contribution(row):
+	if not row:
+		return Counter()
+	return contribution(row.get("status"), row.get("no_of_visitors"), row.get("no_of_rooms"),
+		row.get("stay_required"))
+
+def apply_change(before, after):
+	"""
+	Moves the counters from a registration's previous state to its new one.
+	Either side may be None (insert / delete).
+	"""
+	deltas = {}
+	for row, sign in ((before, -1), (after, 1)):
+		if row and row.get("event"):
+			event_delta = deltas.setdefault(row.get("event"), Counter())
+			for counter, value in row_contribution(row).items():
+				event_delta[counter] += sign * value
+
+	for event, delta in deltas.items():
+		apply_delta(event, delta)
+
+def apply_delta(event, delta):
+	"""
+	Adds to the counters in a single UPDATE, so concurrent registrations
+	never overwrite each other's increments.
+	"""
+	delta = {counter: value for counter, value in delta.items() if value}
+	if not delta:
+		return
+	assignments = ", ".join(f"`{counter}` = `{counter}` + %({counter})s" for counter in delta)
+	frappe.db.sql(f"update `tabAgas Event` set {assignments} where name = %(event)s", {**delta, "event": event})
+
+def shift_status(conditions, values, new_status):
+	"""
+	Counter side of a set-based status UPDATE. Call it in the same transaction
+	just before the UPDATE, with the same WHERE clause on `reg`
+	(`tabEvent Registration`) joined to `ev` (`tabAgas Event`).
+	"""
+	rows = frappe.db.sql(f"""
+		select reg.event, reg.status, reg.stay_required,
+			count(*) as registrations, sum(reg.no_of_visitors) as visitors, sum(reg.no_of_rooms) as rooms
+		from `tabEvent Registration` reg
+		inner join `tabAgas Event` ev on ev.name = reg.event
+		where {conditions}
+		group by reg.event, reg.status, reg.stay_required
+		for update
+	""", values, as_dict=True)
+
+	deltas = {}
+	for row in rows:
+		delta = deltas.setdefault(row.event, Counter())
+		group = (row.stay_required, row.registrations, row.visitors, row.rooms)
+		before = group_contribution(row.status, *group)
+		after = group_contribution(new_status, *group)
+		for counter in COUNTERS:
+			delta[counter] += after[counter] - before[counter]
+
+	for event, delta in deltas.items():
+		apply_delta(event, delta)
+
+def get_event_listing():
+	"""
+	Published events with their counters, cached for EVENT_LISTING_TTL and
+	cleared whenever an event is saved.
+	"""
+	events = frappe.cache().get_value(EVENT_LISTING_CACHE_KEY)
+	if events is None:
+		events = frappe.get_all("Agas Event",
+			filters={"published": 1},
+			fields=LISTING_FIELDS,
+			order_by="event_start_date asc"
+		)
+		for event in events:
+			event.seats_left = max(0, event.capacity - cint(event.registered_visitors)) if event.capacity else None
+		frappe.cache().set_value(EVENT_LISTING_CACHE_KEY, events, expires_in_sec=EVENT_LISTING_TTL)
+	return events
+
+def clear_event_listing(doc=None, method=None):
+	frappe.cache().delete_value(EVENT_LISTING_CACHE_KEY)
+
+def reconcile(fix=True, log=True):
+	"""
+	Recomputes every event's counters from its registrations (archived ones
+	included) with one grouped query and reports (and by default repairs) any
+	drift. Runs nightly.
+
+	bench --site <site> execute agas.event_counters.reconcile
+	"""
+	source = registration_source(["event", "status", "stay_required", "no_of_visitors", "no_of_rooms"])
+	rows = frappe.db.sql(f"""
+		select event, status, stay_required,
+			count(*) as registrations, sum(no_of_visitors) as visitors, sum(no_of_rooms) as rooms
+		from {source}
+		group by event, status, stay_required
+	""", as_dict=True)
+
+	expected = {}
+	for row in rows:
+		expected.setdefault(row.event, Counter()).update(
+			group_contribution(row.status, row.stay_required, row.registrations, row.visitors, row.rooms))
+
+	mismatches = []
+	for event in frappe.get_all("Agas Event", fields=["name", *COUNTERS]):
+		wanted = expected.get(event.name, Counter())
+		drift = {counter: (cint(event[counter]), wanted[counter]) for counter in COUNTERS
+			if cint(event[counter]) != wanted[counter]}
+		if drift:
+			mismatches.append({"event": event.name, "drift": drift})
+			if fix:
+				frappe.db.set_value("Agas Event", event.name,
+					{counter: wanted[counter] for counter in COUNTERS}, update_modified=False)
+
+	if mismatches and log:
+		frappe.log_error(title="Agas Event counter drift", message=frappe.as_json(mismatches, indent=1))
+	if fix:
+		clear_event_listing()
+		frappe.db.commit()
+	return mismatches
+
+# Document events
+
+def on_registration_update(doc, method=None):
+	apply_change(doc.get_doc_before_save(), doc)
+
+def on_registration_trash(doc, method=None):
+	apply_change(doc, None)
@@ -0,0 +1,128 @@
+import gzip
+import hashlib
+import os
+from urllib.parse import unquote
+
+import frappe
+from frappe.utils import cint, getdate
+from frappe.website.page_renderers.base_renderer import BaseRenderer
+from werkzeug.wrappers import Response
+
+# /events/<title> and /events_en/<title>
+LANGUAGE_ROUTES = {"events": "gu", "events_en": "en"}
+TEMPLATES = {
+	"gu": "agas/templates/pages/event_detail.html",
+	"en": "agas/templates/pages/event_detail_en.html",
+}
+PAGE_CACHE_TTL = 7 * 86400  # entries are keyed by `modified`, so this only bounds memory
+GZIP_LEVEL = 9  # compressed once per version, so spend the CPU
+
+# Widths generated for the event image on save
+IMAGE_VARIANT_WIDTHS = (480, 960, 1600)
+IMAGE_VARIANT_QUALITY = 80
+IMAGE_VARIANT_FOLDER = "event-variants"
+IMAGE_SIZES = "(max-width: 900px) 100vw, 900px"
+
+class EventPageRenderer(BaseRenderer):
+	"""
+	Serves event detail pages. The whole page is rendered once per event
+	version, language and login state, gzipped and kept in Redis; requests
+	then only cost one primary key lookup for the event's `modified`.
+	"""
+
+	def can_render(self):
+		prefix, _, title = self.path.partition("/")
+		return prefix in LANGUAGE_ROUTES and bool(title) and "/" not in title
+
+	def render(self):
+		prefix, _, title = self.path.partition("/")
+		language = LANGUAGE_ROUTES[prefix]
+		event = frappe.db.get_value("Agas Event", {"name": unquote(title), "published": 1},
+			["name", "modified", "event_end_date", "image", "image_variants"], as_dict=True)
+		if not event:
+			raise frappe.PageDoesNotExistError
+
+		# The nav differs for guests and the register button disappears once the event is over
+		is_guest = frappe.session.user == "Guest"
+		registration_open = getdate(event.event_end_date) >= getdate()
+		cache_key = (f"agas_event_page|{language}|{cint(is_guest)}|{cint(registration_open)}"
+			f"|{event.name}|{event.modified}")
+		compressed = frappe.cache().get_value(cache_key)
+		from_cache = compressed is not None
+		if not from_cache:
+			html = render_event_page(event.name, language, is_guest, registration_open)
+			compressed = gzip.compress(html.encode(), GZIP_LEVEL)
+			frappe.cache().set_value(cache_key, compressed, expires_in_sec=PAGE_CACHE_TTL)
+
+		headers = {
+			"Vary": "Accept-Encoding, Cookie",
+			"X-From-Cache": str(from_cache),
+		}
+		preload = preload_header(event)
+		if preload:
+			headers["Link"] = preload
+
+		if "gzip" in (frappe.get_request_header("Accept-Encoding") or ""):
+			headers["Content-Encoding"] = "gzip"
+			body = compressed
+		else:
+			body = gzip.decompress(compressed)
+
+		return Response(body, status=200, headers=headers, content_type="text/html; charset=utf-8")
+
+def render_event_page(name, language, is_guest, registration_open):
+	event = frappe.db.get_value("Agas Event", name,
+		["name", "title", "subtitle", "event_start_date", "event_end_date", "venue", "image",
+			"image_variants", "content_html", "description"], as_dict=True)
+	variants = frappe.parse_json(event.image_variants) if event.image_variants else []
+	return frappe.render_template(TEMPLATES[language], {
+		"event": event,
+		"is_guest": is_guest,
+		"registration_open": registration_open,
+		"image_srcset": srcset(variants),
+		"image_sizes": IMAGE_SIZES,
+	})
+
+def srcset(variants):
+	return ", ".join(f"{v['url']} {v['width']}w" for v in variants)
+
+def preload_header(event):
+	if not event.image:
+		return None
+	variants = frappe.parse_json(event.image_variants) if event.image_variants else []
+	if not variants:
+		return f"<{event.image}>; rel=preload; as=image"
+	return (f'<{variants[0]["url"]}>; rel=preload; as=image; '
+		f'imagesrcset="{srcset(variants)}"; imagesizes="{IMAGE_SIZES}"')
+
+def make_image_variants(file_url):
+	"""
+	Writes WebP copies of a public image at IMAGE_VARIANT_WIDTHS (never wider
+	than the original) and returns [{"url", "width"}] from narrowest to
+	widest. Remote or private images get no variants.
+	"""
+	if not file_url or not file_url.startswith("/files/"):
+		return []
+
+	try:
+		from PIL import Image
+
+		path = frappe.get_doc("File", {"file_url": file_url}).get_full_path()
+		folder = frappe.get_site_path("public", "files", IMAGE_VARIANT_FOLDER)
+		os.makedirs(folder, exist_ok=True)
+		stem = hashlib.sha1(file_url.encode()).hexdigest()[:12]
+
+		variants = []
+		with Image.open(path) as image:
+			image = image.convert("RGB")
+			widths = [w for w in IMAGE_VARIANT_WIDTHS if w < image.width] or [image.width]
+			for width in widths:
+				height = round(image.height * width / image.width)
+				filename = f"{stem}-{width}.webp"
+				image.resize((width, height), Image.LANCZOS).save(
+					os.path.join(folder, filename), "WEBP", quality=IMAGE_VARIANT_QUALITY, method=6)
+				variants.append({"url": f"/files/{IMAGE_VARIANT_FOLDER}/{filename}", "width": width})
+		return variants
+	except Exception:
+		frappe.logger("agas.events").warning(f"Could not make image variants for {file_url}")
+		return []
@@ -0,0 +1,153 @@
+import math
+import unicodedata
+from collections import Counter, defaultdict
+
+import frappe
+from frappe.utils import cint, strip_html_tags
+
+from agas.checkin import tokenize
+
+# Indexed fields and how much a word in each counts towards the score
+FIELD_WEIGHTS = {"title": 3.0, "subtitle": 2.0, "description": 1.5, "content": 1.0}
+MAX_PAGE_SIZE = 50
+MIN_PREFIX_LENGTH = 2  # the last query word also matches longer words once it has this many letters
+MAX_TERM_LENGTH = 140
+
+# Common English endings folded so "retreats" finds "retreat". Gujarati words are kept whole.
+ENGLISH_SUFFIXES = ("ing", "es", "ed", "s")
+STOPWORDS = {"a", "an", "and", "at", "for", "in", "of", "on", "the", "to", "with"}
+
+@frappe.whitelist(allow_guest=True)
+def search_events(query, page=1, page_size=10, include_past=1):
+	"""
+	Ranked full-text search over published events (title, subtitle,
+	description, content) in Gujarati and English. The last word is matched as
+	a prefix so results update while typing.
+	"""
+	page = max(cint(page), 1)
+	page_size = min(max(cint(page_size), 1), MAX_PAGE_SIZE)
+	terms = query_terms(query)
+	if not terms:
+		return {"results": [], "total": 0, "page": page, "page_size": page_size}
+
+	# Terms only hold letters, marks and digits, so the prefix needs no LIKE escaping
+	term_conditions = ["st.term in %(terms)s"]
+	values = {"terms": tuple(terms)}
+	if len(terms[-1]) >= MIN_PREFIX_LENGTH:
+		term_conditions.append("st.term like %(prefix)s")
+		values["prefix"] = f"{terms[-1]}%"
+	upcoming_only = "" if cint(include_past) else "and ev.event_end_date >= curdate()"
+
+	rows = frappe.db.sql(f"""
+		select st.event, st.term, st.weight
+		from `tabAgas Event Search Term` st
+		inner join `tabAgas Event` ev on ev.name = st.event
+		where ({" or ".join(term_conditions)}) and ev.published = 1 {upcoming_only}
+	""", values, as_dict=True)
+
+	scores = rank(rows, terms)
+	ranked = sorted(scores, key=lambda event: scores[event], reverse=True)
+	page_events = ranked[(page - 1) * page_size:page * page_size]
+
+	details = {row.name: row for row in frappe.get_all("Agas Event",
+		filters={"name": ["in", page_events or [""]]},
+		fields=["name", "title", "subtitle", "event_start_date", "event_end_date", "venue", "image", "description"]
+	)}
+	results = []
+	for name in page_events:
+		if name in details:
+			details[name]["score"] = round(scores[name], 3)
+			results.append(details[name])
+
+	return {"results": results, "total": len(ranked), "page": page, "page_size": page_size}
+
+def rank(rows, terms):
+	"""
+	BM25-like scoring: each query word adds idf x field-weighted frequency,
+	using the best matching indexed word when the last word is a prefix.
+	Events must match every query word.
+	"""
+	total_events = frappe.db.count("Agas Event", {"published": 1}) or 1
+	events_by_term = defaultdict(set)
+	for row in rows:
+		events_by_term[row.term].add(row.event)
+	idf = {term: math.log(1 + (total_events - len(events) + 0.5) / (len(events) + 0.5))
+		for term, events in events_by_term.items()}
+
+	def matches(word, term, is_last):
+		return term == word or (is_last and len(word) >= MIN_PREFIX_LENGTH and term.startswith(word))
+
+	best = defaultdict(dict)
+	for row in rows:
+		for i, word in enumerate(terms):
+			if matches(word, row.term, i == len(terms) - 1):
+				# Exact words outrank prefix completions
+				score = idf[row.term] * row.weight * (1.0 if row.term == word else 0.7)
+				best[row.event][i] = max(best[row.event].get(i, 0), score)
+
+	return {event: sum(per_word.values()) for event, per_word in best.items() if len(per_word) == len(terms)}
+
+def query_terms(query):
+	seen = []
+	for term in index_terms(query):
+		if term not in seen:
+			seen.append(term)
+	return seen
+
+def index_terms(text):
+	terms = []
+	for word in tokenize(unicodedata.normalize("NFC", text or "")):
+		if word in STOPWORDS:
+			continue
+		terms.append(stem(word)[:MAX_TERM_LENGTH])
+	return terms
+
+def stem(word):
+	if not word.isascii() or not word.isalpha():
+		return word
+	for suffix in ENGLISH_SUFFIXES:
+		if len(word) > len(suffix) + 3 and word.endswith(suffix):
+			return word[:-len(suffix)]
+	return word
+
+def event_terms(event):
+	"""
+	Weighted term frequencies of one event: {term: weight}.
+	"""
+	weights = Counter()
+	for field, field_weight in FIELD_WEIGHTS.items():
+		text = event.get(field) or ""
+		if field == "content":
+			text = strip_html_tags(text)
+		terms = index_terms(text)
+		for term, count in Counter(terms).items():
+			# Dampen repeats so long content does not drown the title
+			weights[term] += field_weight * (1 + math.log(count))
+	return weights
+
+def index_event(name):
+	frappe.db.delete("Agas Event Search Term", {"event": name})
+	event = frappe.db.get_value("Agas Event", name, ["name", *FIELD_WEIGHTS], as_dict=True)
+	if not event:
+		return
+
+	rows = [[frappe.generate_hash(length=12), event.name, term, round(weight, 4)]
+		for term, weight in event_terms(event).items()]
+	frappe.db.bulk_insert("Agas Event Search Term", ["name", "event", "term", "weight"], rows)
+
+def rebuild_index():
+	"""
+	bench --site <site> execute agas.event_search.rebuild_index
+	"""
+	frappe.db.delete("Agas Event Search Term")
+	for name in frappe.get_all("Agas Event", pluck="name"):
+		index_event(name)
+	frappe.db.commit()
+
+# Document events
+
+def on_event_update(doc, method=None):
+	index_event(doc.name)
+
+def on_event_trash(doc, method=None):
+	frappe.db.delete("Agas Event Search Term", {"event": doc.name})
@@ -64,6 +64,12 @@ home_page = "index"
 # 	"Role": "home_page"
 # }
 
+# Website
+# -------
+
+# /events/<title> and /events_en/<title>, served from a precompressed page cache
+page_renderer = ["agas.event_page.EventPageRenderer"]
+
 # Generators
 # ----------
 
@@ -137,6 +143,34 @@ home_page = "index"
 # ---------------
 # Hook on document methods and events
 
+doc_events = {
+	"Event Registration": {
+		"on_update": [
+			"agas.checkin.on_registration_update",
+			"agas.event_counters.on_registration_update",
+			"agas.analytics.on_registration_update",
+		],
+		"on_trash": [
+			"agas.checkin.on_registration_trash",
+			"agas.event_counters.on_registration_trash",
+			"agas.analytics.on_registration_trash",
+		],
+	},
+	"Agas Event": {
+		"on_update": [
+			"agas.event_counters.clear_event_listing",
+			"agas.event_search.on_event_update",
+		],
+		"on_trash": [
+			"agas.event_counters.clear_event_listing",
+			"agas.event_search.on_event_trash",
+		],
+	},
+	"Family Member": {
+		"on_update": "agas.checkin.on_family_member_update",
+	},
+}
+
 # doc_events = {
 # 	"*": {
 # 		"on_update": "method",
@@ -148,6 +182,22 @@ home_page = "index"
 # Scheduled Tasks
 # ---------------
 
+scheduler_events = {
+	"daily": [
+		"agas.tasks.daily",
+		"agas.event_counters.reconcile",
+		"agas.analytics.rebuild",
+		"agas.uploads.remove_stale_parts"
+	],
+	"hourly": [
+		"agas.instrumentation.flush_route_stats"
+	],
+	"weekly": [
+		"agas.dedupe.find_duplicates",
+		"agas.archive.archive_old_registrations"
+	],
+}
+
 # scheduler_events = {
 # 	"all": [
 # 		"agas.tasks.all"
@@ -196,8 +246,9 @@ home_page = "index"
 
 # Request Events
 # ----------------
-# before_request = ["agas.utils.before_request"]
-# after_request = ["agas.utils.after_request"]
+before_request = ["agas.instrumentation.before_request", "agas.profiler.before_request"]
+after_request = ["agas.profiler.after_request", "agas.instrumentation.after_request", "agas.http_cache.after_request",
+	"agas.replica.after_request"]
 
 # Job Events
 # ----------
@@ -238,9 +289,10 @@ home_page = "index"
 # Automatically update python controller files with type annotations for this app.
 # export_python_type_annotations = True
 
-# default_log_clearing_doctypes = {
-# 	"Logging DocType Name": 30  # days to retain logs
-# }
+default_log_clearing_doctypes = {
+	"Agas Route Stat": 30,  # days to retain logs
+	"Agas Profile Capture": 14
+}
 
 # Translation
 # ------------
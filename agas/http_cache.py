@@ -0,0 +1,47 @@
+import hashlib
+
+import frappe
+
+def cache_response(max_age, immutable=False):
+	"""
+	Lets browsers (and, for guests, shared caches) keep the current API
+	response for `max_age` seconds. The header is set in after_request.
+	"""
+	scope = "public" if frappe.session.user == "Guest" else "private"
+	frappe.local.agas_cache_control = f"{scope}, max-age={int(max_age)}" + (", immutable" if immutable else "")
+
+def not_modified(*version):
+	"""
+	Tags the current API response with an ETag built from `version` (cheap
+	markers such as modified timestamps and the requested fields). Returns
+	True when the request's If-None-Match already names that tag: the caller
+	can skip building the body and after_request answers 304.
+	"""
+	if frappe.flags.agas_batch or not getattr(frappe.local, "request", None):
+		return False
+
+	etag = f'"{hashlib.sha1(frappe.as_json(version).encode()).hexdigest()[:20]}"'
+	# Browsers keep the body but check back with the ETag on every use
+	frappe.local.agas_cache_control = "private, no-cache"
+	frappe.local.agas_etag = etag
+
+	tags = {tag.strip().removeprefix("W/") for tag in (frappe.get_request_header("If-None-Match") or "").split(",")}
+	frappe.local.agas_not_modified = etag in tags or "*" in tags
+	return frappe.local.agas_not_modified
+
+def after_request(response, request):
+	if response.status_code != 200:
+		return
+
+	cache_control = getattr(frappe.local, "agas_cache_control", None)
+	if cache_control:
+		response.headers["Cache-Control"] = cache_control
+		response.headers.pop("Expires", None)
+		response.headers.pop("Pragma", None)
+
+	etag = getattr(frappe.local, "agas_etag", None)
+	if etag:
+		response.headers["ETag"] = etag
+		if getattr(frappe.local, "agas_not_modified", False):
+			response.status_code = 304
+			response.set_data(b"")
@@ -0,0 +1,103 @@
+import functools
+import hashlib
+import inspect
+
+import frappe
+from redis.exceptions import LockError
+
+# Idempotency settings
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_TTL = 86400  # 24 hours
+IDEMPOTENCY_LOCK_TIMEOUT = 30  # seconds the original request holds its key's lock at most
+IDEMPOTENCY_WAIT = 5  # seconds a duplicate waits for the original before giving up
+MAX_KEY_LENGTH = 128
+
+class IdempotencyConflictError(frappe.ValidationError):
+	# The original request is still running; retrying later is safe
+	http_status_code = 409
+
+class IdempotencyKeyReusedError(frappe.ValidationError):
+	# The key belongs to a different request; retrying cannot succeed
+	http_status_code = 422
+
+def idempotent(fn):
+	"""
+	Makes a mutating API method safe to retry.
+
+	If the request carries an `Idempotency-Key` header, the first successful
+	response is stored in Redis for IDEMPOTENCY_TTL and replayed for any repeat
+	of the same key and arguments by the same user, without running the method
+	again. A repeat that arrives while the original is still running waits
+	for it (up to IDEMPOTENCY_WAIT) and then replays its response, or gets a
+	409 if it is still not done. A key reused with different arguments is
+	refused with a 422. Failed calls are not stored, so the client can retry
+	them with the same key.
+
+	Must be applied below `@frappe.whitelist()`.
+	"""
+	@functools.wraps(fn)
+	def wrapper(*args, **kwargs):
+		key = get_idempotency_key()
+		if not key:
+			return fn(*args, **kwargs)
+
+		cache = frappe.cache()
+		cache_key = f"idempotency|{frappe.session.user}|{fn.__module__}.{fn.__name__}|{key}"
+		arguments = hashlib.sha256(frappe.as_json({"args": args, "kwargs": kwargs}).encode()).hexdigest()
+
+		cached = cache.get_value(cache_key)
+		if cached is not None:
+			return replay(cached, arguments)
+
+		# A duplicate in flight waits briefly for the original, then replays what it stored
+		lock = cache.lock(cache.make_key(f"{cache_key}|lock"), timeout=IDEMPOTENCY_LOCK_TIMEOUT,
+			blocking_timeout=IDEMPOTENCY_WAIT)
+		try:
+			acquired = lock.acquire()
+		except LockError:
+			acquired = False
+		if not acquired:
+			frappe.throw("A request with this Idempotency-Key is still being processed. Please retry shortly.",
+				IdempotencyConflictError)
+
+		try:
+			# The original request finished while we waited, or just before we took the lock
+			cached = cache.get_value(cache_key)
+			if cached is not None:
+				return replay(cached, arguments)
+
+			response = fn(*args, **kwargs)
+			cache.set_value(cache_key, {"response": response, "arguments": arguments},
+				expires_in_sec=IDEMPOTENCY_TTL)
+			return response
+		finally:
+			try:
+				lock.release()
+			except LockError:
+				# Lock expired while the method was still running
+				pass
+
+	# frappe.call inspects `fnargs` to decide which form_dict keys to pass on
+	wrapper.fnargs = inspect.getfullargspec(fn).args
+	return wrapper
+
+def replay(cached, arguments):
+	if cached.get("arguments") != arguments:
+		frappe.throw(f"This {IDEMPOTENCY_HEADER} was already used for a different request.",
+			IdempotencyKeyReusedError)
+	return cached["response"]
+
+def get_idempotency_key():
+	"""
+	Returns the client-supplied idempotency key for the current request, if any.
+	"""
+	# A batch is idempotent as a whole; its calls must not share the batch's key
+	if not getattr(frappe.local, "request", None) or frappe.flags.agas_batch:
+		return None
+
+	key = (frappe.get_request_header(IDEMPOTENCY_HEADER) or "").strip()
+	if not key:
+		return None
+	if len(key) > MAX_KEY_LENGTH:
+		frappe.throw(f"{IDEMPOTENCY_HEADER} must not exceed {MAX_KEY_LENGTH} characters", frappe.ValidationError)
+	return key
@@ -0,0 +1,250 @@
+import functools
+import json
+import math
+import re
+import time
+
+import frappe
+from frappe.utils import cint, flt, now_datetime
+
+# Per-request instrumentation. Opt-in: `bench --site <site> set-config agas_instrumentation 1`
+N_PLUS_ONE_THRESHOLD = 5  # identical query shapes in one request before it is flagged
+MAX_ROUTE_SAMPLES = 2000  # latency samples kept per route between flushes
+ROUTE_SAMPLES_KEY = "agas_route_samples"
+ROUTES_KEY = "agas_instrumented_routes"
+MAX_ROUTES = 500  # distinct routes tracked between flushes; the rest share OTHER_ROUTE
+NOT_FOUND_ROUTE = "<not found>"
+OTHER_ROUTE = "<other>"
+STATIC_PREFIXES = ("/assets/", "/files/", "/private/files/")
+
+# Redis calls counted as "cache" time
+CACHE_METHODS = ("get_value", "set_value", "delete_value", "hget", "hset", "hdel")
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*(?:\?|%s|%\(\w+\)s)(?:\s*,\s*(?:\?|%s|%\(\w+\)s))*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+_installed = False
+
+def is_enabled():
+	return cint(frappe.conf.get("agas_instrumentation"))
+
+def before_request():
+	"""
+	Starts collecting SQL, cache and template render timings for this request.
+	"""
+	if not is_enabled():
+		return
+
+	_install_wrappers()
+	frappe.local.agas_request_metrics = frappe._dict(
+		start=time.perf_counter(),
+		sql_count=0,
+		sql_time=0.0,
+		cache_count=0,
+		cache_time=0.0,
+		render_time=0.0,
+		query_shapes={},
+	)
+
+def after_request(response, request):
+	"""
+	Adds a Server-Timing header, logs repeated query shapes (likely N+1 loops)
+	and records a latency sample for the route.
+	"""
+	metrics = getattr(frappe.local, "agas_request_metrics", None)
+	if not metrics:
+		return
+
+	# Stop collecting before we touch the cache ourselves
+	frappe.local.agas_request_metrics = None
+
+	total_ms = (time.perf_counter() - metrics.start) * 1000
+	sql_ms = metrics.sql_time * 1000
+	cache_ms = metrics.cache_time * 1000
+	render_ms = metrics.render_time * 1000
+
+	response.headers["Server-Timing"] = ", ".join([
+		f'db;dur={sql_ms:.1f};desc="{metrics.sql_count} queries"',
+		f'cache;dur={cache_ms:.1f};desc="{metrics.cache_count} calls"',
+		f"render;dur={render_ms:.1f}",
+		f"total;dur={total_ms:.1f}",
+	])
+
+	route = route_template(request.path, response.status_code)
+	repeated = {shape: count for shape, count in metrics.query_shapes.items()
+		if count >= N_PLUS_ONE_THRESHOLD}
+	if repeated:
+		frappe.logger("agas.instrumentation").warning({
+			"message": "Repeated query shapes (possible N+1)",
+			"route": route,
+			"user": frappe.session.user,
+			"queries": repeated,
+		})
+
+	try:
+		_record_sample(route, {
+			"ms": round(total_ms, 2),
+			"sql_ms": round(sql_ms, 2),
+			"queries": metrics.sql_count,
+			"n_plus_one": len(repeated),
+		})
+	except Exception:
+		# Instrumentation must never break the response
+		frappe.logger("agas.instrumentation").exception(f"Could not record sample for {route}")
+
+def normalize_query(query):
+	"""
+	Reduces a query to its shape by replacing literals and IN-lists, so that the
+	same statement issued with different values is counted together.
+	"""
+	query = _STRING_LITERAL.sub("?", str(query))
+	query = _NUMBER_LITERAL.sub("?", query)
+	query = _PLACEHOLDER_LIST.sub("(...)", query)
+	return _WHITESPACE.sub(" ", query).strip()
+
+def route_template(path, status_code):
+	"""
+	Maps a request path onto a bounded set of routes: whitelisted API methods
+	by name, pages by their first segment (`/events/<title>` is `/events/*`),
+	static files by prefix, and anything unknown or not found to a bucket.
+	"""
+	if status_code == 404:
+		return NOT_FOUND_ROUTE
+	for prefix in STATIC_PREFIXES:
+		if path.startswith(prefix):
+			return f"{prefix}*"
+	if path.startswith("/api/method/"):
+		method = path[len("/api/method/"):].strip("/")
+		return f"/api/method/{method}" if method in _whitelisted_methods() else f"/api/method/{OTHER_ROUTE}"
+	if path.startswith("/api/"):
+		return "/".join(path.split("/")[:3]) + "/*"
+
+	segments = [segment for segment in path.split("/") if segment]
+	if not segments:
+		return "/"
+	return f"/{segments[0]}" + ("/*" if len(segments) > 1 else "")
+
+def _whitelisted_methods():
+	# frappe.whitelisted only grows as modules are imported; rebuild the names when it does
+	cached = getattr(_whitelisted_methods, "cached", None)
+	if not cached or cached[0] != len(frappe.whitelisted):
+		names = {f"{fn.__module__}.{fn.__name__}" for fn in frappe.whitelisted}
+		_whitelisted_methods.cached = cached = (len(frappe.whitelisted), names)
+	return cached[1]
+
+def _record_sample(route, sample):
+	# Raw redis calls throughout (as in waiting_room), so every key gets the site prefix once
+	cache = frappe.cache()
+	routes_key = cache.make_key(ROUTES_KEY)
+	pipe = cache.pipeline(transaction=False)
+	pipe.sismember(routes_key, route)
+	pipe.scard(routes_key)
+	known, tracked = pipe.execute()
+	if not known and tracked >= MAX_ROUTES:
+		route = OTHER_ROUTE
+
+	key = _samples_key(route)
+	pipe = cache.pipeline(transaction=False)
+	pipe.sadd(routes_key, route)
+	pipe.lpush(key, json.dumps(sample))
+	pipe.ltrim(key, 0, MAX_ROUTE_SAMPLES - 1)
+	pipe.execute()
+
+def _samples_key(route):
+	return frappe.cache().make_key(f"{ROUTE_SAMPLES_KEY}|{route}")
+
+def flush_route_stats():
+	"""
+	Scheduled job: turns the latency samples collected since the last run into
+	one Agas Route Stat row per route with p50/p95 figures.
+	"""
+	cache = frappe.cache()
+	period_end = now_datetime()
+
+	# Each key is read and deleted in one MULTI, so samples recorded meanwhile wait for the next flush
+	routes_key = cache.make_key(ROUTES_KEY)
+	pipe = cache.pipeline(transaction=True)
+	pipe.smembers(routes_key)
+	pipe.delete(routes_key)
+	routes = pipe.execute()[0]
+
+	for route in routes or []:
+		if isinstance(route, bytes):
+			route = route.decode()
+		key = _samples_key(route)
+		pipe = cache.pipeline(transaction=True)
+		pipe.lrange(key, 0, -1)
+		pipe.delete(key)
+		samples = [json.loads(s) for s in pipe.execute()[0] or []]
+		if not samples:
+			continue
+
+		latencies = sorted(s["ms"] for s in samples)
+		queries = sorted(s["queries"] for s in samples)
+		frappe.get_doc({
+			"doctype": "Agas Route Stat",
+			"route": route[:140],
+			"period_end": period_end,
+			"requests": len(samples),
+			"p50_ms": percentile(latencies, 50),
+			"p95_ms": percentile(latencies, 95),
+			"max_ms": latencies[-1],
+			"avg_sql_ms": flt(sum(s["sql_ms"] for s in samples) / len(samples), 2),
+			"avg_queries": flt(sum(queries) / len(queries), 2),
+			"p95_queries": percentile(queries, 95),
+			"n_plus_one_requests": sum(1 for s in samples if s["n_plus_one"]),
+		}).insert(ignore_permissions=True)
+
+	frappe.db.commit()
+
+def percentile(sorted_values, pct):
+	"""
+	Nearest-rank percentile of an already sorted list.
+	"""
+	if not sorted_values:
+		return 0
+	rank = max(math.ceil(pct / 100 * len(sorted_values)), 1)
+	return sorted_values[rank - 1]
+
+def _install_wrappers():
+	"""
+	Wraps Database.sql, the Redis cache and frappe.render_template once per
+	process. The wrappers only measure while a request has metrics attached,
+	so they cost a single attribute lookup otherwise.
+	"""
+	global _installed
+	if _installed:
+		return
+
+	from frappe.database.database import Database
+	from frappe.utils.redis_wrapper import RedisWrapper
+
+	Database.sql = _timed(Database.sql, "sql", track_shape=True)
+	for method in CACHE_METHODS:
+		setattr(RedisWrapper, method, _timed(getattr(RedisWrapper, method), "cache"))
+	frappe.render_template = _timed(frappe.render_template, "render", is_method=False)
+
+	_installed = True
+
+def _timed(fn, bucket, track_shape=False, is_method=True):
+	@functools.wraps(fn)
+	def wrapper(*args, **kwargs):
+		metrics = getattr(frappe.local, "agas_request_metrics", None)
+		if not metrics:
+			return fn(*args, **kwargs)
+
+		start = time.perf_counter()
+		try:
+			return fn(*args, **kwargs)
+		finally:
+			metrics[f"{bucket}_time"] += time.perf_counter() - start
+			if bucket != "render":
+				metrics[f"{bucket}_count"] += 1
+			if track_shape:
+				query = args[1] if is_method and len(args) > 1 else kwargs.get("query", "")
+				shape = normalize_query(query)
+				metrics.query_shapes[shape] = metrics.query_shapes.get(shape, 0) + 1
+
+	return wrapper
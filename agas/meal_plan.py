@@ -0,0 +1,138 @@
+import json
+from collections import defaultdict
+from datetime import timedelta
+
+import frappe
+from frappe.utils import cint, getdate
+
+# A member's meals are one integer bitmap over their stay: 3 bits per day,
+# day 0 in the lowest bits. Stored on Event Registration.meal_plan as
+# {"members": {member_ref: {"name", "start", "days", "bits" (hex)}}}
+MEALS = (("breakfast", 1), ("lunch", 2), ("dinner", 4))
+BITS_PER_DAY = 3
+DAY_MASK = 0b111
+
+# Registrations whose meals the kitchen has to prepare
+MEAL_COUNT_STATUSES = ("Registered", "Confirmed")
+
+def encode(rows):
+	"""
+	Builds a meal plan from Event Food Day style rows
+	({"member_ref", "member_name", "date", "breakfast", "lunch", "dinner"}).
+	Returns None when there are no rows.
+	"""
+	by_member = {}
+	for row in rows or []:
+		if not row.get("date"):
+			continue
+		ref = row.get("member_ref") or "PRIMARY"
+		member = by_member.setdefault(ref, {"name": row.get("member_name"), "days": {}})
+		member["days"][getdate(row["date"])] = day_mask(row)
+
+	members = {}
+	for ref, member in by_member.items():
+		start, end = min(member["days"]), max(member["days"])
+		bits = 0
+		for date, mask in member["days"].items():
+			bits |= mask << ((date - start).days * BITS_PER_DAY)
+		members[ref] = {
+			"name": member["name"],
+			"start": str(start),
+			"days": (end - start).days + 1,
+			"bits": format(bits, "x"),
+		}
+	return {"members": members} if members else None
+
+def decode(plan):
+	"""
+	Expands a meal plan back into one row per member per day, ordered by date.
+	"""
+	plan = load(plan)
+	rows = []
+	for ref, member in (plan or {}).get("members", {}).items():
+		start = getdate(member["start"])
+		bits = int(member["bits"] or "0", 16)
+		for day in range(member["days"]):
+			mask = (bits >> (day * BITS_PER_DAY)) & DAY_MASK
+			row = {"member_ref": ref, "member_name": member.get("name"), "date": str(start + timedelta(days=day))}
+			row.update({meal: int(bool(mask & bit)) for meal, bit in MEALS})
+			rows.append(row)
+	rows.sort(key=lambda row: row["date"])
+	return rows
+
+def apply_changes(plan, changes):
+	"""
+	Applies a patch_registration style change set ({"set": [rows], "remove":
+	[{"member_ref", "date"}]}) to a meal plan and returns the new plan.
+	"""
+	rows = {(row["member_ref"], row["date"]): row for row in decode(plan)}
+	for row in changes.get("remove") or []:
+		rows.pop((row.get("member_ref") or "PRIMARY", str(getdate(row.get("date")))), None)
+	for row in changes.get("set") or []:
+		key = (row.get("member_ref") or "PRIMARY", str(getdate(row.get("date"))))
+		rows[key] = {**rows.get(key, {}), **row, "member_ref": key[0], "date": key[1]}
+	return encode(rows.values())
+
+def day_mask(row):
+	return sum(bit for meal, bit in MEALS if cint(row.get(meal)))
+
+def meal_mask(meal, days):
+	"""
+	Bitmap with the given meal's bit set on every day, e.g. all lunches.
+	"""
+	bit = dict(MEALS)[meal]
+	return sum(bit << (day * BITS_PER_DAY) for day in range(days))
+
+def total_meals(plans):
+	"""
+	Counts meals per type over any number of plans with popcounts, without
+	expanding days.
+	"""
+	totals = dict.fromkeys((meal for meal, _ in MEALS), 0)
+	for plan in plans:
+		for member in (load(plan) or {}).get("members", {}).values():
+			bits = int(member["bits"] or "0", 16)
+			for meal, _ in MEALS:
+				totals[meal] += (bits & meal_mask(meal, member["days"])).bit_count()
+	return totals
+
+def daily_meal_counts(plans):
+	"""
+	Returns {date: {"breakfast": n, "lunch": n, "dinner": n}} over any number
+	of plans. Only set bits are visited, so empty days cost nothing.
+	"""
+	counts = defaultdict(lambda: [0] * len(MEALS))
+	for plan in plans:
+		for member in (load(plan) or {}).get("members", {}).values():
+			start = getdate(member["start"])
+			bits = int(member["bits"] or "0", 16)
+			while bits:
+				lowest = bits & -bits
+				day, meal_index = divmod(lowest.bit_length() - 1, BITS_PER_DAY)
+				counts[start + timedelta(days=day)][meal_index] += 1
+				bits ^= lowest
+
+	return {
+		str(date): {meal: values[i] for i, (meal, _) in enumerate(MEALS)}
+		for date, values in sorted(counts.items())
+	}
+
+@frappe.whitelist()
+def get_meal_counts(event):
+	"""
+	Meals to prepare per day for an event, across its active registrations.
+	"""
+	frappe.only_for("System Manager")
+	plans = frappe.get_all("Event Registration",
+		filters={"event": event, "status": ["in", MEAL_COUNT_STATUSES], "meal_plan": ["is", "set"]},
+		pluck="meal_plan"
+	)
+	return {"days": daily_meal_counts(plans), "totals": total_meals(plans)}
+
+def load(plan):
+	if isinstance(plan, str):
+		return json.loads(plan) if plan else None
+	return plan
+
+def dumps(plan):
+	return json.dumps(plan, separators=(",", ":")) if plan else None
@@ -0,0 +1,241 @@
+import base64
+import hashlib
+import io
+import os
+import sqlite3
+import tempfile
+
+import frappe
+from frappe.utils import cint, get_datetime, now_datetime
+
+from agas.checkin import CHECKIN_STATUSES, person_tokens
+
+SNAPSHOT_VERSION = 1
+THUMBNAIL_SIZE = (96, 96)
+THUMBNAIL_QUALITY = 70
+THUMBNAIL_CACHE_TTL = 7 * 86400
+
+SNAPSHOT_SCHEMA = """
+	create table meta (key text primary key, value text);
+	create table visitors (
+		registration text not null,
+		person_ref text not null,
+		person_type text,
+		full_name text,
+		mobile_no text,
+		checked_in integer default 0,
+		checked_in_at text,
+		photo_id text,
+		primary key (registration, person_ref)
+	);
+	create table tokens (token text not null, registration text not null, person_ref text not null);
+	create index tokens_token on tokens (token);
+	create table photos (id text primary key, jpeg blob);
+	-- Arrivals recorded on the device, uploaded with upload_offline_checkins
+	create table pending_checkins (
+		registration text not null,
+		person_ref text not null,
+		checked_in_at text not null,
+		primary key (registration, person_ref)
+	);
+"""
+
+@frappe.whitelist()
+def download_snapshot(event, include_photos=1):
+	"""
+	Streams a SQLite file with every visitor of the event's confirmed
+	registrations, their search tokens and (optionally) photo thumbnails, so a
+	gate tablet can search and check visitors in without calling the server.
+	The `watermark` meta value is the starting point for get_checkin_delta.
+	"""
+	frappe.has_permission("Gate Checkin Entry", "read", throw=True)
+	watermark = now_datetime()
+	visitors = get_visitors(event, include_photos=cint(include_photos))
+
+	fd, path = tempfile.mkstemp(suffix=".sqlite")
+	os.close(fd)
+	try:
+		conn = sqlite3.connect(path)
+		conn.executescript(SNAPSHOT_SCHEMA)
+		conn.executemany("insert into meta values (?, ?)", [
+			("event", event),
+			("watermark", str(watermark)),
+			("version", str(SNAPSHOT_VERSION)),
+		])
+
+		photos = {}
+		for v in visitors:
+			conn.execute("insert into visitors values (?, ?, ?, ?, ?, ?, ?, ?)", (
+				v.registration, v.person_ref, v.person_type, v.full_name, v.mobile_no,
+				v.checked_in, str(v.checked_in_at or ""), v.photo_id))
+			conn.executemany("insert into tokens values (?, ?, ?)",
+				[(token, v.registration, v.person_ref) for token in v.tokens])
+			if v.photo_id and v.photo_id not in photos:
+				photos[v.photo_id] = v.thumbnail
+		conn.executemany("insert into photos values (?, ?)", photos.items())
+		conn.commit()
+		conn.execute("vacuum")
+		conn.close()
+
+		with open(path, "rb") as f:
+			content = f.read()
+	finally:
+		os.remove(path)
+
+	frappe.local.response.filename = f"checkin-{frappe.scrub(event)}.sqlite"
+	frappe.local.response.filecontent = content
+	frappe.local.response.type = "download"
+
+@frappe.whitelist()
+def get_checkin_delta(event, since, include_photos=1):
+	"""
+	Returns visitors of every registration of the event that changed at or
+	after `since` (a watermark from a snapshot or an earlier delta). Devices
+	replace all visitors of each listed registration; registrations in
+	`removed` are no longer confirmed and should be dropped.
+	"""
+	frappe.has_permission("Gate Checkin Entry", "read", throw=True)
+	watermark = now_datetime()
+	since = get_datetime(since)
+
+	changed = set(frappe.get_all("Event Registration",
+		filters={"event": event, "modified": [">=", since]}, pluck="name"))
+	# Arrivals recorded by other devices only touch the entry
+	changed.update(frappe.get_all("Gate Checkin Entry",
+		filters={"event": event, "modified": [">=", since]}, pluck="registration", distinct=True))
+
+	confirmed = set(frappe.get_all("Event Registration",
+		filters={"name": ["in", list(changed) or [""]], "status": ["in", CHECKIN_STATUSES]}, pluck="name"))
+
+	registrations = {}
+	if confirmed:
+		for v in get_visitors(event, registrations=list(confirmed), include_photos=cint(include_photos)):
+			registrations.setdefault(v.registration, []).append({
+				"person_ref": v.person_ref,
+				"person_type": v.person_type,
+				"full_name": v.full_name,
+				"mobile_no": v.mobile_no,
+				"checked_in": v.checked_in,
+				"checked_in_at": v.checked_in_at,
+				"tokens": sorted(v.tokens),
+				"photo_id": v.photo_id,
+				"thumbnail": base64.b64encode(v.thumbnail).decode() if v.thumbnail else None,
+			})
+
+	return {
+		"watermark": str(watermark),
+		"registrations": registrations,
+		"removed": sorted(changed - confirmed),
+	}
+
+@frappe.whitelist()
+def upload_offline_checkins(event, checkins, device_id=None):
+	"""
+	Applies arrivals recorded offline. `checkins` is a list of
+	{"registration", "person_ref", "checked_in_at"}.
+
+	Conflicts resolve to the earliest arrival: an arrival the server already
+	has is kept unless the device saw the visitor earlier. Visitors whose
+	registration is no longer confirmed are reported as `not_found`.
+	"""
+	frappe.has_permission("Gate Checkin Entry", "write", throw=True)
+	if isinstance(checkins, str):
+		checkins = frappe.parse_json(checkins)
+
+	results = []
+	for item in checkins:
+		entry = frappe.db.get_value("Gate Checkin Entry",
+			{"event": event, "registration": item.get("registration"), "person_ref": item.get("person_ref")},
+			["name", "checked_in", "checked_in_at"], as_dict=True, for_update=True)
+		arrived_at = get_datetime(item.get("checked_in_at"))
+
+		if not entry:
+			status = "not_found"
+		elif entry.checked_in and entry.checked_in_at and get_datetime(entry.checked_in_at) <= arrived_at:
+			status = "already_checked_in"
+		else:
+			frappe.db.set_value("Gate Checkin Entry", entry.name, {
+				"checked_in": 1,
+				"checked_in_at": arrived_at,
+				"checked_in_by": frappe.session.user,
+				"checked_in_device": device_id,
+			})
+			status = "updated" if entry.checked_in else "applied"
+
+		results.append({
+			"registration": item.get("registration"),
+			"person_ref": item.get("person_ref"),
+			"status": status,
+		})
+
+	frappe.db.commit()
+	return results
+
+def get_visitors(event, registrations=None, include_photos=True):
+	"""
+	Loads gate entries for the event with their search tokens and photo
+	thumbnails, using one query per table.
+	"""
+	filters = {"event": event}
+	if registrations is not None:
+		filters["registration"] = ["in", registrations]
+	visitors = frappe.get_all("Gate Checkin Entry",
+		filters=filters,
+		fields=["registration", "person_type", "person_ref", "full_name", "mobile_no",
+			"checked_in", "checked_in_at"],
+		order_by="registration asc"
+	)
+
+	photo_urls = _photo_urls(visitors) if include_photos else {}
+	for v in visitors:
+		v.tokens = person_tokens(v, v.registration)
+		url = photo_urls.get((v.registration, v.person_ref))
+		v.thumbnail = thumbnail(url) if url else None
+		v.photo_id = hashlib.sha1(url.encode()).hexdigest()[:12] if v.thumbnail else None
+	return visitors
+
+def _photo_urls(visitors):
+	registrations = list({v.registration for v in visitors}) or [""]
+	family = list({v.person_ref for v in visitors if v.person_type == "Family"}) or [""]
+
+	users = dict(frappe.get_all("Event Registration",
+		filters={"name": ["in", registrations]}, fields=["name", "user"], as_list=True))
+	profile_photos = dict(frappe.get_all("Member Profile",
+		filters={"user": ["in", list(set(users.values())) or [""]]}, fields=["user", "photo"], as_list=True))
+	family_photos = dict(frappe.get_all("Family Member",
+		filters={"name": ["in", family]}, fields=["name", "photo"], as_list=True))
+
+	urls = {}
+	for v in visitors:
+		if v.person_type == "Family":
+			urls[(v.registration, v.person_ref)] = family_photos.get(v.person_ref)
+		else:
+			urls[(v.registration, v.person_ref)] = profile_photos.get(users.get(v.registration))
+	return urls
+
+def thumbnail(file_url):
+	"""
+	Returns a small JPEG of an attached image, cached in Redis by file URL.
+	"""
+	cache_key = f"agas_checkin_thumbnail|{file_url}"
+	cached = frappe.cache().get_value(cache_key)
+	if cached is not None:
+		return cached or None
+
+	data = b""
+	try:
+		from PIL import Image
+
+		path = frappe.get_doc("File", {"file_url": file_url}).get_full_path()
+		with Image.open(path) as image:
+			image = image.convert("RGB")
+			image.thumbnail(THUMBNAIL_SIZE)
+			buffer = io.BytesIO()
+			image.save(buffer, "JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+			data = buffer.getvalue()
+	except Exception:
+		frappe.logger("agas.checkin").warning(f"Could not make thumbnail for {file_url}")
+
+	# Remember failures too, so a missing file is not retried for every visitor
+	frappe.cache().set_value(cache_key, data, expires_in_sec=THUMBNAIL_CACHE_TTL)
+	return data or None
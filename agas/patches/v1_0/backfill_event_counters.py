@@ -0,0 +1,5 @@
+from agas.event_counters import reconcile
+
+def execute():
+	# Counters start at zero; fill them from the existing registrations
+	reconcile(log=False)
@@ -0,0 +1,4 @@
+from agas.analytics import rebuild
+
+def execute():
+	rebuild()
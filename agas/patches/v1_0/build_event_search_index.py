@@ -0,0 +1,4 @@
+from agas.event_search import rebuild_index
+
+def execute():
+	rebuild_index()
@@ -0,0 +1,5 @@
+from agas.pincodes import refresh
+
+def execute():
+	# Replaces the partial seed loaded by load_pincode_dataset with the full directory
+	refresh()
@@ -0,0 +1,4 @@
+from agas.pincodes import refresh
+
+def execute():
+	refresh()
@@ -0,0 +1,35 @@
+import frappe
+
+from agas import meal_plan
+
+BATCH_SIZE = 500  # registrations converted per commit
+
+def execute():
+	"""
+	Converts Event Food Day rows into the Event Registration meal_plan bitmap
+	and removes the rows. Registrations that already have a plan are skipped,
+	so the patch can be re-run after an interruption.
+	"""
+	parents = frappe.get_all("Event Food Day",
+		filters={"parenttype": "Event Registration"}, pluck="parent", distinct=True)
+
+	for start in range(0, len(parents), BATCH_SIZE):
+		batch = parents[start:start + BATCH_SIZE]
+		rows = frappe.get_all("Event Food Day",
+			filters={"parent": ["in", batch], "parenttype": "Event Registration"},
+			fields=["parent", "member_ref", "member_name", "date", "breakfast", "lunch", "dinner"]
+		)
+		existing = dict(frappe.get_all("Event Registration",
+			filters={"name": ["in", batch]}, fields=["name", "meal_plan"], as_list=True))
+
+		by_parent = {}
+		for row in rows:
+			by_parent.setdefault(row.parent, []).append(row)
+
+		for parent, parent_rows in by_parent.items():
+			if parent in existing and not existing[parent]:
+				frappe.db.set_value("Event Registration", parent, "meal_plan",
+					meal_plan.dumps(meal_plan.encode(parent_rows)), update_modified=False)
+
+		frappe.db.delete("Event Food Day", {"parent": ["in", batch], "parenttype": "Event Registration"})
+		frappe.db.commit()
@@ -0,0 +1,12 @@
+import frappe
+from frappe.utils.html_utils import sanitize_html
+
+from agas.event_page import make_image_variants
+
+def execute():
+	# Events saved before content_html and image_variants existed
+	for event in frappe.get_all("Agas Event", fields=["name", "content", "image"]):
+		frappe.db.set_value("Agas Event", event.name, {
+			"content_html": sanitize_html(event.content or "", linkify=True),
+			"image_variants": frappe.as_json(make_image_variants(event.image)) if event.image else None,
+		}, update_modified=False)
@@ -0,0 +1,97 @@
+import csv
+import gzip
+import hashlib
+import io
+import os
+from collections import Counter, defaultdict
+
+import frappe
+
+# Bundled dataset, loaded on migrate: one row per pincode of the India Post
+# "All India Pincode Directory" (data.gov.in). A newer export of that
+# directory can be loaded over it with refresh(path=...).
+DATASET_PATH = os.path.join(os.path.dirname(__file__), "data", "india_pincodes.csv.gz")
+DATASET_VERSION_KEY = "agas_pincode_dataset_version"
+COUNTRY = "India"
+
+# Accepted header names (case-insensitive) for each column
+COLUMNS = {
+	"pincode": ("pincode",),
+	"district": ("district", "districtname"),
+	"state": ("state", "statename"),
+}
+
+def lookup(pincode):
+	"""
+	District, state and country for a pincode, or None if it is not in the
+	dataset. One primary key read.
+	"""
+	row = frappe.db.get_value("Agas Pincode", pincode, ["pincode", "district", "state"], as_dict=True)
+	if not row:
+		return None
+	row.country = COUNTRY
+	return row
+
+def dataset_version():
+	return frappe.db.get_global(DATASET_VERSION_KEY) or ""
+
+def refresh(path=None, force=False):
+	"""
+	Replaces Agas Pincode with a dataset file (CSV, optionally gzipped) in a
+	single transaction. Files whose content matches the loaded version are
+	skipped unless `force` is set.
+
+	bench --site <site> execute agas.pincodes.refresh --kwargs "{'path': '/path/to/pincodes.csv.gz'}"
+	"""
+	path = path or DATASET_PATH
+	with open(path, "rb") as f:
+		content = f.read()
+
+	version = hashlib.sha1(content).hexdigest()[:12]
+	if version == dataset_version() and not force:
+		print(f"Pincode dataset {version} is already loaded")
+		return 0
+
+	if path.endswith(".gz"):
+		content = gzip.decompress(content)
+	rows = read_dataset(content.decode("utf-8-sig"))
+
+	frappe.db.delete("Agas Pincode")
+	frappe.db.bulk_insert("Agas Pincode", ["name", "pincode", "district", "state"],
+		[[pincode, pincode, district, state] for pincode, district, state in rows])
+	frappe.db.set_global(DATASET_VERSION_KEY, version)
+	frappe.db.commit()
+
+	print(f"Loaded {len(rows)} pincodes (dataset {version})")
+	return len(rows)
+
+def read_dataset(text):
+	"""
+	One (pincode, district, state) per pincode. Post office level files list
+	a pincode once per office, so the most common district wins. Offices
+	without a district or state (sorting and mail centres) are skipped.
+	"""
+	reader = csv.DictReader(io.StringIO(text))
+	headers = {(header or "").strip().lower(): header for header in reader.fieldnames or []}
+	columns = {}
+	for column, names in COLUMNS.items():
+		found = next((headers[name] for name in names if name in headers), None)
+		if not found:
+			frappe.throw(f"Pincode dataset has no {column} column", frappe.ValidationError)
+		columns[column] = found
+
+	places = defaultdict(Counter)
+	for record in reader:
+		pincode = (record[columns["pincode"]] or "").strip()
+		if len(pincode) != 6 or not pincode.isdigit():
+			continue
+		district, state = clean(record[columns["district"]]), clean(record[columns["state"]])
+		if district and state:
+			places[pincode][(district, state)] += 1
+
+	return [(pincode, *counts.most_common(1)[0][0]) for pincode, counts in sorted(places.items())]
+
+def clean(value):
+	# The government export is in capitals ("ANAND")
+	value = " ".join((value or "").split())
+	return value.title() if value.isupper() else value
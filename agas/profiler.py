@@ -0,0 +1,217 @@
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+import frappe
+from frappe.utils import cint, flt
+
+# Sampling profiler settings (site config keys, e.g. `bench set-config agas_profiler 1`)
+DEFAULT_THRESHOLD_MS = 1000  # agas_profiler_threshold_ms: start sampling once a request runs this long
+DEFAULT_SAMPLE_RATE = 0.0  # agas_profiler_sample_rate: fraction of requests profiled from the start
+DEFAULT_INTERVAL_MS = 5  # agas_profiler_interval_ms: time between stack samples
+MAX_STACK_DEPTH = 128
+IDLE_WAIT = 0.1  # seconds the sampler sleeps when no request is due for sampling
+
+# thread id -> capture for requests currently in flight
+_active = {}
+_wakeup = threading.Event()
+_sampler = None
+_sampler_lock = threading.Lock()
+_stacks_lock = threading.Lock()
+
+def is_enabled():
+	return cint(frappe.conf.get("agas_profiler"))
+
+def before_request():
+	"""
+	Registers the request with the sampler thread. Nothing is sampled until the
+	request is picked for sampling or crosses the latency threshold.
+	"""
+	if not is_enabled():
+		return
+
+	conf = frappe.conf
+	capture = frappe._dict(
+		thread_id=threading.get_ident(),
+		started=time.monotonic(),
+		threshold_ms=cint(conf.get("agas_profiler_threshold_ms") or DEFAULT_THRESHOLD_MS),
+		sampled=random.random() < flt(conf.get("agas_profiler_sample_rate") or DEFAULT_SAMPLE_RATE),
+		stacks=Counter(),
+	)
+	_ensure_sampler(cint(conf.get("agas_profiler_interval_ms") or DEFAULT_INTERVAL_MS))
+	_active[capture.thread_id] = capture
+	frappe.local.agas_profile = capture
+	_wakeup.set()
+
+def after_request(response, request):
+	"""
+	Unregisters the request and, if any stacks were sampled, stores them in the
+	background so the response is not held up by the write.
+	"""
+	capture = getattr(frappe.local, "agas_profile", None)
+	if not capture:
+		return
+
+	frappe.local.agas_profile = None
+	_active.pop(capture.thread_id, None)
+	if not capture.stacks:
+		return
+
+	duration_ms = (time.monotonic() - capture.started) * 1000
+	with _stacks_lock:
+		stacks = dict(capture.stacks)
+
+	frappe.enqueue(
+		"agas.profiler.save_capture",
+		queue="short",
+		route=request.path,
+		http_method=request.method,
+		user=frappe.session.user,
+		duration_ms=round(duration_ms, 2),
+		trigger="Sampled" if capture.sampled else "Threshold",
+		interval_ms=cint(frappe.conf.get("agas_profiler_interval_ms") or DEFAULT_INTERVAL_MS),
+		stacks=stacks,
+	)
+
+def save_capture(route, http_method, user, duration_ms, trigger, interval_ms, stacks):
+	frappe.get_doc({
+		"doctype": "Agas Profile Capture",
+		"route": route[:140],
+		"http_method": http_method,
+		"user": user,
+		"duration_ms": duration_ms,
+		"trigger": trigger,
+		"interval_ms": interval_ms,
+		"sample_count": sum(stacks.values()),
+		"collapsed_stacks": "\n".join(f"{stack} {count}" for stack, count in
+			sorted(stacks.items(), key=lambda item: item[1], reverse=True)),
+	}).insert(ignore_permissions=True)
+	frappe.db.commit()
+
+@frappe.whitelist()
+def get_captures(route=None, limit=50):
+	"""
+	Returns the slowest captures, optionally for a single route.
+	"""
+	frappe.only_for("System Manager")
+	filters = {"route": route} if route else {}
+	return frappe.get_all("Agas Profile Capture",
+		filters=filters,
+		fields=["name", "route", "http_method", "user", "duration_ms", "trigger", "sample_count", "creation"],
+		order_by="duration_ms desc",
+		limit=cint(limit) or 50
+	)
+
+@frappe.whitelist()
+def get_capture(name):
+	frappe.only_for("System Manager")
+	doc = frappe.get_doc("Agas Profile Capture", name)
+	return {
+		"name": doc.name,
+		"route": doc.route,
+		"user": doc.user,
+		"duration_ms": doc.duration_ms,
+		"sample_count": doc.sample_count,
+		"stacks": parse_collapsed(doc.collapsed_stacks),
+	}
+
+@frappe.whitelist()
+def diff_captures(base, compare, limit=50):
+	"""
+	Compares two captures frame by frame. Each frame's inclusive share of the
+	samples is computed for both captures; the biggest movers come first.
+	"""
+	frappe.only_for("System Manager")
+	base_share = _inclusive_share(frappe.db.get_value("Agas Profile Capture", base, "collapsed_stacks"))
+	compare_share = _inclusive_share(frappe.db.get_value("Agas Profile Capture", compare, "collapsed_stacks"))
+
+	rows = []
+	for frame in set(base_share) | set(compare_share):
+		before = base_share.get(frame, 0.0)
+		after = compare_share.get(frame, 0.0)
+		rows.append({"frame": frame, "base_pct": round(before, 2), "compare_pct": round(after, 2),
+			"delta_pct": round(after - before, 2)})
+
+	rows.sort(key=lambda row: abs(row["delta_pct"]), reverse=True)
+	return rows[:cint(limit) or 50]
+
+def parse_collapsed(text):
+	"""
+	Parses collapsed-stack text ("a;b;c 12" per line) into {stack: count}.
+	"""
+	stacks = {}
+	for line in (text or "").splitlines():
+		stack, _, count = line.rpartition(" ")
+		if stack:
+			stacks[stack] = stacks.get(stack, 0) + cint(count)
+	return stacks
+
+def _inclusive_share(text):
+	stacks = parse_collapsed(text)
+	total = sum(stacks.values()) or 1
+	share = Counter()
+	for stack, count in stacks.items():
+		# A recursive frame still counts once per sample
+		for frame in set(stack.split(";")):
+			share[frame] += count
+	return {frame: count * 100 / total for frame, count in share.items()}
+
+def _ensure_sampler(interval_ms):
+	global _sampler
+	if _sampler and _sampler.is_alive():
+		return
+
+	with _sampler_lock:
+		if _sampler and _sampler.is_alive():
+			return
+		_sampler = threading.Thread(target=_sample_loop, args=(interval_ms / 1000,),
+			name="agas-profiler", daemon=True)
+		_sampler.start()
+
+def _sample_loop(interval):
+	while True:
+		_wakeup.clear()
+		if not _active:
+			_wakeup.wait()
+			continue
+
+		now = time.monotonic()
+		frames = None
+		next_due = IDLE_WAIT
+		for thread_id, capture in list(_active.items()):
+			remaining = capture.threshold_ms / 1000 - (now - capture.started)
+			if not capture.sampled and remaining > 0:
+				next_due = min(next_due, remaining)
+				continue
+
+			if frames is None:
+				frames = sys._current_frames()
+			frame = frames.get(thread_id)
+			if frame is not None:
+				stack = _collapse(frame)
+				with _stacks_lock:
+					capture.stacks[stack] += 1
+			next_due = interval
+
+		time.sleep(max(next_due, interval))
+
+def _collapse(frame):
+	stack = []
+	while frame is not None and len(stack) < MAX_STACK_DEPTH:
+		code = frame.f_code
+		stack.append(f"{_short_path(code.co_filename)}:{code.co_name}")
+		frame = frame.f_back
+	return ";".join(reversed(stack))
+
+def _short_path(filename):
+	# Keep paths readable and stable across benches: "frappe/model/document.py"
+	marker = f"{os.sep}apps{os.sep}"
+	if marker in filename:
+		filename = filename.split(marker, 1)[1]
+		parts = filename.split(os.sep)
+		# apps/<app>/<package>/... -> <package>/...
+		return os.sep.join(parts[1:]) if len(parts) > 2 else filename
+	return os.sep.join(filename.split(os.sep)[-2:])
@@ -0,0 +1,74 @@
+import functools
+
+import frappe
+from frappe.utils import cint
+
+# Reads go to the replica configured with Frappe's own site config keys:
+#   read_from_replica: 1, replica_host: "127.0.0.1", replica_db_port: 3307
+DEFAULT_PIN_SECONDS = 10  # agas_replica_pin_seconds: a user reads from the primary this long after a write
+PIN_KEY = "agas_primary_pin|{user}"
+
+def read_from_replica(fn):
+	"""
+	Runs a read-only page context or API on the replica connection, unless
+	the user has written within the pin window (read-your-writes) or no
+	replica is configured. Apply below `@frappe.whitelist()`.
+	"""
+	replica_fn = frappe.read_only()(fn)
+
+	@functools.wraps(fn)
+	def wrapper(*args, **kwargs):
+		if use_replica():
+			return replica_fn(*args, **kwargs)
+		return fn(*args, **kwargs)
+
+	return wrapper
+
+def use_replica():
+	# Reads after a write in the same request (e.g. later calls of a batch) must see it
+	if not frappe.conf.read_from_replica or frappe.flags.agas_wrote:
+		return False
+	user = frappe.session.user
+	return user == "Guest" or not frappe.cache().get_value(PIN_KEY.format(user=user))
+
+def mark_written():
+	"""
+	Records that this request changed data members read back, so the rest of
+	the request and the user's next requests read from the primary.
+	"""
+	frappe.flags.agas_wrote = True
+
+def pin_to_primary(user=None):
+	user = user or frappe.session.user
+	if user and user != "Guest":
+		frappe.cache().set_value(PIN_KEY.format(user=user), 1,
+			expires_in_sec=cint(frappe.conf.get("agas_replica_pin_seconds")) or DEFAULT_PIN_SECONDS)
+
+def after_request(response, request):
+	# Only requests that wrote pin; read-only POSTs (e.g. a batch of reads) leave the user on the replica
+	if frappe.conf.read_from_replica and frappe.flags.agas_wrote:
+		pin_to_primary()
+
+def status():
+	"""
+	Shows which server the primary and replica connections reach and how far
+	the replica lags, to check a two-instance setup (e.g. a second local
+	MariaDB on port 3307 replicating from the first).
+
+	bench --site <site> execute agas.replica.status
+	"""
+	query = "select @@hostname as host, @@port as port, @@server_id as server_id, @@read_only as read_only"
+	result = {"primary": frappe.db.sql(query, as_dict=True)[0], "replica": None}
+
+	if frappe.conf.read_from_replica:
+		@frappe.read_only()
+		def replica_status():
+			server = frappe.db.sql(query, as_dict=True)[0]
+			replication = frappe.db.sql("show slave status", as_dict=True)
+			server.seconds_behind = replication[0].get("Seconds_Behind_Master") if replication else None
+			return server
+
+		result["replica"] = replica_status()
+
+	print(frappe.as_json(result, indent=1))
+	return result
@@ -0,0 +1,49 @@
+import frappe
+from frappe.utils import now_datetime, nowdate
+
+from agas import analytics, event_counters
+
+DRAFT_EXPIRY_REASON = "Draft expired without being submitted"
+
+def daily():
+	complete_past_registrations()
+	expire_stale_drafts()
+	frappe.db.commit()
+
+def complete_past_registrations():
+	"""
+	Moves Registered/Confirmed registrations of events that have ended to
+	Completed in one set-based UPDATE.
+	"""
+	conditions = "reg.status in ('Registered', 'Confirmed') and ev.event_end_date < %(today)s"
+	values = {"now": now_datetime(), "today": nowdate()}
+	event_counters.shift_status(conditions, values, "Completed")
+	analytics.shift_status(conditions, values, "Completed")
+	frappe.db.sql(f"""
+		update `tabEvent Registration` reg
+		inner join `tabAgas Event` ev on ev.name = reg.event
+		set reg.status = 'Completed', reg.modified = %(now)s, reg.modified_by = 'Administrator'
+		where {conditions}
+	""", values)
+
+def expire_stale_drafts():
+	"""
+	Cancels drafts whose event has ended. Drafts of upcoming events are kept
+	however long they sit, so nobody loses a registration they can still
+	finish.
+	"""
+	conditions = "reg.status = 'Draft' and ev.event_end_date < %(today)s"
+	values = {
+		"reason": DRAFT_EXPIRY_REASON,
+		"now": now_datetime(),
+		"today": nowdate(),
+	}
+	event_counters.shift_status(conditions, values, "Cancelled")
+	analytics.shift_status(conditions, values, "Cancelled")
+	frappe.db.sql(f"""
+		update `tabEvent Registration` reg
+		inner join `tabAgas Event` ev on ev.name = reg.event
+		set reg.status = 'Cancelled', reg.cancellation_reason = %(reason)s,
+			reg.modified = %(now)s, reg.modified_by = 'Administrator'
+		where {conditions}
+	""", values)
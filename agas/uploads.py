@@ -0,0 +1,183 @@
+import hashlib
+import os
+import re
+import time
+
+import frappe
+from frappe.utils import cint
+
+# Chunked, resumable uploads for member photos and ID proofs. The client sends
+# the file's SHA-256 first; content the same account already stored resolves to
+# the existing File without sending a byte, and an interrupted upload resumes
+# from the bytes the server already holds. Stored content is scoped to the
+# uploading account (which manages the whole family), so knowing a hash never
+# reveals or reuses another family's file.
+CHUNK_SIZE = 256 * 1024
+DEFAULT_MAX_SIZE = 10 * 1024 * 1024  # max_file_size (Frappe site config) overrides
+SESSION_KEY = "agas_upload|{upload_id}"
+SESSION_TTL = 86400  # seconds an unfinished upload can be resumed
+ALLOWED_EXTENSIONS = ("jpg", "jpeg", "png", "webp", "heic", "pdf")
+UPLOAD_FIELDS = ("photo", "id_proof")  # `<field>_upload` in save payloads carries a SHA-256
+
+@frappe.whitelist(methods=["POST"])
+def start_upload(filename, size, sha256):
+	"""
+	Starts or resumes an upload. Returns `file_url` straight away when the
+	content is already stored, otherwise the `upload_id` and the `offset` to
+	send the next chunk from.
+	"""
+	user = _require_login()
+	size = cint(size)
+	sha256 = (sha256 or "").lower()
+	if not re.fullmatch(r"[0-9a-f]{64}", sha256):
+		frappe.throw("Invalid file checksum", frappe.ValidationError)
+	if size <= 0 or size > max_size():
+		frappe.throw(f"File must be smaller than {max_size() // (1024 * 1024)} MB", frappe.ValidationError)
+	if filename.rsplit(".", 1)[-1].lower() not in ALLOWED_EXTENSIONS:
+		frappe.throw("Only images and PDF files can be uploaded", frappe.ValidationError)
+
+	file_url = stored_file_url(sha256, user)
+	if file_url:
+		return {"complete": True, "file_url": file_url}
+
+	# The same user sending the same content gets the same id, so a reload resumes
+	upload_id = hashlib.sha1(f"{user}|{sha256}|{size}".encode()).hexdigest()[:20]
+	frappe.cache().set_value(SESSION_KEY.format(upload_id=upload_id), {
+		"user": user,
+		"filename": os.path.basename(filename),
+		"size": size,
+		"sha256": sha256,
+	}, expires_in_sec=SESSION_TTL)
+
+	return {"complete": False, "upload_id": upload_id, "offset": _received(upload_id), "chunk_size": CHUNK_SIZE}
+
+@frappe.whitelist(methods=["POST"])
+def upload_chunk(upload_id, offset):
+	"""
+	Appends the multipart `chunk` at `offset`. A chunk for an offset other
+	than the bytes received so far is ignored and the current offset returned,
+	so a client retrying after a dropped response does not duplicate data.
+	The last chunk completes the upload and returns `file_url`.
+	"""
+	session = _get_session(upload_id)
+	chunk = frappe.request.files.get("chunk")
+	if not chunk:
+		frappe.throw("No file chunk received", frappe.ValidationError)
+
+	with frappe.cache().lock(frappe.cache().make_key(f"agas_upload_lock|{upload_id}"), timeout=60):
+		received = _received(upload_id)
+		if cint(offset) == received:
+			content = chunk.stream.read(CHUNK_SIZE + 1)
+			if len(content) > CHUNK_SIZE or received + len(content) > session["size"]:
+				frappe.throw("Chunk exceeds the declared file size", frappe.ValidationError)
+			with open(_part_path(upload_id), "ab") as part:
+				part.write(content)
+			received += len(content)
+
+		if received < session["size"]:
+			return {"complete": False, "upload_id": upload_id, "offset": received, "chunk_size": CHUNK_SIZE}
+		return {"complete": True, "file_url": finish_upload(upload_id, session)}
+
+def finish_upload(upload_id, session):
+	path = _part_path(upload_id)
+	with open(path, "rb") as part:
+		content = part.read()
+	os.remove(path)
+	frappe.cache().delete_value(SESSION_KEY.format(upload_id=upload_id))
+
+	if hashlib.sha256(content).hexdigest() != session["sha256"]:
+		frappe.throw("The uploaded file was corrupted in transit. Please try again.", frappe.ValidationError)
+
+	# Another tab or device of the same account may have finished the same content meanwhile
+	file_url = stored_file_url(session["sha256"], session["user"])
+	if file_url:
+		return file_url
+
+	file_doc = frappe.get_doc({
+		"doctype": "File",
+		"file_name": session["filename"],
+		"is_private": 0,
+		"content": content,
+	}).insert(ignore_permissions=True)
+	try:
+		frappe.get_doc({
+			"doctype": "Agas Upload",
+			"upload_key": upload_key(session["sha256"], session["user"]),
+			"user": session["user"],
+			"sha256": session["sha256"],
+			"file": file_doc.name,
+			"file_url": file_doc.file_url,
+			"file_size": len(content),
+		}).insert(ignore_permissions=True)
+	except frappe.DuplicateEntryError:
+		pass
+	return file_doc.file_url
+
+def upload_key(sha256, user):
+	return hashlib.sha256(f"{user}|{sha256}".encode()).hexdigest()
+
+def stored_file_url(sha256, user):
+	key = upload_key(sha256, user)
+	upload = frappe.db.get_value("Agas Upload", key, ["file", "file_url"], as_dict=True)
+	if not upload:
+		return None
+	if frappe.db.exists("File", upload.file):
+		return upload.file_url
+	# The File was deleted; forget it and take the content again
+	frappe.delete_doc("Agas Upload", key, ignore_permissions=True)
+	return None
+
+def resolve_uploads(data):
+	"""
+	Replaces `photo_upload` / `id_proof_upload` (the SHA-256 an upload was
+	started with) in a save payload with the URL of the file the current
+	user stored.
+	"""
+	for field in UPLOAD_FIELDS:
+		sha256 = data.pop(f"{field}_upload", None)
+		if not sha256:
+			continue
+		file_url = stored_file_url(sha256.lower(), frappe.session.user)
+		if not file_url:
+			frappe.throw(f"The {field.replace('_', ' ')} upload has not finished. Please upload it again.",
+				frappe.ValidationError)
+		data[field] = file_url
+	return data
+
+def remove_stale_parts():
+	"""
+	Deletes partial uploads nobody resumed within SESSION_TTL. Runs daily.
+	"""
+	folder = frappe.get_site_path("private", "agas_uploads")
+	if not os.path.isdir(folder):
+		return
+	cutoff = time.time() - SESSION_TTL
+	for name in os.listdir(folder):
+		path = os.path.join(folder, name)
+		if os.path.getmtime(path) < cutoff:
+			os.remove(path)
+
+def max_size():
+	return cint(frappe.conf.get("max_file_size")) or DEFAULT_MAX_SIZE
+
+def _require_login():
+	user = frappe.session.user
+	if user == "Guest":
+		frappe.throw("Please login to upload files", frappe.PermissionError)
+	return user
+
+def _get_session(upload_id):
+	user = _require_login()
+	session = frappe.cache().get_value(SESSION_KEY.format(upload_id=upload_id))
+	if not session or session["user"] != user:
+		frappe.throw("Upload expired. Please start again.", frappe.ValidationError)
+	return session
+
+def _part_path(upload_id):
+	folder = frappe.get_site_path("private", "agas_uploads")
+	os.makedirs(folder, exist_ok=True)
+	return os.path.join(folder, f"{upload_id}.part")
+
+def _received(upload_id):
+	path = _part_path(upload_id)
+	return os.path.getsize(path) if os.path.exists(path) else 0
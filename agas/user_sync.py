@@ -0,0 +1,62 @@
+import frappe
+
+# Member Profile field -> User field mirrored by the background sync
+USER_FIELDS = {
+	"first_name": "first_name",
+	"last_name": "last_name",
+	"gender": "gender",
+	"mobile_no": "mobile_no",
+	"date_of_birth": "birth_date",
+	"photo": "user_image",
+}
+PENDING_KEY = "agas_user_sync_pending|{user}"
+PENDING_TTL = 3600
+MAX_PASSES = 5  # a job re-reads the profile at most this many times while edits keep arriving
+
+def queue_user_sync(user):
+	"""
+	Schedules mirroring of the user's Member Profile onto their User record.
+	Saves in quick succession share one job: while a job for the user is
+	queued no other is added, and a running job repeats its pass if another
+	edit lands meanwhile.
+	"""
+	# A fresh token per edit tells a running job that it has to read the profile again
+	frappe.cache().set_value(PENDING_KEY.format(user=user), frappe.generate_hash(length=8),
+		expires_in_sec=PENDING_TTL)
+	frappe.enqueue(
+		"agas.user_sync.sync_user",
+		queue="short",
+		job_id=f"agas_user_sync::{user}",
+		deduplicate=True,
+		enqueue_after_commit=True,
+		user=user,
+	)
+
+def sync_user(user):
+	key = PENDING_KEY.format(user=user)
+	for _ in range(MAX_PASSES):
+		pending = frappe.cache().get_value(key)
+		mirror_profile(user)
+		frappe.db.commit()
+		if frappe.cache().get_value(key) == pending:
+			break
+
+def mirror_profile(user):
+	"""
+	Copies the mirrored fields that are set on the profile and differ on the
+	User, with a single User save (and its hooks) when anything changed.
+	"""
+	profile = frappe.db.get_value("Member Profile", {"user": user}, list(USER_FIELDS), as_dict=True)
+	if not profile or not frappe.db.exists("User", user):
+		return
+
+	user_doc = frappe.get_doc("User", user)
+	changed = False
+	for profile_field, user_field in USER_FIELDS.items():
+		value = profile.get(profile_field)
+		if value and user_doc.get(user_field) != value:
+			user_doc.set(user_field, value)
+			changed = True
+
+	if changed:
+		user_doc.save(ignore_permissions=True)
@@ -0,0 +1,117 @@
+import hashlib
+import hmac
+import math
+import time
+from datetime import datetime
+
+import frappe
+from frappe.utils import cint
+from frappe.utils.password import get_encryption_key
+
+# Admission control for registration rushes. Turned on per event by setting
+# Agas Event.waiting_room_rate (admissions per minute); 0 means no waiting room.
+ADMISSION_TTL = 20 * 60  # seconds an admitted user has to finish registering
+STALE_AFTER = 30  # queued users who stop polling for this long lose their place
+POLL_INTERVAL = 5  # seconds between polls of the waiting page
+QUEUE_TTL = 86400
+COOKIE_NAME = "agas_admission"
+HEADER_NAME = "X-Agas-Admission"
+
+@frappe.whitelist()
+def check_in_line(event):
+	"""
+	Joins the event's waiting room, or keeps the caller's place in it. Users
+	are admitted in arrival order, at most `waiting_room_rate` per minute;
+	admission sets a signed cookie valid for ADMISSION_TTL. Only Redis is
+	touched, so polling stays off the database.
+	"""
+	user = frappe.session.user
+	if user == "Guest":
+		frappe.throw("Please login to register for events", frappe.PermissionError)
+
+	rate = rate_per_minute(event)
+	if not rate or has_admission(event):
+		return {"admitted": True}
+
+	cache = frappe.cache()
+	queue, seen, admitted = _keys(event)
+	now = time.time()
+	pipe = cache.pipeline()
+	pipe.zadd(queue, {user: now}, nx=True)
+	pipe.zadd(seen, {user: now})
+	pipe.expire(queue, QUEUE_TTL)
+	pipe.expire(seen, QUEUE_TTL)
+	pipe.execute()
+
+	# People who closed the page should not hold up the line
+	stale = cache.zrangebyscore(seen, 0, now - STALE_AFTER)
+	if stale:
+		cache.zrem(queue, *stale)
+		cache.zrem(seen, *stale)
+
+	position = cache.zrank(queue, user) or 0
+	free = rate - int(cache.get(admitted) or 0)
+	if position < free and cache.incr(admitted) <= rate:
+		cache.expire(admitted, 120)
+		cache.zrem(queue, user)
+		cache.zrem(seen, user)
+		admit(event, user)
+		return {"admitted": True}
+
+	return {
+		"admitted": False,
+		"position": position + 1,
+		"wait_minutes": math.ceil((position + 1 - max(free, 0)) / rate),
+		"poll_interval": POLL_INTERVAL,
+	}
+
+def rate_per_minute(event):
+	if not event:
+		return 0
+	try:
+		return cint(frappe.get_cached_value("Agas Event", event, "waiting_room_rate"))
+	except frappe.DoesNotExistError:
+		return 0
+
+def admit(event, user):
+	expires = int(time.time()) + ADMISSION_TTL
+	frappe.local.cookie_manager.set_cookie(COOKIE_NAME, make_token(event, user, expires),
+		expires=datetime.fromtimestamp(expires), httponly=True, samesite="Lax")
+
+def make_token(event, user, expires):
+	return f"{expires}.{_signature(event, user, expires)}"
+
+def has_admission(event, token=None):
+	token = token or _request_token()
+	expires, _, signature = token.partition(".")
+	if not expires.isdigit() or int(expires) < time.time():
+		return False
+	return hmac.compare_digest(signature, _signature(event, frappe.session.user, int(expires)))
+
+def require_admission(event):
+	"""
+	Raises unless the event has no waiting room or the user has been admitted.
+	"""
+	if rate_per_minute(event) and not has_admission(event):
+		frappe.throw("Registration for this event is busy. Please join the waiting room and try again.",
+			frappe.RateLimitExceededError)
+
+def _signature(event, user, expires):
+	message = f"{event}|{user}|{expires}".encode()
+	return hmac.new(get_encryption_key().encode(), message, hashlib.sha256).hexdigest()
+
+def _request_token():
+	request = getattr(frappe.local, "request", None)
+	if not request:
+		return ""
+	return request.headers.get(HEADER_NAME) or request.cookies.get(COOKIE_NAME) or ""
+
+def _keys(event):
+	cache = frappe.cache()
+	base = f"agas_waiting_room|{event}"
+	return (
+		cache.make_key(f"{base}|queue"),
+		cache.make_key(f"{base}|seen"),
+		# Admissions are counted per clock minute
+		cache.make_key(f"{base}|admitted|{int(time.time() // 60)}"),
+	)
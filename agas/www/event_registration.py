@@ -1,17 +1,52 @@
+from urllib.parse import urlencode
+
 import frappe
 
-def get_context(context):
+from agas import meal_plan, waiting_room
+from agas.replica import read_from_replica
+
+def get_context(context, waiting_room_page="/waiting_room"):
 	if frappe.session.user == "Guest":
 		frappe.local.flags.redirect_location = "/auth"
 		raise frappe.Redirect
+
+	# During a rush only admitted users get past this point
+	selected_event = frappe.form_dict.get("event")
+	if waiting_room.rate_per_minute(selected_event) and not waiting_room.has_admission(selected_event):
+		frappe.local.flags.redirect_location = f"{waiting_room_page}?{urlencode({'event': selected_event})}"
+		raise frappe.Redirect
 	
 	context.no_cache = 1
+	today = frappe.utils.getdate()
+	_load_page_data(context, selected_event, today)
+	# The registration comes from the primary: its `modified` is the version the page's saves
+	# are checked against, and a lagging replica would make the first save look outdated
+	_load_registration(context, selected_event)
+
+	# Read-only logic: agas.tasks.daily moves registrations of ended events to Completed
+	is_read_only = False
+	if frappe.form_dict.get("view") == "1":
+		is_read_only = True
+
+	if context.registration_data.get("status") == "Completed":
+		is_read_only = True
+	else:
+		# Not completed yet (e.g. the job has not run since the event ended): the event
+		# dates were already loaded above, so no extra lookup is needed
+		event_end_date = context.current_event_dates.get("event_end_date")
+		if event_end_date and frappe.utils.getdate(event_end_date) < today:
+			is_read_only = True
+
+	context.is_read_only = is_read_only
+	context.csrf_token = frappe.session.csrf_token
+
+@read_from_replica
+def _load_page_data(context, selected_event, today):
 	# Pre-fill data
 	profile = frappe.db.get_value("Member Profile", {"user": frappe.session.user}, "*", as_dict=True) or {}
 	context.member_data = profile
 	
 	# Fetch upcoming published events for the dropdown
-	today = frappe.utils.getdate()
 	context.events = frappe.get_all("Agas Event", 
 		filters={
 			"published": 1,
@@ -22,7 +57,6 @@ def get_context(context):
 	)
 
 	# Check for URL parameter ?event=XYZ
-	selected_event = frappe.form_dict.get("event")
 	context.selected_event = selected_event
 
 	# Find selected event details to pass for defaults
@@ -32,10 +66,23 @@ def get_context(context):
 		if ev_dates:
 			context.current_event_dates = ev_dates
 
+	# Fetch Family Members
+	if profile.get("name"):
+		context.family_members = frappe.get_all("Family Member",
+			filters={"primary_member": profile.name},
+			fields=["*"],
+			order_by="sr_no asc"
+		)
+	else:
+		context.family_members = []
+
+def _load_registration(context, selected_event):
 	# Fetch existing registration if exists
 	context.registration_data = {}
+	# Name and version the page's saves are checked against (see agas.api.register_for_event)
+	context.registration_version = None
 	context.family_visit_dates = {}
-	if selected_event and profile.get("name"):
+	if selected_event and context.member_data.get("name"):
 		reg = frappe.get_all("Event Registration",
 			filters={"user": frappe.session.user, "event": selected_event},
 			fields=["*"],
@@ -49,17 +96,8 @@ def get_context(context):
 				fields=["*"],
 				order_by="creation asc"
 			)
-			# Fetch food schedule
-			food_schedule = frappe.get_all("Event Food Day",
-				filters={"parent": reg.name},
-				fields=["date", "member_ref", "member_name", "breakfast", "lunch", "dinner"],
-				order_by="date asc"
-			)
-			# Convert dates to strings for JSON serialization in template
-			for day in food_schedule:
-				if day.get("date"):
-					day["date"] = str(day["date"])
-			reg["food_schedule"] = food_schedule
+			# The meal bitmap is shipped as is and expanded in the browser
+			reg["meal_plan"] = meal_plan.load(reg.get("meal_plan"))
 
 			# Build family visit date mapping
 			family_visit_dates = {}
@@ -72,26 +110,4 @@ def get_context(context):
 					}
 			context.family_visit_dates = family_visit_dates
 			context.registration_data = reg
-
-	# Fetch Family Members
-	if profile.get("name"):
-		context.family_members = frappe.get_all("Family Member",
-			filters={"primary_member": profile.name},
-			fields=["*"],
-			order_by="sr_no asc"
-		)
-	else:
-		context.family_members = []
-
-	# Read-only logic
-	is_read_only = False
-	if frappe.form_dict.get("view") == "1":
-		is_read_only = True
-	
-	if selected_event:
-		event_end_date = frappe.db.get_value("Agas Event", selected_event, "event_end_date")
-		if event_end_date and frappe.utils.getdate(event_end_date) < frappe.utils.getdate():
-			is_read_only = True
-			
-	context.is_read_only = is_read_only
-	context.csrf_token = frappe.session.csrf_token
+			context.registration_version = {"name": reg.name, "modified": str(reg.modified)}
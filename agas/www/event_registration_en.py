@@ -2,4 +2,4 @@ from .event_registration import get_context as base_get_context
 
 
 def get_context(context):
-	return base_get_context(context)
+	return base_get_context(context, waiting_room_page="/waiting_room_en")
@@ -1,18 +1,18 @@
 import frappe
-from frappe.utils import nowdate
+from frappe.utils import getdate
 
+from agas.event_counters import get_event_listing
+from agas.replica import read_from_replica
+
+@read_from_replica
 def get_context(context):
 	context.no_cache = 1
-	# Fetch upcoming events
-	context.upcoming_events = frappe.get_all("Agas Event", 
-		filters={"published": 1, "event_start_date": [">=", nowdate()]},
-		fields=["title", "subtitle", "event_start_date", "event_end_date", "venue", "image", "description"],
-		order_by="event_start_date asc"
-	)
-	
-	# Fetch past events
-	context.past_events = frappe.get_all("Agas Event", 
-		filters={"published": 1, "event_start_date": ["<", nowdate()]},
-		fields=["title", "subtitle", "event_start_date", "event_end_date", "venue", "image", "description"],
-		order_by="event_start_date desc"
-	)
+	# Published events with their registration counters, from the cached listing
+	today = getdate()
+	events = get_event_listing()
+
+	# Upcoming events
+	context.upcoming_events = [ev for ev in events if getdate(ev.event_start_date) >= today]
+
+	# Past events
+	context.past_events = [ev for ev in reversed(events) if getdate(ev.event_start_date) < today]
@@ -1,7 +1,10 @@
 import frappe
 
+from agas import archive, pincodes
+from agas.replica import read_from_replica
+
+@read_from_replica
 def get_context(context):
-	print("DEBUG: member_profile.py get_context called")
 	if frappe.session.user == "Guest":
 		frappe.local.flags.redirect_location = "/auth"
 		raise frappe.Redirect
@@ -38,30 +41,38 @@ def get_context(context):
 		context.family_members = []
 
 	context.csrf_token = frappe.session.csrf_token
+	# Part of the pincode lookup URL so browsers can cache answers until the dataset changes
+	context.pincode_dataset_version = pincodes.dataset_version()
 
-	# Fetch event registrations
-	registrations = frappe.get_all("Event Registration",
-		filters={"user": frappe.session.user},
-		fields=["name", "event", "status", "no_of_visitors", "check_in_date", "creation", "cancellation_reason"]
+	# Fetch event registrations; long-past ones are archived and only read on request
+	context.include_archived = frappe.utils.cint(frappe.form_dict.get("include_archived"))
+	registrations = archive.get_registrations(frappe.session.user,
+		["name", "event", "status", "no_of_visitors", "check_in_date", "creation", "cancellation_reason"],
+		include_archived=context.include_archived
 	)
 
+	# One lookup for all event dates (used for display and ordering only)
+	event_dates = {ev.name: ev for ev in frappe.get_all("Agas Event",
+		filters={"name": ["in", list({reg.event for reg in registrations}) or [""]]},
+		fields=["name", "event_start_date", "event_end_date"]
+	)}
+
 	upcoming_events = []
 	past_events = []
 	today = frappe.utils.getdate()
 
 	for reg in registrations:
-		# Fetch event dates from Agas Event
-		event_dates = frappe.db.get_value("Agas Event", reg.event, ["event_start_date", "event_end_date"], as_dict=True)
-		if not event_dates:
+		event = event_dates.get(reg.event)
+		if not event:
 			continue
-			
-		reg.event_date = event_dates.event_start_date
-		end_date = event_dates.event_end_date
-		
-		if end_date and frappe.utils.getdate(end_date) >= today:
-			upcoming_events.append(reg)
-		else:
+
+		reg.event_date = event.event_start_date
+		# The end date decides, since agas.tasks.daily only completes ended events overnight
+		ended = event.event_end_date and frappe.utils.getdate(event.event_end_date) < today
+		if reg.status == "Completed" or reg.get("archived") or ended:
 			past_events.append(reg)
+		else:
+			upcoming_events.append(reg)
 
 	# Sort by date
 	context.upcoming_events = sorted(upcoming_events, key=lambda x: str(x.event_date or ""), reverse=False)
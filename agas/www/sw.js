@@ -1,56 +1,317 @@
-const CACHE_NAME = 'agas-ashram-v1';
-const ASSETS_TO_CACHE = [
-    '/',
-    '/index',
-    '/agas_home',
-    '/auth',
-    '/member_profile',
-    '/event_registration',
-    '/assets/agas/icons/pwa-icon.png',
-    'https://fonts.googleapis.com/css2?family=Outfit:wght@300;400;500;600;700&display=swap',
-    'https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700;800&family=Outfit:wght@400;600;800&display=swap'
-];
+const CACHE_VERSION = '{{ cache_version }}';
+const SHELL_CACHE = `agas-shell-${CACHE_VERSION}`;
+const RUNTIME_CACHE = `agas-runtime-${CACHE_VERSION}`;
+const PRECACHE_URLS = {{ precache_urls }};
+const SESSION_PAGES = {{ session_pages }};
+const STALE_WHILE_REVALIDATE_PAGES = ['/events', '/events_en'];
+const MAX_RUNTIME_ENTRIES = 60;
+
+// Failed agas.api and agas.batch.run_batch POSTs that carry an Idempotency-Key are queued here and replayed later.
+// The key makes the replay safe: the server returns the original result if the first attempt
+// actually got through.
+const QUEUE_DB = 'agas-sw';
+const QUEUE_STORE = 'api-queue';
+const QUEUE_SYNC_TAG = 'agas-api-retry';
+// Queued saves the server refused for good, kept until a page that can show them is open
+const DROPPED_STORE = 'api-dropped';
+const DROP_REPORT_PAGES = ['/member_profile', '/event_registration'];
+const RETRY_BASE_MS = 30 * 1000;
+const RETRY_MAX_MS = 60 * 60 * 1000;
 
 // Install Event
 self.addEventListener('install', event => {
     event.waitUntil(
-        caches.open(CACHE_NAME).then(cache => {
-            console.log('Pre-caching assets');
-            return cache.addAll(ASSETS_TO_CACHE);
-        })
+        caches.open(SHELL_CACHE)
+            .then(cache => cache.addAll(PRECACHE_URLS))
+            .then(() => self.skipWaiting())
     );
 });
 
 // Activate Event
 self.addEventListener('activate', event => {
     event.waitUntil(
-        caches.keys().then(keys => {
-            return Promise.all(keys
-                .filter(key => key !== CACHE_NAME)
+        caches.keys()
+            .then(keys => Promise.all(keys
+                .filter(key => key !== SHELL_CACHE && key !== RUNTIME_CACHE)
                 .map(key => caches.delete(key))
-            );
-        })
+            ))
+            .then(() => self.clients.claim())
+            .then(() => replayQueue())
     );
 });
 
 // Fetch Event
 self.addEventListener('fetch', event => {
-    // Only cache GET requests
-    if (event.request.method !== 'GET') return;
-
-    event.respondWith(
-        fetch(event.request)
-            .then(res => {
-                // Clone response to put in cache
-                const resClone = res.clone();
-                caches.open(CACHE_NAME).then(cache => {
-                    cache.put(event.request, resClone);
-                });
-                return res;
-            })
-            .catch(() => {
-                // Fallback to cache if network fails
-                return caches.match(event.request);
-            })
-    );
+    const request = event.request;
+    const url = new URL(request.url);
+
+    // Saves, alone or batched, go through the offline retry queue
+    if (request.method === 'POST' && request.headers.has('Idempotency-Key')
+        && (url.pathname.startsWith('/api/method/agas.api.') || url.pathname === '/api/method/agas.batch.run_batch')) {
+        event.respondWith(postWithQueue(request));
+        return;
+    }
+
+    if (request.method !== 'GET') return;
+
+    if (url.origin !== self.location.origin) {
+        // Google Fonts and other CDNs
+        event.respondWith(cacheFirst(request, RUNTIME_CACHE));
+        return;
+    }
+
+    // Never cache API reads, logins or the worker itself
+    if (url.pathname.startsWith('/api/') || url.pathname === '/sw.js') return;
+
+    if (url.pathname.startsWith('/assets/') || url.pathname.startsWith('/files/')) {
+        event.respondWith(cacheFirst(request, url.pathname.startsWith('/assets/') ? SHELL_CACHE : RUNTIME_CACHE));
+        return;
+    }
+
+    if (request.mode === 'navigate') {
+        if (SESSION_PAGES.includes(url.pathname) && !url.search) {
+            event.respondWith(sessionPage(event, request));
+        } else if (PRECACHE_URLS.includes(url.pathname)) {
+            event.respondWith(networkFirst(request));
+        }
+        // Logged-in pages go straight to the network
+    }
+});
+
+self.addEventListener('sync', event => {
+    if (event.tag === QUEUE_SYNC_TAG) event.waitUntil(replayQueue());
+});
+
+// Pages ask for a replay when they load, which also delivers any drop reports
+self.addEventListener('message', event => {
+    if (event.data && event.data.type === 'agas-replay') event.waitUntil(replayQueue());
 });
+
+async function cacheFirst(request, cacheName) {
+    const cached = await caches.match(request);
+    if (cached) return cached;
+
+    const response = await fetch(request);
+    if (response.ok || response.type === 'opaque') {
+        const cache = await caches.open(cacheName);
+        await cache.put(request, response.clone());
+        if (cacheName === RUNTIME_CACHE) trimCache(cache);
+    }
+    return response;
+}
+
+// Pages showing the login state are cached under their URL plus the session, read from
+// Frappe's user_id cookie, so a login or logout never brings back the other state's page
+async function sessionPage(event, request) {
+    if (!self.cookieStore) return fetch(request);
+
+    const cookie = await self.cookieStore.get('user_id');
+    const key = new URL(request.url);
+    key.search = `agas_session=${encodeURIComponent(cookie ? cookie.value : 'Guest')}`;
+
+    if (STALE_WHILE_REVALIDATE_PAGES.includes(key.pathname)) {
+        return staleWhileRevalidate(event, request, key.toString());
+    }
+    return networkFirst(request, key.toString());
+}
+
+async function networkFirst(request, key = null) {
+    try {
+        const response = await fetch(request);
+        if (response.ok) {
+            const cache = await caches.open(SHELL_CACHE);
+            cache.put(key || request, response.clone());
+        }
+        return response;
+    } catch (err) {
+        const cached = await caches.match(key || request, { ignoreSearch: !key });
+        if (cached) return cached;
+        throw err;
+    }
+}
+
+async function staleWhileRevalidate(event, request, key) {
+    const cache = await caches.open(SHELL_CACHE);
+    const cached = await cache.match(key);
+    const refresh = fetch(request)
+        .then(response => {
+            if (response.ok) cache.put(key, response.clone());
+            return response;
+        });
+
+    if (cached) {
+        event.waitUntil(refresh.catch(() => null));
+        return cached;
+    }
+    return refresh;
+}
+
+async function trimCache(cache) {
+    const keys = await cache.keys();
+    for (let i = 0; i < keys.length - MAX_RUNTIME_ENTRIES; i++) {
+        await cache.delete(keys[i]);
+    }
+}
+
+async function postWithQueue(request) {
+    const body = await request.clone().text();
+    try {
+        const response = await fetch(request);
+        replayQueue();
+        return response;
+    } catch (err) {
+        const headers = {};
+        request.headers.forEach((value, key) => headers[key] = value);
+        await addToStore(QUEUE_STORE, { url: request.url, headers, body, queuedAt: Date.now(), attempts: 0 });
+        if (self.registration.sync) {
+            self.registration.sync.register(QUEUE_SYNC_TAG).catch(() => null);
+        }
+        // No `message`: pages treat that as success. They check `queued` and say so themselves.
+        return new Response(JSON.stringify({ queued: true }),
+            { status: 202, headers: { 'Content-Type': 'application/json' } });
+    }
+}
+
+function openQueue() {
+    return new Promise((resolve, reject) => {
+        const open = indexedDB.open(QUEUE_DB, 2);
+        open.onupgradeneeded = () => {
+            for (const store of [QUEUE_STORE, DROPPED_STORE]) {
+                if (!open.result.objectStoreNames.contains(store)) {
+                    open.result.createObjectStore(store, { autoIncrement: true });
+                }
+            }
+        };
+        open.onsuccess = () => resolve(open.result);
+        open.onerror = () => reject(open.error);
+    });
+}
+
+// `id` replaces the entry stored under that key; without it a new entry is added
+async function addToStore(store, entry, id = undefined) {
+    const db = await openQueue();
+    return new Promise((resolve, reject) => {
+        const tx = db.transaction(store, 'readwrite');
+        tx.objectStore(store).put(entry, id);
+        tx.oncomplete = () => resolve();
+        tx.onerror = () => reject(tx.error);
+    });
+}
+
+async function readStore(store) {
+    const db = await openQueue();
+    return new Promise((resolve, reject) => {
+        const entries = [];
+        const tx = db.transaction(store, 'readonly');
+        tx.objectStore(store).openCursor().onsuccess = e => {
+            const cursor = e.target.result;
+            if (!cursor) return;
+            entries.push({ id: cursor.key, ...cursor.value });
+            cursor.continue();
+        };
+        tx.oncomplete = () => resolve(entries);
+        tx.onerror = () => reject(tx.error);
+    });
+}
+
+async function removeFromStore(store, id) {
+    const db = await openQueue();
+    return new Promise((resolve, reject) => {
+        const tx = db.transaction(store, 'readwrite');
+        tx.objectStore(store).delete(id);
+        tx.oncomplete = () => resolve();
+        tx.onerror = () => reject(tx.error);
+    });
+}
+
+// 409 (the same request is still running), 408, 429 (rate limit or waiting room), a redirect
+// (e.g. to the waiting room) and 5xx can succeed later. Any other 4xx is a validation or
+// permission error that sending the same request again cannot fix.
+function isRetriable(response) {
+    return response.type === 'opaqueredirect' || response.status === 0 || response.status === 408
+        || response.status === 409 || response.status === 429 || response.status >= 500;
+}
+
+function serverMessages(data) {
+    try {
+        return JSON.parse(data._server_messages).map(message => JSON.parse(message).message);
+    } catch (err) {
+        return [];
+    }
+}
+
+// What went wrong with a final response: the error of a refused request, or the failed
+// calls of a batch (which answers 200 and reports each call on its own)
+async function responseErrors(response) {
+    let data = null;
+    try {
+        data = await response.json();
+    } catch (err) {
+        // Not JSON
+    }
+    if (!response.ok) {
+        const messages = data ? serverMessages(data) : [];
+        return messages.length ? messages : [`${response.status} ${response.statusText}`.trim()];
+    }
+    if (data && Array.isArray(data.message)) {
+        return data.message
+            .filter(result => result && result.exc_type)
+            .flatMap(result => serverMessages(result).length ? serverMessages(result) : [result.exc_type]);
+    }
+    return [];
+}
+
+async function reportDropped() {
+    const dropped = await readStore(DROPPED_STORE);
+    if (!dropped.length) return;
+    const pages = (await self.clients.matchAll({ type: 'window' }))
+        .filter(client => DROP_REPORT_PAGES.some(path => new URL(client.url).pathname.startsWith(path)));
+    if (!pages.length) return;
+
+    for (const entry of dropped) {
+        pages.forEach(page => page.postMessage({ type: 'agas-queue-dropped', url: entry.url, errors: entry.errors }));
+        await removeFromStore(DROPPED_STORE, entry.id);
+    }
+}
+
+let replaying = null;
+
+function replayQueue() {
+    // Serialize replays so that the same entry is never sent twice concurrently
+    if (!replaying) {
+        replaying = (async () => {
+            for (const { id, ...entry } of await readStore(QUEUE_STORE)) {
+                if (entry.nextAttemptAt && entry.nextAttemptAt > Date.now()) continue;
+
+                let response;
+                try {
+                    response = await fetch(entry.url, {
+                        method: 'POST',
+                        headers: entry.headers,
+                        body: entry.body,
+                        credentials: 'include',
+                        redirect: 'manual'
+                    });
+                } catch (err) {
+                    // Still offline: keep the rest for the next attempt
+                    break;
+                }
+
+                if (isRetriable(response)) {
+                    const attempts = (entry.attempts || 0) + 1;
+                    const backoff = Math.min(RETRY_BASE_MS * 2 ** (attempts - 1), RETRY_MAX_MS);
+                    await addToStore(QUEUE_STORE, { ...entry, attempts, nextAttemptAt: Date.now() + backoff }, id);
+                    continue;
+                }
+
+                await removeFromStore(QUEUE_STORE, id);
+                const errors = await responseErrors(response);
+                if (errors.length) {
+                    await addToStore(DROPPED_STORE, { url: entry.url, errors, droppedAt: Date.now() });
+                }
+            }
+            await reportDropped();
+        })().finally(() => replaying = null);
+    }
+    return replaying;
+}
@@ -0,0 +1,43 @@
+import hashlib
+import json
+import os
+
+import frappe
+
+# Guest pages precached as the offline shell. Logged-in pages are left out on purpose:
+# they carry personal data and a per-session CSRF token.
+SHELL_PAGES = ["/auth", "/auth_en"]
+# Public pages whose navbar shows the login state. They are cached on visit, separately
+# for each session, and only where the worker can read the session (Cookie Store API).
+SESSION_PAGES = [
+	"/", "/index_en", "/events", "/events_en", "/about", "/about_en",
+	"/contact", "/contact_en", "/gallery", "/gallery_en",
+]
+# Small static assets fetched on install; images are cached on first use instead
+PRECACHE_FOLDERS = ("css", "js", "icons")
+
+def get_context(context):
+	context.no_cache = 1
+	public_path = frappe.get_app_path("agas", "public")
+	www_path = frappe.get_app_path("agas", "www")
+
+	assets = []
+	for folder in PRECACHE_FOLDERS:
+		for root, _dirs, files in os.walk(os.path.join(public_path, folder)):
+			for filename in sorted(files):
+				relative = os.path.relpath(os.path.join(root, filename), public_path)
+				assets.append(f"/assets/agas/{relative.replace(os.sep, '/')}")
+
+	# The cache name changes whenever a precached asset, a page template or this worker changes,
+	# which makes the browser install the new worker and drop the old cache
+	digest = hashlib.sha1()
+	for path in sorted(
+		[os.path.join(public_path, url[len("/assets/agas/"):]) for url in assets]
+		+ [os.path.join(www_path, f) for f in os.listdir(www_path) if f.endswith((".html", ".js"))]
+	):
+		stat = os.stat(path)
+		digest.update(f"{path}:{stat.st_mtime_ns}:{stat.st_size}".encode())
+
+	context.cache_version = digest.hexdigest()[:12]
+	context.precache_urls = json.dumps(SHELL_PAGES + assets)
+	context.session_pages = json.dumps(SESSION_PAGES)
@@ -0,0 +1,21 @@
+from urllib.parse import urlencode
+
+import frappe
+
+from agas import waiting_room
+
+def get_context(context, registration_page="/event_registration"):
+	if frappe.session.user == "Guest":
+		frappe.local.flags.redirect_location = "/auth"
+		raise frappe.Redirect
+
+	context.no_cache = 1
+	event = frappe.form_dict.get("event")
+	context.event = event
+	context.registration_url = f"{registration_page}?{urlencode({'event': event or ''})}"
+	context.poll_interval = waiting_room.POLL_INTERVAL
+
+	# Nothing to wait for: no rush on this event, or already admitted
+	if not waiting_room.rate_per_minute(event) or waiting_room.has_admission(event):
+		frappe.local.flags.redirect_location = context.registration_url
+		raise frappe.Redirect
@@ -0,0 +1,5 @@
+from .waiting_room import get_context as base_get_context
+
+
+def get_context(context):
+	return base_get_context(context, registration_page="/event_registration_en")